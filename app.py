@@ -1,51 +1,273 @@
-from flask import Flask, request, jsonify, render_template_string, send_file, make_response
+import time
+_STARTUP_T0 = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify, render_template_string, send_file, make_response, g, has_request_context, url_for, stream_with_context, redirect
+from flask.json.provider import DefaultJSONProvider
+from flask.templating import Environment as FlaskEnvironment
+from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from sqlalchemy import func, text, event, Date
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import with_loader_criteria
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import FunctionElement
+import click
 import json
 import datetime
 import os
 import io
+import re
+import hashlib
+import logging
+import sys
+import zlib
+import gzip
+import secrets
+import threading
+import functools
+import shutil
+import sqlite3
+import random
+import calendar
+import unicodedata
+from array import array
+from collections import deque, OrderedDict
 from pathlib import Path
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
+from urllib.parse import urlencode
+# openpyxlはExcelエクスポート時のみ必要なため create_excel_export 内で遅延インポートする
+
+# 起動プロファイル（STARTUP_PROFILE=1 でインポート・初期化時間を計測）
+STARTUP_PROFILE = os.environ.get('STARTUP_PROFILE') == '1'
+startup_timings = {}
+
+def mark_startup(step):
+    """起動開始からの経過時間(ms)を記録"""
+    startup_timings[step] = round((time.perf_counter() - _STARTUP_T0) * 1000, 2)
+
+mark_startup("imports")
 
-app = Flask(__name__)
+# 静的ファイルは static_asset でハッシュ付きURL・長期キャッシュで配信する
+app = Flask(__name__, static_folder=None)
+
+class CachedStringEnvironment(FlaskEnvironment):
+    """render_template_string のコンパイル結果をソース文字列ごとに再利用するJinja環境
+
+    各ページのHTMLは定数文字列のため、2回目以降はコンパイルせずに描画できる。
+    """
+    max_string_templates = 256
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.string_templates = {}
+    
+    def from_string(self, source, globals=None, template_class=None):
+        if globals or template_class is not None or not isinstance(source, str):
+            return super().from_string(source, globals, template_class)
+        template = self.string_templates.get(source)
+        if template is None:
+            template = super().from_string(source)
+            if len(self.string_templates) < self.max_string_templates:
+                self.string_templates[source] = template
+        return template
+
+# jinja_env の生成前に差し替える
+app.jinja_environment = CachedStringEnvironment
+
+# 高速JSONエンコーダ（JSON_ENCODER=orjson かつ orjson がインストール済みの場合のみ有効）
+orjson = None
+if os.environ.get('JSON_ENCODER') == 'orjson':
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    """orjsonでエンコードするJSONプロバイダ（未対応の引数は標準実装にフォールバック）"""
+    def dumps(self, obj, **kwargs):
+        kwargs.pop('separators', None)
+        indent = kwargs.pop('indent', None)
+        if kwargs or indent not in (None, 2):
+            return super().dumps(obj, indent=indent, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+if orjson is not None:
+    app.json = FastJSONProvider(app)
+
+def normalize_database_url(url):
+    """postgres:// を SQLAlchemy が扱える postgresql:// に変換"""
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
 
 # PostgreSQL設定
-DATABASE_URL = os.environ.get('DATABASE_URL')
-if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+DATABASE_URL = normalize_database_url(os.environ.get('DATABASE_URL'))
+
+# DATABASE_URL 未指定時は組み込みのSQLite（単一ノード・ローカル開発向け）
+EMBEDDED_DATABASE_URL = f"sqlite:///{Path('data').resolve() / 'workout_logs.db'}"
 
-app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL or 'postgresql://localhost:5432/workout_logs'
+app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL or EMBEDDED_DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
+# リードレプリカ（DATABASE_READ_URL にカンマ区切りで複数指定可）
+DATABASE_READ_URLS = [
+    normalize_database_url(url.strip())
+    for url in os.environ.get('DATABASE_READ_URL', '').split(',') if url.strip()
+]
+REPLICA_BIND_KEYS = tuple(f'replica_{i}' for i in range(len(DATABASE_READ_URLS)))
+if DATABASE_READ_URLS:
+    app.config['SQLALCHEMY_BINDS'] = dict(zip(REPLICA_BIND_KEYS, DATABASE_READ_URLS))
+# 書き込み直後はこの秒数だけ読み取りもプライマリへ送る（read-your-writes）
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+# リクエストボディの上限（超過時は413）
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 2 * 1024 * 1024))
+
+# /api/receive の設定
+RECEIVE_ECHO = os.environ.get('RECEIVE_ECHO', '1') == '1'  # レスポンスに受信データを含めるか
+PAYLOAD_PREVIEW_CHARS = int(os.environ.get('PAYLOAD_PREVIEW_CHARS', 500))  # ログに残すプレビューの文字数
+NDJSON_PREVIEW_RECORDS = 3  # NDJSONで保存する先頭レコード数
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+# OpenAPIスキーマによるリクエスト検証（enforce: 400を返す / warn: ログのみ / off: 無効）
+SCHEMA_VALIDATION = os.environ.get('SCHEMA_VALIDATION', 'enforce')
+SCHEMA_DIR = Path(__file__).resolve().parent
+
+# 構造化ログ（標準出力にJSON1行 + /logs 用のメモリ上リングバッファ）
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_BUFFER_SIZE = int(os.environ.get('LOG_BUFFER_SIZE', 200))  # テナントごとに保持する件数
+LOG_MAX_STRING = int(os.environ.get('LOG_MAX_STRING', 500))  # これより長い文字列は切り詰める
+LOG_MAX_ITEMS = int(os.environ.get('LOG_MAX_ITEMS', 20))  # リスト・dictの最大要素数
+LOG_MAX_DEPTH = 4
+LOG_REDACTED_KEYS = re.compile(r'api[_-]?key|authorization|password|secret|token|cookie', re.IGNORECASE)
+
+# イベント配信（SSE）
+EVENT_BUFFER_SIZE = int(os.environ.get('EVENT_BUFFER_SIZE', 100))  # 購読者ごとの未送信イベント上限（超過分は古い順に破棄）
+EVENT_HISTORY_SIZE = 100  # 再接続時（Last-Event-ID）に再送するテナントごとの直近イベント数
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get('EVENT_HEARTBEAT_SECONDS', 15))
+EVENT_STREAM_MAX_SECONDS = float(os.environ.get('EVENT_STREAM_MAX_SECONDS', 300))  # 1接続の最長時間（以降はクライアントが再接続）
+EVENT_MAX_SUBSCRIBERS = int(os.environ.get('EVENT_MAX_SUBSCRIBERS', 20))  # ワーカーごとの同時接続数上限
+
+@event.listens_for(Engine, "connect")
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """SQLite接続の設定（WALで読み取りと書き込みを並行させ、外部キーはPostgreSQLと同様に検査）"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+class week_start(FunctionElement):
+    """日付を週の開始日（月曜）に丸める。DBごとの関数にコンパイルされる"""
+    type = Date()
+    inherit_cache = True
+
+@compiles(week_start)
+def compile_week_start(element, compiler, **kw):
+    return f"CAST(date_trunc('week', {compiler.process(element.clauses, **kw)}) AS DATE)"
+
+@compiles(week_start, 'sqlite')
+def compile_week_start_sqlite(element, compiler, **kw):
+    # 次の日曜（日曜ならその日）から6日戻すと月曜になる
+    return f"date({compiler.process(element.clauses, **kw)}, 'weekday 0', '-6 days')"
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """読み取り専用ルートのクエリをリードレプリカに送るセッション"""
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context():
+            replica_bind = g.get('replica_bind')
+            if replica_bind is not None:
+                return self._db.engines[replica_bind]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+mark_startup("db_init")
 
 # データ保存用ディレクトリ（ログ用）
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
 
-LOGS_FILE = DATA_DIR / "logs.json"
-RECEIVED_DATA_FILE = DATA_DIR / "received_data.json"
-CONVERSATIONS_FILE = DATA_DIR / "conversations.json"
+# 受信データ・会話データは1行1件のJSON Lines（追記のみ。古い行は保持件数の2倍に達したら切り詰める）
+RECEIVED_DATA_FILE = DATA_DIR / "received_data.jsonl"
+CONVERSATIONS_FILE = DATA_DIR / "conversations.jsonl"
+DATA_FILE_MAX_ENTRIES = 100  # 表示・保持する最新の件数
+
+# マルチテナント設定（APIキーなしのリクエストは default テナントとして扱う）
+DEFAULT_TENANT_ID = 'default'
+REQUIRE_API_KEY = os.environ.get('REQUIRE_API_KEY') == '1'
+TENANT_ID_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
 
 # データベースモデル
+class Tenant(db.Model):
+    __tablename__ = 'tenants'
+    
+    id = db.Column(db.String(64), primary_key=True)
+    name = db.Column(db.String(100))
+    # APIキーはSHA-256ハッシュのみ保存
+    api_key_hash = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
 class WorkoutSession(db.Model):
     __tablename__ = 'workout_sessions'
+    __table_args__ = (
+        # テナントごとに同じ日付の（削除されていない）セッションは1つだけ
+        # （upsertの競合判定とテナント別の日付検索に使用。ゴミ箱の行はインデックスに含めない）
+        db.Index('uq_workout_sessions_live_date', 'tenant_id', 'date', unique=True,
+                 sqlite_where=text('deleted_at IS NULL'), postgresql_where=text('deleted_at IS NULL')),
+        # 施設別の一覧・集計用
+        db.Index('ix_workout_sessions_tenant_facility', 'tenant_id', 'facility_id', 'date'),
+        # ゴミ箱の一覧・完全削除用
+        db.Index('ix_workout_sessions_trash', 'tenant_id', 'deleted_at',
+                 sqlite_where=text('deleted_at IS NOT NULL'), postgresql_where=text('deleted_at IS NOT NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), nullable=False, default=DEFAULT_TENANT_ID, server_default=DEFAULT_TENANT_ID)
     date = db.Column(db.Date, nullable=False)
     day_of_week = db.Column(db.String(20))
     facility = db.Column(db.String(100))
+    # 正規化した施設（表記ゆれは別名でまとめる）。facility は受信したままの表記
+    facility_id = db.Column(db.Integer, db.ForeignKey('facilities.id'))
+    # 楽観的排他制御用のバージョン（セッションまたは配下のエクササイズの変更で増加）
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # 論理削除した日時（NULLは有効な行。保持期間後に purge-trash で完全削除）
+    deleted_at = db.Column(db.DateTime)
     
     # リレーション
     workout_logs = db.relationship('WorkoutLog', backref='session', lazy=True, cascade='all, delete-orphan')
 
 class WorkoutLog(db.Model):
     __tablename__ = 'workout_logs'
+    __table_args__ = (
+        # テナント別の集計・一覧用（削除されていない行のみ）
+        db.Index('ix_workout_logs_live_session', 'tenant_id', 'session_id',
+                 sqlite_where=text('deleted_at IS NULL'), postgresql_where=text('deleted_at IS NULL')),
+        # ゴミ箱の一覧・復元・完全削除用
+        db.Index('ix_workout_logs_trash', 'tenant_id', 'deleted_at',
+                 sqlite_where=text('deleted_at IS NOT NULL'), postgresql_where=text('deleted_at IS NOT NULL')),
+        # 日付範囲の集計・エクスポート用（パーティション化後はパーティションキー）
+        db.Index('ix_workout_logs_tenant_session_date', 'tenant_id', 'session_date'),
+        # 受信時の重複排除用（DEDUP_ON_INGEST。パーティション化に備えて session_date を含める）
+        db.Index('uq_workout_logs_live_content', 'tenant_id', 'session_id', 'session_date', 'content_hash', unique=True,
+                 sqlite_where=text('deleted_at IS NULL AND content_hash IS NOT NULL'),
+                 postgresql_where=text('deleted_at IS NULL AND content_hash IS NOT NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    # セッションと同じテナント（テナント別インデックスのため非正規化して保持）
+    tenant_id = db.Column(db.String(64), nullable=False, default=DEFAULT_TENANT_ID, server_default=DEFAULT_TENANT_ID)
     session_id = db.Column(db.Integer, db.ForeignKey('workout_sessions.id'), nullable=False)
+    # セッションの日付（年単位の範囲パーティションのキーとして非正規化して保持）
+    session_date = db.Column(db.Date)
     exercise_name = db.Column(db.String(200), nullable=False)
     exercise_category = db.Column(db.String(50))
     weight = db.Column(db.String(50))
@@ -54,82 +276,1122 @@ class WorkoutLog(db.Model):
     sets = db.Column(db.Integer)
     target_muscle = db.Column(db.String(100))
     notes = db.Column(db.Text)
+    # 受信時の内容のハッシュ（DEDUP_ON_INGEST 有効時のみ。編集・復元でNULLに戻す）
+    content_hash = db.Column(db.String(32))
+    # 楽観的排他制御用のバージョン
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # 論理削除した日時（セッションごと削除した場合はセッションと同じ日時）
+    deleted_at = db.Column(db.DateTime)
 
-def log_event(event_type, data=None, status="success", error=None):
-    """イベントをログに記録"""
-    log_entry = {
-        "timestamp": datetime.datetime.now().isoformat(),
-        "event_type": event_type,
-        "status": status,
-        "data": data,
-        "error": error
-    }
+class CalendarIndex(db.Model):
+    __tablename__ = 'calendar_index'
+    
+    # テナント・年ごとの日別配列（書き込み時に該当日だけ更新）
+    tenant_id = db.Column(db.String(64), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class WorkoutArchive(db.Model):
+    __tablename__ = 'workout_archives'
+    
+    # アーカイブ済みの年ごとのセッション（fetch_sessions_data と同じ形式のJSONをzlib圧縮）
+    tenant_id = db.Column(db.String(64), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    exercise_count = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class Facility(db.Model):
+    __tablename__ = 'facilities'
+    __table_args__ = (
+        db.Index('uq_facilities_tenant_name', 'tenant_id', 'normalized_name', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), nullable=False, default=DEFAULT_TENANT_ID)
+    name = db.Column(db.String(100), nullable=False)  # 表示名（最初に記録された表記）
+    normalized_name = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class FacilityAlias(db.Model):
+    __tablename__ = 'facility_aliases'
+    
+    # 正規化した別名 → 施設
+    tenant_id = db.Column(db.String(64), primary_key=True)
+    alias = db.Column(db.String(100), primary_key=True)
+    facility_id = db.Column(db.Integer, db.ForeignKey('facilities.id'), nullable=False)
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        # テナント別に連番以降の変更を取得（/api/sync）
+        db.Index('ix_change_log_tenant_seq', 'tenant_id', 'seq'),
+    )
+    
+    # セッション・エクササイズの変更履歴（差分同期用の単調増加する連番）
+    seq = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), nullable=False)
+    entity = db.Column(db.String(16), nullable=False)  # session / exercise
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(8), nullable=False)  # upsert / delete
+    changed_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class AuditHistory(db.Model):
+    __tablename__ = 'audit_history'
+    __table_args__ = (
+        db.Index('ix_audit_history_entity', 'tenant_id', 'entity', 'entity_id'),
+    )
     
-    # ログファイルの読み込み
-    logs = []
-    if LOGS_FILE.exists():
+    # 更新・削除・復元の変更前後の値（JSON）
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), nullable=False)
+    entity = db.Column(db.String(16), nullable=False)  # session / exercise
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(16), nullable=False)  # update / delete / restore
+    before = db.Column(db.Text)
+    after = db.Column(db.Text)
+    changed_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def exclude_deleted_rows(execute_state):
+    """ORMのSELECTから論理削除した行を除外する（execution_options(include_deleted=True) で含める）
+
+    関連の遅延読み込みには親のクエリの条件が引き継がれる。
+    """
+    if (execute_state.is_select and not execute_state.is_column_load and not execute_state.is_relationship_load
+            and not execute_state.execution_options.get('include_deleted', False)):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(WorkoutSession, WorkoutSession.deleted_at.is_(None), include_aliases=True),
+            with_loader_criteria(WorkoutLog, WorkoutLog.deleted_at.is_(None), include_aliases=True),
+        )
+
+# 結合条件を明示した JOIN 先には上の除外条件が付かないため、セッションからエクササイズへの結合はこれを使う
+LIVE_EXERCISE_JOIN = db.and_(WorkoutLog.session_id == WorkoutSession.id, WorkoutLog.deleted_at.is_(None))
+
+mark_startup("models")
+
+def current_tenant_id():
+    """現在のリクエストのテナントID（リクエスト外は default）"""
+    if has_request_context():
+        return g.get('tenant_id', DEFAULT_TENANT_ID)
+    return DEFAULT_TENANT_ID
+
+def tenant_data_file(default_path):
+    """テナントごとのデータファイルパス（default テナントは従来のパス）"""
+    tenant_id = current_tenant_id()
+    if tenant_id == DEFAULT_TENANT_ID:
+        return default_path
+    tenant_dir = DATA_DIR / "tenants" / tenant_id
+    tenant_dir.mkdir(parents=True, exist_ok=True)
+    return tenant_dir / default_path.name
+
+def hash_api_key(api_key):
+    """APIキーのSHA-256ハッシュ"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+def request_api_key():
+    """Authorization: Bearer / X-API-Key / Cookie からAPIキーを取得（?api_key= は resolve_tenant でCookieに移す）"""
+    auth = request.headers.get('Authorization', '')
+    if auth.lower().startswith('bearer '):
+        return auth[7:].strip()
+    return request.headers.get('X-API-Key') or request.cookies.get('api_key')
+
+# レート制限（トークンバケット）設定
+# RATE_LIMITS="receive_data=60/60,save_workout=30/60" の形式で エンドポイント名=回数/秒数 を上書き
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_STORE_URL = os.environ.get('RATE_LIMIT_STORE_URL', f"sqlite:///{(DATA_DIR / 'rate_limits.db').resolve()}")
+# プロセス内のテストクライアント（確認用CLI）がレート制限を受けないためのWSGI environキー（HTTPヘッダからは設定できない）
+RATE_LIMIT_BYPASS_ENVIRON = 'gpts_action.skip_rate_limit'
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', 10000))  # memory バックエンドで保持するバケット数の上限
+RATE_LIMIT_SWEEP_SECONDS = 60  # 満タンに戻ったバケットを削除する間隔
+# 手前にあるリバースプロキシの段数（render.com は1）。X-Forwarded-For はこの段数分だけ信頼する
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 1))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+DEFAULT_RATE_LIMITS = {
+    'receive_data': (60, 60),
+    'save_conversation': (60, 60),
+    'save_workout': (60, 60),
+    'default': (120, 60),  # その他の /api/ エンドポイント
+}
+
+# 負荷制御（LOAD_SHEDDING=1 で同時処理数・平均レイテンシが閾値を超えたら429を返す）
+LOAD_SHEDDING = os.environ.get('LOAD_SHEDDING') == '1'
+SHED_MAX_IN_FLIGHT = int(os.environ.get('SHED_MAX_IN_FLIGHT', 8))
+SHED_MAX_LATENCY_MS = float(os.environ.get('SHED_MAX_LATENCY_MS', 2000))
+SHED_COOLDOWN_SECONDS = float(os.environ.get('SHED_COOLDOWN_SECONDS', 5))
+# 長時間接続のためレイテンシ計測・同時処理数から除外するエンドポイント（接続数は個別に制限）
+SHED_EXEMPT_ENDPOINTS = {'stream_events'}
+
+def parse_rate_limits(value):
+    """RATE_LIMITS 環境変数を {エンドポイント: (回数, 秒数)} に変換"""
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        endpoint, _, quota = item.partition('=')
+        count, _, seconds = quota.partition('/')
+        limits[endpoint.strip()] = (int(count), float(seconds or 60))
+    return limits
+
+RATE_LIMITS = parse_rate_limits(os.environ.get('RATE_LIMITS'))
+
+def take_token(tokens, updated_at, capacity, refill_rate, now):
+    """トークンバケットから1つ取り出す。(残りトークン, 再試行までの秒数) を返す（0なら許可）"""
+    tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / refill_rate
+
+class MemoryRateLimitBackend:
+    """プロセス内のトークンバケット（ワーカーごとに独立）
+
+    満タンに戻ったバケットは未使用と同じなので定期的に削除し、
+    件数が上限を超えたら最も長く使われていないものから捨てる。
+    """
+    def __init__(self, max_buckets=RATE_LIMIT_MAX_BUCKETS):
+        self._buckets = OrderedDict()  # key → (残りトークン, 更新時刻, 満タンに戻る時刻)
+        self._lock = threading.Lock()
+        self._max_buckets = max_buckets
+        self._swept_at = 0.0
+    
+    def acquire(self, key, capacity, refill_rate, now):
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.pop(key, (capacity, now, now))
+            tokens, retry_after = take_token(tokens, updated_at, capacity, refill_rate, now)
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / refill_rate)
+            if now - self._swept_at >= RATE_LIMIT_SWEEP_SECONDS:
+                self._sweep(now)
+            while len(self._buckets) > self._max_buckets:
+                self._buckets.popitem(last=False)
+            return tokens, retry_after
+    
+    def _sweep(self, now):
+        """満タンに戻ったバケットを削除"""
+        self._swept_at = now
+        for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+    
+    def __len__(self):
+        return len(self._buckets)
+
+class SQLRateLimitBackend:
+    """SQLテーブルに保持する共有トークンバケット（複数ワーカー・インスタンスで共有）
+
+    RATE_LIMIT_STORE_URL に共有DBを指定する。未指定時は data/rate_limits.db のSQLiteが
+    同一ホストのワーカー間で共有されるローカル代替となる。
+    トークンの取り出しは INSERT ... ON CONFLICT DO UPDATE ... RETURNING の1文で行う
+    （SELECT FOR UPDATE が効かないSQLiteでも同時リクエストで更新が失われない）。
+    """
+    def __init__(self, url):
+        from sqlalchemy import create_engine, inspect, MetaData, Table, Column, String, Float, Boolean
+        self.engine = create_engine(url)
+        self.table = Table(
+            'rate_limit_buckets', MetaData(),
+            Column('key', String(200), primary_key=True),
+            Column('tokens', Float, nullable=False),
+            Column('updated_at', Float, nullable=False),
+            Column('allowed', Boolean, nullable=False),  # 直前の取り出しが許可されたか
+        )
+        # バケットは一時的な状態なので、列の足りない古い形式のテーブルは作り直す
+        inspector = inspect(self.engine)
+        if inspector.has_table('rate_limit_buckets') and \
+                'allowed' not in {column['name'] for column in inspector.get_columns('rate_limit_buckets')}:
+            self.table.drop(self.engine)
+        self.table.create(self.engine, checkfirst=True)
+        if self.engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        self._insert = insert
+    
+    def acquire(self, key, capacity, refill_rate, now):
+        table = self.table
+        refilled = table.c.tokens + (now - table.c.updated_at) * refill_rate
+        refilled = db.case((refilled > capacity, capacity), else_=refilled)
+        granted = refilled >= 1
+        # 拒否した場合は行を変えない（経過時間で補充される量は更新しても同じ）
+        stmt = self._insert(table).values(key=key, tokens=capacity - 1, updated_at=now, allowed=True)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.key], set_={
+            'tokens': db.case((granted, refilled - 1), else_=table.c.tokens),
+            'updated_at': db.case((granted, now), else_=table.c.updated_at),
+            'allowed': granted,
+        }).returning(table.c.tokens, table.c.updated_at, table.c.allowed)
+        with self.engine.begin() as conn:
+            tokens, updated_at, allowed = conn.execute(stmt).one()
+        if allowed:
+            return tokens, 0
+        return take_token(tokens, updated_at, capacity, refill_rate, now)
+
+_rate_limit_backend = None
+
+def get_rate_limit_backend():
+    """設定されたレート制限バックエンド（初回利用時に生成）"""
+    global _rate_limit_backend
+    if _rate_limit_backend is None:
+        if RATE_LIMIT_BACKEND == 'sql':
+            _rate_limit_backend = SQLRateLimitBackend(RATE_LIMIT_STORE_URL)
+        else:
+            _rate_limit_backend = MemoryRateLimitBackend()
+    return _rate_limit_backend
+
+def unlimited_test_client():
+    """レート制限を受けないプロセス内のテストクライアント（グローバル設定は変更しない）"""
+    client = app.test_client()
+    client.environ_base[RATE_LIMIT_BYPASS_ENVIRON] = True
+    return client
+
+def client_identity():
+    """レート制限のキー（登録済みのAPIキーならそのハッシュ、それ以外はクライアントIP）
+
+    未登録のキーはIPと同じバケットに入れ、キーを変えて制限を回避できないようにする。
+    IPは ProxyFix が信頼できるプロキシの段から取り出した remote_addr を使う。
+    """
+    api_key = request_api_key()
+    if api_key:
+        key_hash = hash_api_key(api_key)
+        if cached_tenant_id(key_hash) is not None:
+            return 'key:' + key_hash[:16]
+    return 'ip:' + (request.remote_addr or 'unknown')
+
+def too_many_requests(message, retry_after):
+    """429レスポンス（Retry-After付き）"""
+    response = jsonify({"error": message, "retry_after": int(retry_after) + 1})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response
+
+@app.errorhandler(413)
+def payload_too_large(e):
+    """ボディサイズ超過をJSONで返す"""
+    return jsonify({"error": f"Payload too large (max {app.config['MAX_CONTENT_LENGTH']} bytes)"}), 413
+
+@app.before_request
+def reject_oversized_body():
+    """Content-Lengthが上限を超えるリクエストは本文を読まずに413を返す"""
+    max_length = app.config['MAX_CONTENT_LENGTH']
+    if max_length and request.content_length and request.content_length > max_length:
+        return payload_too_large(None)
+
+# 負荷制御の状態（プロセス内）
+_load_lock = threading.Lock()
+_load_state = {"in_flight": 0, "latency_ms": 0.0, "shed_until": 0.0}
+
+@app.before_request
+def admission_control():
+    """/api/ へのリクエストを負荷制御とレート制限で受け付け判定"""
+    if not request.path.startswith('/api/'):
+        return
+    now = time.time()
+    
+    if LOAD_SHEDDING and request.endpoint not in SHED_EXEMPT_ENDPOINTS:
+        with _load_lock:
+            state = _load_state
+            if state["in_flight"] >= SHED_MAX_IN_FLIGHT or state["latency_ms"] > SHED_MAX_LATENCY_MS:
+                # 閾値超過で一定時間受付を停止し、再開後は計測し直す
+                state["shed_until"] = max(state["shed_until"], now + SHED_COOLDOWN_SECONDS)
+                state["latency_ms"] = 0.0
+            if now < state["shed_until"]:
+                return too_many_requests("Server is overloaded", state["shed_until"] - now)
+            state["in_flight"] += 1
+        g.admitted_at = time.perf_counter()
+    
+    if RATE_LIMIT_ENABLED and not request.environ.get(RATE_LIMIT_BYPASS_ENVIRON):
+        endpoint = request.endpoint or 'default'
+        capacity, period = RATE_LIMITS.get(endpoint, RATE_LIMITS['default'])
+        key = f"{endpoint if endpoint in RATE_LIMITS else 'default'}:{client_identity()}"
         try:
-            with open(LOGS_FILE, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        except:
-            logs = []
+            tokens, retry_after = get_rate_limit_backend().acquire(key, capacity, capacity / period, now)
+        except Exception as e:
+            # 共有ストア障害時はリクエストを通す（フェイルオープン）
+            app.logger.warning("rate limit backend error: %s", e)
+            return
+        g.rate_limit_remaining = int(tokens)
+        if retry_after:
+            return too_many_requests("Rate limit exceeded", retry_after)
+
+@app.after_request
+def rate_limit_headers(response):
+    """残りリクエスト数をヘッダで通知"""
+    if 'rate_limit_remaining' in g:
+        response.headers['X-RateLimit-Remaining'] = str(g.rate_limit_remaining)
+    return response
+
+@app.teardown_request
+def release_admission(exc=None):
+    """同時処理数を戻し、レイテンシの指数移動平均を更新"""
+    admitted_at = g.pop('admitted_at', None)
+    if admitted_at is None:
+        return
+    elapsed_ms = (time.perf_counter() - admitted_at) * 1000
+    with _load_lock:
+        _load_state["in_flight"] -= 1
+        _load_state["latency_ms"] = _load_state["latency_ms"] * 0.8 + elapsed_ms * 0.2
+
+# APIキーハッシュ → (テナントID, 有効期限) のキャッシュ（リクエストごとのDB参照を避ける）
+# テナントの削除・キーの変更は最長 TENANT_CACHE_SECONDS 秒で各ワーカーに反映される
+TENANT_CACHE_SECONDS = float(os.environ.get('TENANT_CACHE_SECONDS', 60))
+_tenant_cache = {}
+
+def cached_tenant_id(key_hash):
+    """解決済みで期限内のAPIキーのテナントID（未解決・期限切れなら None）"""
+    entry = _tenant_cache.get(key_hash)
+    if entry is None or entry[1] <= time.monotonic():
+        return None
+    return entry[0]
+
+def lookup_tenant_id(api_key):
+    """APIキーのテナントID（キャッシュになければDBを参照、未登録なら None）"""
+    key_hash = hash_api_key(api_key)
+    tenant_id = cached_tenant_id(key_hash)
+    if tenant_id is None:
+        tenant_id = db.session.query(Tenant.id).filter_by(api_key_hash=key_hash).scalar()
+        if tenant_id is not None:
+            _tenant_cache[key_hash] = (tenant_id, time.monotonic() + TENANT_CACHE_SECONDS)
+    return tenant_id
+
+def forget_tenant(tenant_id):
+    """このワーカーのキャッシュからテナントのAPIキーを削除"""
+    for key_hash in [key_hash for key_hash, entry in _tenant_cache.items() if entry[0] == tenant_id]:
+        _tenant_cache.pop(key_hash, None)
+
+def exchange_query_api_key():
+    """ブラウザで ?api_key= を付けて開いた場合、キーをセッションCookieに移してキーを除いたURLへリダイレクト
+
+    キーがアクセスログ・閲覧履歴・Refererに残り続けないよう、クエリのキーは最初の1回だけ受け付ける。
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return jsonify({"error": "Send the API key in the Authorization or X-API-Key header"}), 400
+    api_key = request.args['api_key']
+    if lookup_tenant_id(api_key) is None:
+        return jsonify({"error": "Invalid API key"}), 401
     
-    logs.append(log_entry)
+    args = [(key, value) for key, value in request.args.items(multi=True) if key != 'api_key']
+    response = redirect(request.path + (f"?{urlencode(args)}" if args else ''), 303)
+    # 有効期限なし（ブラウザを閉じると消える）のCookie
+    response.set_cookie('api_key', api_key, httponly=True, samesite='Lax', secure=request.is_secure)
+    response.headers['Referrer-Policy'] = 'no-referrer'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.before_request
+def resolve_tenant():
+    """APIキーからテナントを解決"""
+    if is_warmup_request():
+        g.tenant_id = DEFAULT_TENANT_ID
+        return
+    if 'api_key' in request.args:
+        return exchange_query_api_key()
     
-    # 最新100件のみ保持
-    logs = logs[-100:]
+    api_key = request_api_key()
+    if not api_key:
+        if REQUIRE_API_KEY and request.endpoint not in ('index', 'static_asset', 'healthz', 'readyz'):
+            return jsonify({"error": "API key required"}), 401
+        g.tenant_id = DEFAULT_TENANT_ID
+        return
     
-    # ログファイルの書き込み
-    with open(LOGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(logs, f, ensure_ascii=False, indent=2)
+    tenant_id = lookup_tenant_id(api_key)
+    if tenant_id is None:
+        return jsonify({"error": "Invalid API key"}), 401
+    g.tenant_id = tenant_id
 
-def save_received_data(data):
-    """受信したデータを保存"""
-    received_data = []
-    if RECEIVED_DATA_FILE.exists():
+# テナントごとの最終書き込み時刻（read-your-writes 用、プロセス内）
+_last_write_at = {}
+
+def recently_wrote():
+    """このクライアントが直近に書き込んだか（Cookieまたはテナントの最終書き込み時刻）"""
+    try:
+        primary_until = float(request.cookies.get('primary_until', 0))
+    except ValueError:
+        primary_until = 0
+    primary_until = max(primary_until, _last_write_at.get(current_tenant_id(), 0) + REPLICA_STICKY_SECONDS)
+    return time.time() < primary_until
+
+def read_replica(view):
+    """読み取り専用ルートのクエリをリードレプリカに振り分けるデコレータ
+
+    リクエスト中は同じレプリカを使い、直近に書き込んだクライアントはプライマリから読む。
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if REPLICA_BIND_KEYS and not recently_wrote():
+            g.replica_bind = random.choice(REPLICA_BIND_KEYS)
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.after_request
+def remember_write(response):
+    """書き込みに成功したら一定時間プライマリから読むよう記録"""
+    if REPLICA_BIND_KEYS and request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+        now = time.time()
+        _last_write_at[current_tenant_id()] = now
+        response.set_cookie('primary_until', str(now + REPLICA_STICKY_SECONDS),
+                            max_age=int(REPLICA_STICKY_SECONDS) + 1, httponly=True, samesite='Lax')
+    return response
+
+# レスポンス圧縮と条件付きGET
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # これより小さい本文は圧縮しない（バイト）
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))  # gzipの圧縮レベル
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))  # 動的レスポンス向けに速度寄りの品質
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/javascript',
+    'application/json', 'application/javascript', 'application/x-ndjson',
+}
+COMPRESSION_ENCODINGS = ('br', 'gzip')
+# データのあるページ・APIは毎回ETagで再検証し、共有キャッシュには保存させない
+CACHE_CONTROL_PRIVATE = 'private, no-cache'
+# デプロイごとにETagを変える（テンプレートの変更を反映するため）
+ETAG_SALT = os.environ.get('RENDER_GIT_COMMIT') or str(Path(__file__).stat().st_mtime_ns)
+
+_brotli = None
+
+def load_brotli():
+    """brotli がインストールされていれば返す（未インストールならNoneでgzipのみ使用）"""
+    global _brotli
+    if _brotli is None:
         try:
-            with open(RECEIVED_DATA_FILE, 'r', encoding='utf-8') as f:
-                received_data = json.load(f)
-        except:
-            received_data = []
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli or None
+
+def data_version(tenant_id=None):
+    """テナントのデータのバージョン（変更フィードの最新連番。セッション・エクササイズの書き込みごとに増える）"""
+    return db.session.query(func.max(ChangeLog.seq)).filter(
+        ChangeLog.tenant_id == (tenant_id or current_tenant_id())
+    ).scalar() or 0
+
+def workout_data_stamp():
+    """ワークアウトのページ・APIのETag元（日付で変わる既定値があるため今日の日付も含める）"""
+    return data_version(), datetime.date.today().isoformat()
+
+def log_buffer_stamp():
+    """処理ログのETag元（リングバッファはワーカーごとのため、プロセスも含める）"""
+    return os.getpid(), _STARTUP_T0, log_buffer.version(current_tenant_id())
+
+def data_file_stamp(default_path):
+    """受信データ・会話データファイルのETag元（更新時刻とサイズ）"""
+    try:
+        stat = tenant_data_file(default_path).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def version_etag(stamp):
+    """データのバージョンから強いETagを計算する（本文はハッシュしない）"""
+    key = json.dumps([ETAG_SALT, current_tenant_id(), stamp], default=str)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+def etag_base(tag):
+    """圧縮時に付けたサフィックス（-br / -gzip）を除いたETag"""
+    for encoding in COMPRESSION_ENCODINGS:
+        if tag.endswith('-' + encoding):
+            return tag[:-len(encoding) - 1]
+    return tag
+
+def not_modified(etag, cache_control=CACHE_CONTROL_PRIVATE):
+    """If-None-Match がETagに一致すれば 304 レスポンスを返す（一致しなければNone）"""
+    if request.if_none_match.star_tag:
+        matched = etag
+    else:
+        matched = next((tag for tag in request.if_none_match.as_set(include_weak=True) if etag_base(tag) == etag), None)
+    if matched is None:
+        return None
+    # クライアントが保持している表現（圧縮の有無を含む）のETagをそのまま返す
+    response = Response(status=304)
+    response.set_etag(matched)
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+    return response
+
+def conditional_get(stamp, cache_control=CACHE_CONTROL_PRIVATE):
+    """stamp() の戻り値からETagを作り、If-None-Match が一致すれば描画せずに 304 を返すデコレータ"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = version_etag(stamp())
+            response = not_modified(etag, cache_control)
+            if response is not None:
+                return response
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.headers.setdefault('Cache-Control', cache_control)
+            return response
+        return wrapper
+    return decorator
+
+@app.after_request
+def compress_response(response):
+    """Accept-Encoding に応じて brotli / gzip で圧縮（小さい本文・ストリーム・圧縮済み形式は対象外）"""
+    if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
     
-    data_entry = {
+    response.vary.add('Accept-Encoding')
+    brotli = load_brotli()
+    encoding = request.accept_encodings.best_match(COMPRESSION_ENCODINGS if brotli else ('gzip',))
+    if encoding is None:
+        return response
+    if encoding == 'br':
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    # 圧縮した表現は別のバイト列のため、強いETagには符号化方式を付ける（比較時は etag_base で除く）
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+# 静的ファイル（CSS/JS）。URLに内容のハッシュを含め、ブラウザに長期キャッシュさせる
+STATIC_DIR = Path(__file__).resolve().parent / 'static'
+STATIC_MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+# ハッシュ付きURLは内容が変わればURLも変わるため、再検証なしで1年キャッシュさせる
+CACHE_CONTROL_IMMUTABLE = 'public, max-age=31536000, immutable'
+# ハッシュなし・古いハッシュのURLは毎回ETagで再検証させる
+CACHE_CONTROL_STATIC = 'public, no-cache'
+FINGERPRINT_PATTERN = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{10})(?P<suffix>\.[a-z]+)$')
+
+_static_assets = {}  # 相対パス -> (更新時刻, 内容, ハッシュ)
+
+def load_static_asset(filename):
+    """静的ファイルの内容とハッシュを返す（更新時刻が変わるまでプロセス内にキャッシュ。対象外はNone）"""
+    path = (STATIC_DIR / filename).resolve()
+    if STATIC_DIR not in path.parents or path.suffix not in STATIC_MIMETYPES:
+        return None
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return None
+    cached = _static_assets.get(filename)
+    if cached is None or cached[0] != mtime:
+        data = path.read_bytes()
+        cached = _static_assets[filename] = (mtime, data, hashlib.sha1(data).hexdigest()[:10])
+    return cached[1], cached[2]
+
+def static_asset_names():
+    """配信対象の静的ファイルの相対パス一覧"""
+    return sorted(path.relative_to(STATIC_DIR).as_posix() for path in STATIC_DIR.rglob('*')
+                  if path.is_file() and path.suffix in STATIC_MIMETYPES)
+
+def asset_url(filename):
+    """テンプレートから参照する静的ファイルのURL（例: /static/css/app.0123456789.css）"""
+    asset = load_static_asset(filename)
+    if asset is None:
+        raise FileNotFoundError(f"static asset not found: {filename}")
+    stem, suffix = os.path.splitext(filename)
+    return f"/static/{stem}.{asset[1]}{suffix}"
+
+app.jinja_env.globals['asset_url'] = asset_url
+
+@app.route('/static/<path:filename>')
+def static_asset(filename):
+    """静的ファイルを配信（ハッシュが現在の内容と一致すれば immutable で長期キャッシュ）"""
+    match = FINGERPRINT_PATTERN.match(filename)
+    asset = load_static_asset(match['stem'] + match['suffix'] if match else filename)
+    if asset is None:
+        return jsonify({"error": "Not found"}), 404
+    data, digest = asset
+    if match and match['digest'] == digest:
+        cache_control = CACHE_CONTROL_IMMUTABLE
+    else:
+        # デプロイ前のHTMLが古いハッシュを参照している場合も現在の内容を返す
+        cache_control = CACHE_CONTROL_STATIC
+
+    response = not_modified(digest, cache_control)
+    if response is not None:
+        return response
+    response = Response(data, mimetype=STATIC_MIMETYPES[Path(filename).suffix])
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+# エクササイズのAPIキーとカラムの対応（シリアライズ用）
+EXERCISE_FIELDS = (
+    ('id', WorkoutLog.id),
+    ('name', WorkoutLog.exercise_name),
+    ('category', WorkoutLog.exercise_category),
+    ('weight', WorkoutLog.weight),
+    ('reps', WorkoutLog.reps),
+    ('rest_pause_reps', WorkoutLog.rest_pause_reps),
+    ('sets', WorkoutLog.sets),
+    ('target_muscle', WorkoutLog.target_muscle),
+    ('notes', WorkoutLog.notes),
+    ('version', WorkoutLog.version),
+)
+EXERCISE_KEYS = tuple(key for key, _ in EXERCISE_FIELDS)
+
+# 更新可能なAPIキー → WorkoutLogの属性名
+EXERCISE_UPDATE_COLUMNS = {
+    'name': 'exercise_name',
+    'category': 'exercise_category',
+    'weight': 'weight',
+    'reps': 'reps',
+    'rest_pause_reps': 'rest_pause_reps',
+    'sets': 'sets',
+    'target_muscle': 'target_muscle',
+    'notes': 'notes',
+}
+
+# 一括更新・削除で1リクエストに指定できる最大件数
+MAX_BATCH_SIZE = 500
+
+def expected_version(data=None):
+    """ボディまたはクエリの version から期待するバージョンを取得（指定なし・整数でない場合はNone）"""
+    if isinstance(data, dict) and 'version' in data:
+        version = data['version']
+    else:
+        version = request.args.get('version')
+    try:
+        return int(version) if version is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def version_mismatch(current_version, data=None):
+    """If-Matchヘッダ（なければボディ・クエリの version）が現在のバージョンと一致しなければTrue
+
+    If-Match があればそのタグだけで判定する（解釈できないタグは不一致、* は常に一致）。
+    GPTsアクションはヘッダを自由に設定できないため、ボディ・クエリの version も受け付ける。
+    """
+    if request.if_match:
+        if request.if_match.star_tag:
+            return False
+        return str(current_version) not in {etag_base(tag) for tag in request.if_match.as_set(include_weak=True)}
+    expected = expected_version(data)
+    return expected is not None and expected != current_version
+
+def batch_versions(data, exercise_ids):
+    """一括操作の期待バージョンをIDと同じ順のリストで返す（不正な場合はNone）
+
+    versions はIDと同じ順のリスト、version は全件共通の値。どちらもなければ全件 None（判定しない）。
+    """
+    if 'versions' in data:
+        versions = data['versions']
+        if not isinstance(versions, list) or len(versions) != len(data.get('ids') or []):
+            return None
+        # parse_exercise_ids で除いた重複IDは最初の指定を使う
+        versions = dict(reversed(list(zip(data['ids'], versions))))
+        versions = [versions.get(exercise_id) for exercise_id in exercise_ids]
+    else:
+        versions = [data.get('version')] * len(exercise_ids)
+    if not all(version is None or (isinstance(version, int) and not isinstance(version, bool)) for version in versions):
+        return None
+    return versions
+
+def record_changes(entity, entity_ids, op='upsert', tenant_id=None):
+    """変更フィード（change_log）に変更を記録する（呼び出し元のトランザクションでコミット）
+
+    entity は 'session' / 'exercise'、op は 'upsert' / 'delete'。
+    """
+    entity_ids = sorted({entity_id for entity_id in entity_ids if entity_id is not None})
+    if not entity_ids:
+        return
+    tenant_id = tenant_id or current_tenant_id()
+    if db.engine.dialect.name == 'postgresql':
+        # 同じテナントの書き込みをコミットまで直列化し、連番の順にコミットされるようにする
+        # （未コミットの小さい連番を同期クライアントが読み飛ばさないため）
+        db.session.execute(text('SELECT pg_advisory_xact_lock(hashtext(:key))'), {'key': f'change_log:{tenant_id}'})
+    db.session.execute(db.insert(ChangeLog), [
+        {'tenant_id': tenant_id, 'entity': entity, 'entity_id': entity_id, 'op': op}
+        for entity_id in entity_ids
+    ])
+
+def record_audit(entity, action, changes, tenant_id=None):
+    """監査履歴に変更前後の値を記録する（changes は [(ID, 変更前dict, 変更後dict), ...]）"""
+    if not changes:
+        return
+    tenant_id = tenant_id or current_tenant_id()
+    db.session.execute(db.insert(AuditHistory), [
+        {
+            'tenant_id': tenant_id, 'entity': entity, 'entity_id': entity_id, 'action': action,
+            'before': json.dumps(before, ensure_ascii=False, default=str) if before is not None else None,
+            'after': json.dumps(after, ensure_ascii=False, default=str) if after is not None else None,
+        }
+        for entity_id, before, after in changes
+    ])
+
+def soft_delete_exercises(condition, deleted_at, tenant_id=None):
+    """条件に合う有効なエクササイズを論理削除し、削除したIDを返す"""
+    return list(db.session.execute(
+        db.update(WorkoutLog).where(
+            WorkoutLog.tenant_id == (tenant_id or current_tenant_id()), WorkoutLog.deleted_at.is_(None), condition
+        ).values(deleted_at=deleted_at, version=WorkoutLog.version + 1).returning(WorkoutLog.id),
+        execution_options={"synchronize_session": False}
+    ).scalars())
+
+def bump_session_versions(session_ids, tenant_id=None):
+    """配下のエクササイズが変更されたセッションのバージョンを上げる"""
+    session_ids = [session_id for session_id in set(session_ids) if session_id is not None]
+    if session_ids:
+        db.session.execute(
+            db.update(WorkoutSession).where(WorkoutSession.id.in_(session_ids)).values(version=WorkoutSession.version + 1),
+            execution_options={"synchronize_session": False}
+        )
+        record_changes('session', session_ids, tenant_id=tenant_id)
+
+def dialect_insert(model):
+    """ON CONFLICT 句を使える接続先DBの INSERT 文"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def upsert_session_by_date(session_date, day_of_week=None, facility=None):
+    """現在のテナントの日付でセッションを INSERT ... ON CONFLICT し、セッションIDを返す
+
+    同じ日付への同時書き込みでも部分一意インデックス (tenant_id, date) により1行にまとまる
+    （ゴミ箱にある同じ日付のセッションとは別の行になる）。
+    既存セッションはバージョンを上げ、未設定の曜日・施設のみ補完する。
+    """
+    stmt = dialect_insert(WorkoutSession).values(
+        tenant_id=current_tenant_id(),
+        date=session_date,
+        day_of_week=day_of_week,
+        facility=facility,
+        facility_id=resolve_facility_id(current_tenant_id(), facility),
+        version=1,
+        created_at=datetime.datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WorkoutSession.tenant_id, WorkoutSession.date],
+        index_where=WorkoutSession.deleted_at.is_(None),
+        set_={
+            'version': WorkoutSession.version + 1,
+            'day_of_week': db.func.coalesce(WorkoutSession.day_of_week, stmt.excluded.day_of_week),
+            'facility': db.func.coalesce(WorkoutSession.facility, stmt.excluded.facility),
+            'facility_id': db.func.coalesce(WorkoutSession.facility_id, stmt.excluded.facility_id),
+        }
+    ).returning(WorkoutSession.id)
+    return db.session.execute(stmt).scalar_one()
+
+def fetch_sessions_data(session_ids, order_desc=False, tenant_id=None):
+    """セッションとエクササイズを1クエリのフラット行で取得し、ネストしたdictに組み立てる
+
+    session_ids にはセッションIDのリストまたはサブクエリを渡す。ORMインスタンスは生成しない。
+    tenant_id 省略時は現在のリクエストのテナント。
+    """
+    date_order = WorkoutSession.date.desc() if order_desc else WorkoutSession.date.asc()
+    rows = db.session.query(
+        WorkoutSession.id,
+        WorkoutSession.date,
+        WorkoutSession.day_of_week,
+        WorkoutSession.facility,
+        WorkoutSession.version,
+        *[column for _, column in EXERCISE_FIELDS]
+    ).outerjoin(
+        WorkoutLog, LIVE_EXERCISE_JOIN
+    ).filter(
+        WorkoutSession.tenant_id == (tenant_id or current_tenant_id()),
+        WorkoutSession.id.in_(session_ids)
+    ).order_by(
+        date_order, WorkoutSession.id, WorkoutLog.id
+    ).all()
+    
+    sessions = {}
+    for row in rows:
+        session_data = sessions.get(row[0])
+        if session_data is None:
+            session_data = sessions[row[0]] = {
+                'id': row[0],
+                'date': row[1].strftime('%Y-%m-%d'),
+                'day_of_week': row[2],
+                'facility': row[3],
+                'version': row[4],
+                'exercises': []
+            }
+        # エクササイズのないセッションは外部結合でNULL行になる
+        if row[5] is not None:
+            session_data['exercises'].append(dict(zip(EXERCISE_KEYS, row[5:])))
+    
+    return list(sessions.values())
+
+def parse_sample_rates(value):
+    """LOG_SAMPLE_RATES（例: receive_data=0.1,default=1）を {イベント種別: 記録率} に変換"""
+    rates = {}
+    for item in (value or '').split(','):
+        name, _, rate = item.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+# 成功イベントの記録率（エラーは常に記録）
+LOG_SAMPLE_RATES = parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES'))
+
+def redact_log_value(value, depth=0):
+    """ログに残す値から秘匿情報を伏せ、大きな値を切り詰める"""
+    if isinstance(value, dict):
+        if depth >= LOG_MAX_DEPTH:
+            return f"<dict {len(value)} keys>"
+        redacted = {}
+        for index, (key, item) in enumerate(value.items()):
+            if index >= LOG_MAX_ITEMS:
+                redacted['…'] = f"+{len(value) - LOG_MAX_ITEMS} keys"
+                break
+            redacted[key] = '[REDACTED]' if LOG_REDACTED_KEYS.search(str(key)) else redact_log_value(item, depth + 1)
+        return redacted
+    if isinstance(value, (list, tuple)):
+        if depth >= LOG_MAX_DEPTH:
+            return f"<list {len(value)} items>"
+        items = [redact_log_value(item, depth + 1) for item in value[:LOG_MAX_ITEMS]]
+        if len(value) > LOG_MAX_ITEMS:
+            items.append(f"…(+{len(value) - LOG_MAX_ITEMS} items)")
+        return items
+    if isinstance(value, str) and len(value) > LOG_MAX_STRING:
+        return f"{value[:LOG_MAX_STRING]}…(+{len(value) - LOG_MAX_STRING} chars)"
+    return value
+
+class JsonLogFormatter(logging.Formatter):
+    """1レコード1行のJSON（Renderのログドレイン向け）"""
+    def format(self, record):
+        entry = getattr(record, 'log_entry', None) or {
+            "timestamp": datetime.datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class RingBufferHandler(logging.Handler):
+    """テナントごとに直近のログを保持するメモリ上のハンドラ（/logs 表示用、ワーカープロセスごと）"""
+    def __init__(self, capacity):
+        super().__init__()
+        self.capacity = capacity
+        self.buffers = {}
+        self.versions = {}
+    
+    def emit(self, record):
+        entry = getattr(record, 'log_entry', None)
+        if entry is not None:
+            buffer = self.buffers.get(entry['tenant_id'])
+            if buffer is None:
+                buffer = self.buffers.setdefault(entry['tenant_id'], deque(maxlen=self.capacity))
+            buffer.append(entry)
+            self.versions[entry['tenant_id']] = self.versions.get(entry['tenant_id'], 0) + 1
+    
+    def entries(self, tenant_id):
+        """古い順のログ一覧"""
+        return list(self.buffers.get(tenant_id, ()))
+    
+    def version(self, tenant_id):
+        """テナントのログを追加した回数（ETag用）"""
+        return self.versions.get(tenant_id, 0)
+
+event_logger = logging.getLogger('gpts_action.events')
+event_logger.setLevel(LOG_LEVEL)
+event_logger.propagate = False
+log_buffer = RingBufferHandler(LOG_BUFFER_SIZE)
+if not event_logger.handlers:
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.setFormatter(JsonLogFormatter())
+    event_logger.addHandler(stdout_handler)
+    event_logger.addHandler(log_buffer)
+
+class EventSubscriber:
+    """SSE購読者ごとの上限付きバッファ"""
+    def __init__(self, tenant_id, event_types=None):
+        self.tenant_id = tenant_id
+        self.event_types = event_types
+        self.queue = deque(maxlen=EVENT_BUFFER_SIZE)
+        self.ready = threading.Event()
+        self.dropped = 0
+    
+    def push(self, event):
+        if self.event_types and event[1] not in self.event_types:
+            return
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(event)
+        self.ready.set()
+    
+    def drain(self):
+        """溜まったイベントを取り出す（待機フラグを先に下ろして取りこぼしを防ぐ）"""
+        self.ready.clear()
+        events = []
+        while self.queue:
+            events.append(self.queue.popleft())
+        return events
+
+class EventBroker:
+    """プロセス内のpub/sub（テナントごとに購読者へ配信し、直近イベントを再送用に保持）"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.history = {}
+        self.sequence = 0
+    
+    def publish(self, tenant_id, event_type, payload):
+        with self.lock:
+            self.sequence += 1
+            event = (self.sequence, event_type, payload)
+            history = self.history.get(tenant_id)
+            if history is None:
+                history = self.history[tenant_id] = deque(maxlen=EVENT_HISTORY_SIZE)
+            history.append(event)
+            subscribers = [subscriber for subscriber in self.subscribers if subscriber.tenant_id == tenant_id]
+        for subscriber in subscribers:
+            subscriber.push(event)
+    
+    def subscribe(self, tenant_id, event_types=None, last_event_id=None):
+        """購読を開始（上限超過時は None）。last_event_id 以降の保持イベントを先に積む"""
+        subscriber = EventSubscriber(tenant_id, event_types)
+        with self.lock:
+            if len(self.subscribers) >= EVENT_MAX_SUBSCRIBERS:
+                return None
+            if last_event_id is not None:
+                for event in self.history.get(tenant_id, ()):
+                    if event[0] > last_event_id:
+                        subscriber.push(event)
+            self.subscribers.add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+event_broker = EventBroker()
+
+def log_event(event_type, data=None, status="success", error=None, level=None):
+    """イベントを構造化ログに記録（level 省略時はエラーなら ERROR、それ以外は INFO）"""
+    if level is None:
+        level = logging.ERROR if status == "error" else logging.INFO
+    if not event_logger.isEnabledFor(level):
+        return
+    
+    # 大量に発生する成功イベントはサンプリングして記録
+    sample_rate = 1.0
+    if status == "success":
+        sample_rate = LOG_SAMPLE_RATES.get(event_type, LOG_SAMPLE_RATES.get('default', 1.0))
+        if sample_rate < 1.0 and random.random() >= sample_rate:
+            return
+    
+    log_entry = {
         "timestamp": datetime.datetime.now().isoformat(),
-        "data": data
+        "level": logging.getLevelName(level),
+        "event_type": event_type,
+        "status": status,
+        "tenant_id": current_tenant_id(),
+        "data": redact_log_value(data),
+        "error": redact_log_value(error)
     }
+    if sample_rate < 1.0:
+        log_entry["sample_rate"] = sample_rate
+    if has_request_context():
+        log_entry["request"] = f"{request.method} {request.path}"
+    event_logger.log(level, event_type, extra={"log_entry": log_entry})
+    event_broker.publish(log_entry["tenant_id"], "log", log_entry)
+
+class JsonLinesIndex:
+    """JSON Linesファイルの各行のバイト位置と絞り込み用の項目（timestamp / event_type / status）の索引
+
+    前回から追記された分だけを読み足し、ファイルが置き換えられた（切り詰められた）場合は作り直す。
+    ページに表示する行だけを位置を指定して読み込むため、ファイル全体を読み込まない。
+    """
+    def __init__(self):
+        self.cache = {}  # パス → {"inode", "size", "rows": [{"timestamp", "event_type", "status", "span"}]}
+        self.lock = threading.Lock()
     
-    received_data.append(data_entry)
-    
-    # 最新100件のみ保持
-    received_data = received_data[-100:]
+    def rows(self, path, f):
+        """開いたファイル f の索引を最新にして行の一覧を返す（返した span は f から読む）"""
+        stat = os.fstat(f.fileno())
+        with self.lock:
+            state = self.cache.get(path)
+            if state is None or state["inode"] != stat.st_ino or stat.st_size < state["size"]:
+                state = self.cache[path] = {"inode": stat.st_ino, "size": 0, "rows": []}
+            if stat.st_size > state["size"]:
+                f.seek(state["size"])
+                position = state["size"]
+                for line in f.read(stat.st_size - state["size"]).splitlines(keepends=True):
+                    if not line.endswith(b'\n'):
+                        break  # 書き込み途中の行は次回に読む
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        entry = None
+                    if isinstance(entry, dict):
+                        state["rows"].append({
+                            "timestamp": entry.get("timestamp") or '', "event_type": entry.get("event_type"),
+                            "status": entry.get("status"), "span": (position, len(line)),
+                        })
+                    position += len(line)
+                state["size"] = position
+            return state["rows"]
     
-    with open(RECEIVED_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(received_data, f, ensure_ascii=False, indent=2)
+    def count(self, path):
+        """保持している行数（ファイルがなければ0）"""
+        try:
+            with open(path, 'rb') as f:
+                return len(self.rows(path, f))
+        except FileNotFoundError:
+            return 0
+
+data_file_index = JsonLinesIndex()
+_data_file_lock = threading.Lock()
+
+def read_span(f, span):
+    """索引の span (開始位置, 長さ) の行を読み込む"""
+    f.seek(span[0])
+    return f.read(span[1])
+
+def migrate_legacy_data_file(path):
+    """以前のJSON配列形式のファイル（.json）があればJSON Linesに変換する"""
+    legacy = path.with_suffix('.json')
+    if path.exists() or not legacy.exists():
+        return
+    try:
+        with open(legacy, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return
+    tmp = path.with_suffix('.jsonl.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for entry in entries[-DATA_FILE_MAX_ENTRIES:]:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+    os.replace(tmp, path)
+
+def append_data_file(default_path, entry):
+    """テナントのデータファイルに1行追記し、保持件数を返す（2倍を超えたら最新の保持件数分に切り詰める）"""
+    path = tenant_data_file(default_path)
+    with _data_file_lock:
+        migrate_legacy_data_file(path)
+        with open(path, 'ab') as f:
+            f.write((json.dumps(entry, ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+        with open(path, 'rb') as f:
+            rows = data_file_index.rows(path, f)
+            if len(rows) <= 2 * DATA_FILE_MAX_ENTRIES:
+                return min(len(rows), DATA_FILE_MAX_ENTRIES)
+            kept = b''.join(read_span(f, row["span"]) for row in rows[-DATA_FILE_MAX_ENTRIES:])
+        tmp = path.with_suffix('.jsonl.tmp')
+        tmp.write_bytes(kept)
+        os.replace(tmp, path)
+        return DATA_FILE_MAX_ENTRIES
+
+def save_received_data(data):
+    """受信したデータを保存"""
+    append_data_file(RECEIVED_DATA_FILE, {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "data": data
+    })
 
 def save_conversation_data(data):
     """会話データを保存"""
-    conversations = []
-    if CONVERSATIONS_FILE.exists():
-        try:
-            with open(CONVERSATIONS_FILE, 'r', encoding='utf-8') as f:
-                conversations = json.load(f)
-        except:
-            conversations = []
-    
+    path = tenant_data_file(CONVERSATIONS_FILE)
+    migrate_legacy_data_file(path)
     conversation_entry = {
         "timestamp": datetime.datetime.now().isoformat(),
-        "conversation_id": data.get("conversation_id", f"conv_{len(conversations) + 1}"),
+        "conversation_id": data.get("conversation_id", f"conv_{min(data_file_index.count(path), DATA_FILE_MAX_ENTRIES) + 1}"),
         "data": data
     }
-    
-    conversations.append(conversation_entry)
-    
-    # 最新100件のみ保持
-    conversations = conversations[-100:]
-    
-    with open(CONVERSATIONS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(conversations, f, ensure_ascii=False, indent=2)
+    append_data_file(CONVERSATIONS_FILE, conversation_entry)
+    return conversation_entry
 
 @app.route('/')
 def index():
@@ -140,16 +1402,9 @@ def index():
     <head>
         <title>GPTs Action Test</title>
         <meta charset="utf-8">
-        <style>
-            body { font-family: Arial, sans-serif; margin: 20px; }
-            .container { max-width: 800px; margin: 0 auto; }
-            .section { margin: 20px 0; padding: 20px; border: 1px solid #ddd; border-radius: 5px; }
-            .button { background: #007cba; color: white; padding: 10px 20px; text-decoration: none; border-radius: 3px; display: inline-block; margin: 5px; }
-            .button:hover { background: #005a8b; }
-            .endpoint { background: #f5f5f5; padding: 10px; margin: 10px 0; border-radius: 3px; font-family: monospace; }
-        </style>
+        <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
     </head>
-    <body>
+    <body class="page-index">
         <div class="container">
             <h1>GPTs Action Test Application</h1>
             
@@ -177,6 +1432,7 @@ def index():
                 <a href="/workouts" class="button">ワークアウト一覧</a>
                 <a href="/workouts/weekly" class="button">週次サマリ</a>
                 <a href="/workouts/monthly" class="button">月次サマリ</a>
+                <a href="/workouts/analytics" class="button">トレーニング負荷</a>
                 <a href="/export" class="button" style="background: #28a745;">📊 Excel エクスポート</a>
             </div>
             
@@ -202,11 +1458,72 @@ curl -X POST {{ request.url_root }}api/receive \\<br>
     '''
     return render_template_string(html)
 
+def payload_preview(raw):
+    """ログ用に受信ボディの先頭を切り詰めたプレビュー（再シリアライズしない）"""
+    preview = raw[:PAYLOAD_PREVIEW_CHARS * 4].decode('utf-8', errors='ignore')
+    if len(preview) > PAYLOAD_PREVIEW_CHARS or len(raw) > PAYLOAD_PREVIEW_CHARS * 4:
+        preview = preview[:PAYLOAD_PREVIEW_CHARS] + '…'
+    return preview
+
+def receive_ndjson():
+    """NDJSONボディを1行ずつパースし、件数・ダイジェスト・先頭レコードのみ保持"""
+    hasher = hashlib.sha256()
+    size = 0
+    records = 0
+    preview = []
+    head = b''
+    for line_number, line in enumerate(request.stream, 1):
+        hasher.update(line)
+        size += len(line)
+        if len(head) < PAYLOAD_PREVIEW_CHARS * 4:
+            head += line
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return None, f"Invalid JSON on line {line_number}: {e}"
+        records += 1
+        if len(preview) < NDJSON_PREVIEW_RECORDS:
+            preview.append(record)
+    
+    if records == 0:
+        return None, "No NDJSON records received"
+    return {
+        "format": "ndjson",
+        "records": records,
+        "sha256": hasher.hexdigest(),
+        "size": size,
+        "preview_records": preview,
+        "preview": payload_preview(head),
+    }, None
+
 @app.route('/api/receive', methods=['POST'])
 def receive_data():
-    """GPTsアクションからのデータを受信"""
+    """GPTsアクションからのデータを受信（application/json または NDJSON）"""
     try:
+        echo = request.args.get('echo', '1' if RECEIVE_ECHO else '0') == '1'
+        
+        # NDJSONはボディ全体を読み込まずに逐次パース
+        if request.mimetype in NDJSON_CONTENT_TYPES:
+            summary, error = receive_ndjson()
+            if error:
+                log_event("receive_data", error=error, status="error")
+                return jsonify({"error": error}), 400
+            
+            save_received_data(summary)
+            log_event("receive_data", data={key: summary[key] for key in ("format", "records", "sha256", "size", "preview")})
+            
+            return jsonify({
+                "status": "success",
+                "message": "Data received and saved",
+                "timestamp": datetime.datetime.now().isoformat(),
+                "records": summary["records"],
+                "sha256": summary["sha256"]
+            }), 200
+        
         # リクエストデータの取得
+        raw = request.get_data(cache=True)
         data = request.get_json()
         
         if data is None:
@@ -216,19 +1533,28 @@ def receive_data():
         # データの保存
         save_received_data(data)
         
-        # ログの記録
-        log_event("receive_data", data=data)
+        # ログにはペイロード全体ではなくダイジェストとプレビューのみ記録
+        digest = hashlib.sha256(raw).hexdigest()
+        log_event("receive_data", data={"sha256": digest, "size": len(raw), "preview": payload_preview(raw)})
         
         # レスポンス
         response_data = {
             "status": "success",
             "message": "Data received and saved",
             "timestamp": datetime.datetime.now().isoformat(),
-            "received_data": data
+            "sha256": digest
         }
+        if echo:
+            response_data["received_data"] = data
         
         return jsonify(response_data), 200
         
+    except HTTPException as e:
+        # ストリーム読み込み中の413（サイズ超過）などはそのままのステータスで返す
+        log_event("receive_data", error=e.description, status="error")
+        if e.code == 413:
+            return payload_too_large(e)
+        return jsonify({"error": e.description}), e.code
     except Exception as e:
         error_msg = str(e)
         log_event("receive_data", error=error_msg, status="error")
@@ -251,7 +1577,8 @@ def save_conversation():
             return jsonify({"error": "user_input and conversation_summary are required"}), 400
         
         # 会話データの保存
-        save_conversation_data(data)
+        conversation_entry = save_conversation_data(data)
+        event_broker.publish(current_tenant_id(), "conversation", redact_log_value(conversation_entry))
         
         # ログの記録
         log_event("save_conversation", data=data)
@@ -271,6 +1598,64 @@ def save_conversation():
         log_event("save_conversation", error=error_msg, status="error")
         return jsonify({"error": error_msg}), 500
 
+def store_workout(data):
+    """1日分のワークアウト（date, day_of_week, facility, exercises）を保存する（同日のセッションには追記）
+
+    (セッションID, 重複として挿入しなかった件数) を返す。
+    """
+    # セッションを作成または取得
+    session_date = datetime.datetime.strptime(data['date'], '%Y-%m-%d').date()
+    
+    # 同日セッションの重複作成を防ぐため upsert でIDを取得
+    session_id = upsert_session_by_date(session_date, data.get('day_of_week'), data.get('facility'))
+    
+    # エクササイズデータを保存（1文でまとめて挿入）
+    rows = []
+    occurrences = {}
+    created_at = datetime.datetime.utcnow()
+    for exercise in data['exercises']:
+        content_hash = None
+        if DEDUP_ON_INGEST:
+            # 同じリクエスト内の同じ内容は別のセットとして n 番目を区別する
+            content_key = exercise_content_key(exercise)
+            occurrences[content_key] = occurrences.get(content_key, -1) + 1
+            content_hash = exercise_content_hash(content_key, occurrences[content_key])
+        rows.append({
+            'tenant_id': current_tenant_id(),
+            'session_id': session_id,
+            'session_date': session_date,
+            'exercise_name': exercise.get('name'),
+            'exercise_category': exercise.get('category'),
+            'weight': exercise.get('weight'),
+            'reps': exercise.get('reps'),
+            'rest_pause_reps': exercise.get('rest_pause_reps', 0),
+            'sets': exercise.get('sets'),
+            'target_muscle': exercise.get('target_muscle'),
+            'notes': exercise.get('notes'),
+            'content_hash': content_hash,
+            'created_at': created_at,
+        })
+    
+    stmt = dialect_insert(WorkoutLog).values(rows)
+    if DEDUP_ON_INGEST:
+        # 同じセッションに同じ内容が既にあれば（GPTsの再試行など）挿入しない
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=[WorkoutLog.tenant_id, WorkoutLog.session_id, WorkoutLog.session_date, WorkoutLog.content_hash],
+            index_where=db.and_(WorkoutLog.deleted_at.is_(None), WorkoutLog.content_hash.isnot(None))
+        )
+    exercise_ids = db.session.execute(stmt.returning(WorkoutLog.id)).scalars().all()
+    record_changes('session', [session_id])
+    record_changes('exercise', exercise_ids)
+    refresh_calendar_days([session_date])
+    db.session.commit()
+    
+    event_broker.publish(current_tenant_id(), "workout", {
+        "session_id": session_id,
+        "date": data['date'],
+        "exercises": [exercise.get('name') for exercise in data['exercises']][:LOG_MAX_ITEMS]
+    })
+    return session_id, len(rows) - len(exercise_ids)
+
 @app.route('/api/workout', methods=['POST'])
 def save_workout():
     """筋トレログを受信・保存"""
@@ -287,46 +1672,21 @@ def save_workout():
             log_event("save_workout", error="Missing required fields", status="error")
             return jsonify({"error": "date and exercises are required"}), 400
         
-        # セッションを作成または取得
-        session_date = datetime.datetime.strptime(data['date'], '%Y-%m-%d').date()
-        
-        session = WorkoutSession.query.filter_by(date=session_date).first()
-        if not session:
-            session = WorkoutSession(
-                date=session_date,
-                day_of_week=data.get('day_of_week'),
-                facility=data.get('facility')
-            )
-            db.session.add(session)
-            db.session.flush()  # IDを取得するため
-        
-        # エクササイズデータを保存
-        for exercise in data['exercises']:
-            workout_log = WorkoutLog(
-                session_id=session.id,
-                exercise_name=exercise.get('name'),
-                exercise_category=exercise.get('category'),
-                weight=exercise.get('weight'),
-                reps=exercise.get('reps'),
-                rest_pause_reps=exercise.get('rest_pause_reps', 0),
-                sets=exercise.get('sets'),
-                target_muscle=exercise.get('target_muscle'),
-                notes=exercise.get('notes')
-            )
-            db.session.add(workout_log)
-        
-        db.session.commit()
+        session_id, duplicates_skipped = store_workout(data)
         
         # ログの記録
-        log_event("save_workout", data={"session_id": session.id, "exercises_count": len(data['exercises'])})
+        log_event("save_workout", data={
+            "session_id": session_id, "exercises_count": len(data['exercises']), "duplicates_skipped": duplicates_skipped
+        })
         
         # レスポンス
         response_data = {
             "status": "success",
             "message": "Workout data saved successfully",
-            "session_id": session.id,
+            "session_id": session_id,
             "date": data['date'],
             "exercises_count": len(data['exercises']),
+            "duplicates_skipped": duplicates_skipped,
             "timestamp": datetime.datetime.now().isoformat()
         }
         
@@ -338,44 +1698,472 @@ def save_workout():
         log_event("save_workout", error=error_msg, status="error")
         return jsonify({"error": error_msg}), 500
 
+# 略記テキストのワークアウト解析（例: "ベンチプレス 80kg×8 3set +RP3"）
+# GPTsが exercises 配列を組み立てられない場合に、サーバー側で WorkoutLog の項目に変換する
+# 種目の正式名 → (種目カテゴリ, 対象筋肉, 別名)
+EXERCISE_CATALOG = {
+    'ベンチプレス': ('フリーウェイト', '大胸筋', ('ベンチ', 'bp', 'bench press')),
+    'インクラインベンチプレス': ('フリーウェイト', '大胸筋上部', ('インクラインベンチ', 'インクラインbp')),
+    'ダンベルベンチプレス': ('ダンベル', '大胸筋中部', ('dbベンチ', 'dbベンチプレス', 'ダンベルプレス')),
+    'インクラインダンベルプレス': ('ダンベル', '大胸筋上部', ('インクラインdbプレス', 'インクラインチェストプレス')),
+    'ダンベルフライ': ('ダンベル', '大胸筋内側', ('dbフライ', 'フライ')),
+    'チェストプレス': ('マシン', '大胸筋中部', ()),
+    'プッシュアップ': ('自重', '大胸筋・三頭筋', ('腕立て', '腕立て伏せ', 'push up')),
+    'スクワット': ('フリーウェイト', '大腿四頭筋・臀筋', ('sq', 'squat', 'バーベルスクワット')),
+    'レッグプレス': ('マシン', '大腿四頭筋・臀筋', ()),
+    'レッグエクステンション': ('マシン', '大腿四頭筋', ('レッグエクステ',)),
+    'レッグカール': ('マシン', 'ハムストリングス', ()),
+    'デッドリフト': ('フリーウェイト', '脊柱起立筋・ハムストリングス', ('デッド', 'dl', 'deadlift')),
+    'ラットプルダウン': ('マシン', '広背筋', ('ラットプル', 'lat pulldown')),
+    'ベントオーバーロウ': ('フリーウェイト', '広背筋・僧帽筋', ('ベントロウ', 'バーベルロウ')),
+    'ワンハンドロウ': ('ダンベル', '広背筋', ('ダンベルロウ', 'dbロウ')),
+    '懸垂': ('自重', '広背筋', ('チンニング', 'プルアップ', 'chin up', 'pull up')),
+    'ショルダープレス': ('ダンベル', '三角筋前部', ('sp', 'ダンベルショルダープレス')),
+    'サイドレイズ': ('ダンベル', '三角筋中部', ('ラテラルレイズ',)),
+    'リアレイズ': ('ダンベル', '三角筋後部', ()),
+    'アームカール': ('ダンベル', '上腕二頭筋', ('カール', 'ダンベルカール')),
+    'トライセプスエクステンション': ('ダンベル', '上腕三頭筋', ('フレンチプレス', 'トライセプス')),
+    'ディップス': ('自重', '大胸筋下部・三頭筋', ('ディップ',)),
+    'クランチ': ('自重', '腹直筋', ('腹筋',)),
+    'プランク': ('自重', '体幹', ()),
+}
+# 辞書にない種目は名前に含まれる語からカテゴリを推定する
+EXERCISE_CATEGORY_KEYWORDS = (
+    ('ダンベル', 'ダンベル'), ('db', 'ダンベル'), ('バーベル', 'フリーウェイト'),
+    ('マシン', 'マシン'), ('スミス', 'マシン'), ('ケーブル', 'ケーブル'),
+)
+# 1リクエストで解析できる最大行数
+MAX_PARSE_LINES = 500
+
+def exercise_alias_key(name):
+    """種目名の照合キー（全角半角・大文字小文字・空白の違いを無視）"""
+    return re.sub(r'\s+', '', unicodedata.normalize('NFKC', name or '')).casefold()
+
+# 別名（正式名を含む）の照合キー → (正式名, 種目カテゴリ, 対象筋肉)
+EXERCISE_ALIASES = {
+    exercise_alias_key(alias): (name, category, target_muscle)
+    for name, (category, target_muscle, aliases) in EXERCISE_CATALOG.items()
+    for alias in (name,) + aliases
+}
+
+# 重量×回数(×セット数)。単位が省略された場合も重量とみなす（自重種目は回数×セット数）
+LOAD_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(kg|lbs?)?\s*[×xX*]\s*(\d+)(?:\s*[×xX*]\s*(\d+))?', re.IGNORECASE)
+WEIGHT_ONLY_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(kg|lbs?)(?![a-z])', re.IGNORECASE)
+REPS_PATTERN = re.compile(r'(\d+)\s*(?:回|reps?|レップ)', re.IGNORECASE)
+SETS_PATTERN = re.compile(r'(\d+)\s*(?:sets?|セット)', re.IGNORECASE)
+REST_PAUSE_PATTERN = re.compile(r'\+?\s*(?:rp|レストポーズ|レストレップ)\s*(\d+)', re.IGNORECASE)
+BODYWEIGHT_PATTERN = re.compile(r'自重')
+# 種目名は最初の重量・回数・セット数・RP・「自重」の記述の手前まで
+# （"レッグプレス2"、"21s カール" のように名前に数字を含む場合があるため、数字だけでは区切らない）
+NAME_END_PATTERNS = (LOAD_PATTERN, WEIGHT_ONLY_PATTERN, REPS_PATTERN, SETS_PATTERN, REST_PAUSE_PATTERN, BODYWEIGHT_PATTERN)
+NOTES_PATTERN = re.compile(r'\s*[#※]\s*(.*)$')
+LINE_SPLIT_PATTERN = re.compile(r'[\n;]+')
+
+_parse_cache = {}
+
+def parse_exercise_line(line):
+    """略記1行をエクササイズの辞書（APIのキー）に変換。解釈できない場合は ValueError"""
+    cached = _parse_cache.get(line)
+    if cached is not None:
+        return dict(cached)
+    
+    text = unicodedata.normalize('NFKC', line).strip()
+    notes = None
+    match = NOTES_PATTERN.search(text)
+    if match:
+        notes = match.group(1).strip() or None
+        text = text[:match.start()]
+    
+    name_end = min((match.start() for match in (pattern.search(text) for pattern in NAME_END_PATTERNS) if match),
+                   default=len(text))
+    # 以降の記述は名前の後ろだけから読み取る（名前の中の数字を重量・回数にしない）
+    name, text = text[:name_end].strip(' \t:：-・,、'), text[name_end:]
+    if not name:
+        raise ValueError("種目名がありません")
+    key = exercise_alias_key(name)
+    canonical = EXERCISE_ALIASES.get(key)
+    if canonical:
+        name, category, target_muscle = canonical
+    else:
+        category = next((value for keyword, value in EXERCISE_CATEGORY_KEYWORDS if keyword in key), None)
+        target_muscle = None
+    bodyweight = category == '自重' or BODYWEIGHT_PATTERN.search(text) is not None
+    
+    weight = reps = sets = None
+    explicit_reps = REPS_PATTERN.search(text)
+    load = LOAD_PATTERN.search(text)
+    if load:
+        number, unit, second, third = load.groups()
+        if not unit and (bodyweight or WEIGHT_ONLY_PATTERN.search(text, 0, load.start())):
+            # 自重種目の "10×3" や、重量を先に書いた "100kg 5×5" は回数×セット数
+            reps, sets = int(number), int(second)
+        elif explicit_reps and not third:
+            # "10kg×2 12回" はダンベル2個の重量
+            weight = f"{number}{unit or 'kg'}×{second}"
+        else:
+            weight = f"{number}{unit or 'kg'}"
+            reps = int(second)
+            sets = int(third) if third else None
+    if weight is None:
+        match = WEIGHT_ONLY_PATTERN.search(text)
+        if match:
+            weight = f"{match.group(1)}{match.group(2)}"
+    if explicit_reps and reps is None:
+        reps = int(explicit_reps.group(1))
+    match = SETS_PATTERN.search(text)
+    if match:
+        sets = int(match.group(1))
+    match = REST_PAUSE_PATTERN.search(text)
+    rest_pause_reps = int(match.group(1)) if match else 0
+    if weight is None and bodyweight:
+        weight = '自重'
+    if reps is None:
+        raise ValueError("回数を解釈できません（例: 80kg×8、12回）")
+    
+    exercise = {
+        'name': name[:200],
+        'category': category,
+        'weight': weight,
+        'reps': reps,
+        'rest_pause_reps': rest_pause_reps,
+        'sets': sets or 1,
+        'target_muscle': target_muscle,
+        'notes': notes,
+    }
+    if len(_parse_cache) < 10000:
+        _parse_cache[line] = exercise
+    return dict(exercise)
+
+def parse_workout_text(text):
+    """複数行（改行・; 区切り）の略記を解析し、(エクササイズのリスト, 解釈できなかった行のエラー) を返す"""
+    exercises = []
+    errors = []
+    lines = [line for line in LINE_SPLIT_PATTERN.split(text or '') if line.strip()]
+    if len(lines) > MAX_PARSE_LINES:
+        raise ValueError(f"too many lines (max {MAX_PARSE_LINES})")
+    for index, line in enumerate(lines, 1):
+        try:
+            exercises.append(parse_exercise_line(line))
+        except ValueError as e:
+            errors.append({"line": index, "text": line.strip(), "error": str(e)})
+    return exercises, errors
+
+@app.route('/api/workout/parse', methods=['POST'])
+def parse_workout():
+    """略記テキストをエクササイズの配列に変換（保存はしない。texts で複数テキストを一括解析）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if isinstance(data.get('texts'), list):
+            texts = data['texts']
+            if len(texts) > MAX_BATCH_SIZE:
+                return jsonify({"error": f"Too many texts (max {MAX_BATCH_SIZE})"}), 400
+            results = []
+            for text in texts:
+                exercises, errors = parse_workout_text(text if isinstance(text, str) else '')
+                results.append({"exercises": exercises, "errors": errors})
+            log_event("parse_workout", data={"texts": len(texts), "errors": sum(len(result['errors']) for result in results)})
+            return jsonify({"results": results, "count": len(results)})
+        
+        if not isinstance(data.get('text'), str) or not data['text'].strip():
+            return jsonify({"error": "text or texts is required"}), 400
+        exercises, errors = parse_workout_text(data['text'])
+        log_event("parse_workout", data={"exercises_count": len(exercises), "errors": len(errors)})
+        return jsonify({"exercises": exercises, "errors": errors})
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        error_msg = str(e)
+        log_event("parse_workout", error=error_msg, status="error")
+        return jsonify({"error": error_msg}), 500
+
+@app.route('/api/workout/text', methods=['POST'])
+def save_workout_text():
+    """略記テキストを解析して保存（解釈できない行があれば何も保存せず、行ごとのエラーを返す）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get('date') or not isinstance(data.get('text'), str) or not data['text'].strip():
+            log_event("save_workout_text", error="Missing required fields", status="error")
+            return jsonify({"error": "date and text are required"}), 400
+        
+        exercises, errors = parse_workout_text(data['text'])
+        if errors or not exercises:
+            log_event("save_workout_text", error="Unparsed lines", data={"errors": errors[:LOG_MAX_ITEMS]}, status="error")
+            return jsonify({"error": "Some lines could not be parsed", "details": errors, "exercises": exercises}), 400
+        
+        session_id, duplicates_skipped = store_workout(dict(data, exercises=exercises))
+        log_event("save_workout_text", data={
+            "session_id": session_id, "exercises_count": len(exercises), "duplicates_skipped": duplicates_skipped
+        })
+        
+        return jsonify({
+            "status": "success",
+            "message": "Workout data saved successfully",
+            "session_id": session_id,
+            "date": data['date'],
+            "exercises_count": len(exercises),
+            "duplicates_skipped": duplicates_skipped,
+            "exercises": exercises,
+            "timestamp": datetime.datetime.now().isoformat()
+        }), 200
+    
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        error_msg = str(e)
+        log_event("save_workout_text", error=error_msg, status="error")
+        return jsonify({"error": error_msg}), 500
+
+@app.cli.command('bench-parse')
+@click.option('--lines', 'line_count', default=10000, show_default=True, help='解析する行数')
+def bench_parse_command(line_count):
+    """略記テキスト解析のスループット（初回・キャッシュ済み・複数行の一括解析）を計測"""
+    templates = (
+        'ベンチプレス {w}kg×{r} {s}set +RP3', 'スクワット {w}kg {r}x{s}', '懸垂 {r}×{s}',
+        'ダンベルカール {d}kg×2 {r}回 {s}セット # フォーム重視', 'ＤＢベンチ　{d}ｋｇ×{r}　{s}セット',
+        'ケーブルクロスオーバー {d}kg {r}回', 'デッド {w}×{r}×{s}',
+    )
+    lines = [
+        # 末尾のメモで全行を別の文字列にし、初回はキャッシュに当たらないようにする
+        templates[i % len(templates)].format(w=40 + i % 120, d=4 + i % 30, r=1 + i % 15, s=1 + i % 5) + f" ※{i}"
+        for i in range(line_count)
+    ]
+    
+    def measure(label, parse_all):
+        started = time.perf_counter()
+        parsed, failed = parse_all()
+        elapsed = time.perf_counter() - started
+        print(f"{label:28} {elapsed * 1000:9.1f} ms  {elapsed / line_count * 1e6:7.2f} us/line  "
+              f"{line_count / elapsed:10.0f} lines/s  parsed={parsed} failed={failed}")
+    
+    def parse_lines():
+        failed = 0
+        for line in lines:
+            try:
+                parse_exercise_line(line)
+            except ValueError:
+                failed += 1
+        return line_count - failed, failed
+    
+    def parse_texts():
+        parsed = failed = 0
+        for start in range(0, line_count, 20):
+            exercises, errors = parse_workout_text('\n'.join(lines[start:start + 20]))
+            parsed += len(exercises)
+            failed += len(errors)
+        return parsed, failed
+    
+    _parse_cache.clear()
+    measure('cold (per line)', parse_lines)
+    measure('cached (per line)', parse_lines)
+    _parse_cache.clear()
+    measure('cold (20-line texts)', parse_texts)
+
+# エクササイズの重複検出と統合（GPTsの再試行などで同じ内容が同じセッションに追記された行）
+# 有効にすると受信時に同じセッション・同じ内容の行を挿入しない（一意インデックス uq_workout_logs_live_content で判定）
+DEDUP_ON_INGEST = os.environ.get('DEDUP_ON_INGEST') == '1'
+
+def exercise_content_key(exercise):
+    """重複判定用に正規化したエクササイズの内容（種目名は別名辞書で正式名に揃える）
+
+    1行1セットで記録し、同じ重量・回数のセットをメモで区別する使い方があるためメモも含める。
+    """
+    name_key = exercise_alias_key(exercise.get('name'))
+    canonical = EXERCISE_ALIASES.get(name_key)
+    if canonical:
+        name_key = exercise_alias_key(canonical[0])
+    return (
+        name_key,
+        exercise_alias_key(str(exercise.get('weight') or '')),
+        exercise.get('reps'),
+        exercise.get('sets'),
+        exercise.get('rest_pause_reps') or 0,
+        (exercise.get('notes') or '').strip(),
+    )
+
+def exercise_content_hash(content_key, occurrence=0):
+    """正規化した内容（と同じリクエスト内での出現順）のハッシュ"""
+    key = json.dumps([*content_key, occurrence], ensure_ascii=False, default=str)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:32]
+
+def find_duplicate_exercises(tenant_id, start_date=None, end_date=None, session_ids=None):
+    """セッションごとに内容が同じ有効なエクササイズを検出し、(重複行, 残す行のID) のリストを返す
+
+    行を1回走査して内容のキーを辞書で引くだけなのでO(n)。各セッションで最も古い（IDが小さい）行を残す。
+    同じリクエストで保存した行（created_at が同じ）の同じ内容は別のセットとして出現順で区別する。
+    """
+    query = db.session.query(
+        WorkoutLog.id, WorkoutLog.session_id, WorkoutLog.session_date, WorkoutLog.exercise_name, WorkoutLog.weight,
+        WorkoutLog.reps, WorkoutLog.sets, WorkoutLog.rest_pause_reps, WorkoutLog.notes, WorkoutLog.created_at
+    ).filter(WorkoutLog.tenant_id == tenant_id)
+    if start_date:
+        query = query.filter(WorkoutLog.session_date >= start_date)
+    if end_date:
+        query = query.filter(WorkoutLog.session_date <= end_date)
+    if session_ids:
+        query = query.filter(WorkoutLog.session_id.in_(session_ids))
+    
+    occurrences = {}
+    first_ids = {}
+    duplicates = []
+    for row in query.order_by(WorkoutLog.id):
+        content_key = exercise_content_key({
+            'name': row.exercise_name, 'weight': row.weight, 'reps': row.reps, 'sets': row.sets,
+            'rest_pause_reps': row.rest_pause_reps, 'notes': row.notes,
+        })
+        batch_key = (row.session_id, row.created_at, content_key)
+        occurrences[batch_key] = occurrences.get(batch_key, -1) + 1
+        keep_id = first_ids.setdefault((row.session_id, content_key, occurrences[batch_key]), row.id)
+        if keep_id != row.id:
+            duplicates.append((row, keep_id))
+    return duplicates
+
+def duplicate_report(duplicates):
+    """重複行をセッションごとにまとめたレスポンス"""
+    sessions = {}
+    for row, keep_id in duplicates:
+        session = sessions.setdefault(row.session_id, {
+            "session_id": row.session_id, "date": row.session_date.isoformat() if row.session_date else None, "duplicates": []
+        })
+        session["duplicates"].append({
+            "id": row.id,
+            "duplicate_of": keep_id,
+            "name": row.exercise_name,
+            "weight": row.weight,
+            "reps": row.reps,
+            "sets": row.sets,
+            "rest_pause_reps": row.rest_pause_reps,
+            "notes": row.notes,
+        })
+    return {"duplicate_count": len(duplicates), "sessions": list(sessions.values())}
+
+def parse_dedup_range(source):
+    """start_date / end_date（YYYY-MM-DD）を日付に変換（不正な場合は ValueError）"""
+    return tuple(
+        datetime.date.fromisoformat(source[key]) if source.get(key) else None
+        for key in ('start_date', 'end_date')
+    )
+
+def merge_duplicate_exercises(tenant_id, duplicates):
+    """重複行をゴミ箱に移動し（残す行のIDを監査履歴に記録）、移動したIDを返す"""
+    if not duplicates:
+        return []
+    keep_ids = {row.id: keep_id for row, keep_id in duplicates}
+    deleted_at = datetime.datetime.utcnow()
+    deleted_ids = soft_delete_exercises(WorkoutLog.id.in_(list(keep_ids)), deleted_at, tenant_id)
+    session_ids = {row.session_id for row, _ in duplicates}
+    bump_session_versions(session_ids, tenant_id)
+    record_changes('exercise', deleted_ids, op='delete', tenant_id=tenant_id)
+    record_audit('exercise', 'delete', [
+        (exercise_id, {"deleted_at": None}, {"deleted_at": deleted_at, "duplicate_of": keep_ids[exercise_id]})
+        for exercise_id in deleted_ids
+    ], tenant_id=tenant_id)
+    refresh_calendar_for_sessions(session_ids, tenant_id)
+    return sorted(deleted_ids)
+
+@app.route('/api/workout/duplicates', methods=['GET'])
+@read_replica
+def get_duplicate_exercises():
+    """重複しているエクササイズの一覧（統合前の確認用。何も変更しない）"""
+    try:
+        try:
+            start_date, end_date = parse_dedup_range(request.args)
+        except ValueError:
+            return jsonify({"error": "start_date and end_date must be YYYY-MM-DD"}), 400
+        duplicates = find_duplicate_exercises(current_tenant_id(), start_date, end_date)
+        return jsonify(duplicate_report(duplicates)), 200
+    except Exception as e:
+        error_msg = str(e)
+        log_event("get_duplicate_exercises", error=error_msg, status="error")
+        return jsonify({"error": error_msg}), 500
+
+@app.route('/api/workout/duplicates/merge', methods=['POST'])
+def merge_duplicates():
+    """重複しているエクササイズを統合（古い行を残し、他はゴミ箱へ。exercise_ids で対象を限定、dry_run で確認のみ）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            start_date, end_date = parse_dedup_range(data)
+        except (ValueError, TypeError):
+            return jsonify({"error": "start_date and end_date must be YYYY-MM-DD"}), 400
+        exercise_ids = None
+        if data.get('exercise_ids') is not None:
+            exercise_ids = parse_exercise_ids(data['exercise_ids'])
+            if exercise_ids is None:
+                return jsonify({"error": f"exercise_ids must be a list of 1-{MAX_BATCH_SIZE} unique integers"}), 400
+        
+        duplicates = find_duplicate_exercises(current_tenant_id(), start_date, end_date)
+        if exercise_ids is not None:
+            selected = set(exercise_ids)
+            duplicates = [(row, keep_id) for row, keep_id in duplicates if row.id in selected]
+        report = duplicate_report(duplicates)
+        if data.get('dry_run'):
+            return jsonify(dict(report, status="dry_run", merged=0)), 200
+        
+        merged_ids = merge_duplicate_exercises(current_tenant_id(), duplicates)
+        db.session.commit()
+        log_event("merge_duplicates", data={"count": len(merged_ids), "exercise_ids": merged_ids[:LOG_MAX_ITEMS]})
+        return jsonify(dict(report, status="success", merged=len(merged_ids), exercise_ids=merged_ids)), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        error_msg = str(e)
+        log_event("merge_duplicates", error=error_msg, status="error")
+        return jsonify({"error": error_msg}), 500
+
+@app.cli.command('dedup-exercises')
+@click.option('--tenant', 'tenant_id', default=None, help='対象テナント（省略時は全テナント）')
+@click.option('--merge', is_flag=True, help='重複行をゴミ箱に移動する（省略時は件数の表示のみ）')
+def dedup_exercises_command(tenant_id, merge):
+    """テナントごとに重複しているエクササイズを検出し、--merge で統合（古い行を残す）"""
+    tenant_ids = [tenant_id] if tenant_id else [row[0] for row in db.session.query(WorkoutLog.tenant_id).distinct()]
+    for row_tenant in tenant_ids:
+        started = time.perf_counter()
+        duplicates = find_duplicate_exercises(row_tenant)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        sessions = len({row.session_id for row, _ in duplicates})
+        print(f"tenant={row_tenant} duplicates={len(duplicates)} sessions={sessions} scan={elapsed_ms:.1f}ms")
+        if merge and duplicates:
+            merged_ids = merge_duplicate_exercises(row_tenant, duplicates)
+            db.session.commit()
+            print(f"  moved {len(merged_ids)} exercise(s) to the trash")
+
 @app.route('/api/workout/<int:session_id>', methods=['GET'])
 def get_workout_session(session_id):
     """特定のワークアウトセッションを取得"""
     try:
-        session = WorkoutSession.query.get_or_404(session_id)
-        
-        session_data = {
-            'id': session.id,
-            'date': session.date.strftime('%Y-%m-%d'),
-            'day_of_week': session.day_of_week,
-            'facility': session.facility,
-            'exercises': []
-        }
+        # ETagはセッションのバージョン（If-Match の楽観的排他制御と共通）
+        version = db.session.query(WorkoutSession.version).filter_by(id=session_id, tenant_id=current_tenant_id()).scalar()
+        if version is not None:
+            response = not_modified(str(version))
+            if response is not None:
+                return response
         
-        for log in session.workout_logs:
-            exercise_data = {
-                'id': log.id,
-                'name': log.exercise_name,
-                'category': log.exercise_category,
-                'weight': log.weight,
-                'reps': log.reps,
-                'rest_pause_reps': log.rest_pause_reps,
-                'sets': log.sets,
-                'target_muscle': log.target_muscle,
-                'notes': log.notes
-            }
-            session_data['exercises'].append(exercise_data)
+        sessions_data = fetch_sessions_data([session_id])
+        if not sessions_data:
+            return jsonify({"error": "Workout session not found"}), 404
         
-        return jsonify(session_data), 200
+        response = jsonify(sessions_data[0])
+        response.set_etag(str(sessions_data[0]['version']))
+        response.headers['Cache-Control'] = CACHE_CONTROL_PRIVATE
+        return response, 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/workout/<int:session_id>', methods=['DELETE'])
 def delete_workout_session(session_id):
-    """ワークアウトセッションを削除"""
+    """ワークアウトセッションをゴミ箱に移動（配下のエクササイズも含む）"""
     try:
-        session = WorkoutSession.query.get_or_404(session_id)
+        # except で捕捉されないよう abort(404) ではなくレスポンスを返す
+        session = WorkoutSession.query.filter_by(id=session_id, tenant_id=current_tenant_id()).first()
+        if session is None:
+            return jsonify({"error": "Workout session not found"}), 404
+        
+        if version_mismatch(session.version):
+            return jsonify({"error": "Version mismatch", "current_version": session.version}), 412
         
         # セッション情報をログに記録
         log_event("delete_workout_session", data={
@@ -384,7 +2172,16 @@ def delete_workout_session(session_id):
             "exercises_count": len(session.workout_logs)
         })
         
-        db.session.delete(session)
+        session_date = session.date
+        # 配下のエクササイズも同じ日時で論理削除する（セッションの復元時にまとめて戻す）
+        deleted_at = datetime.datetime.utcnow()
+        exercise_ids = soft_delete_exercises(WorkoutLog.session_id == session_id, deleted_at)
+        session.deleted_at = deleted_at
+        session.version += 1
+        record_changes('exercise', exercise_ids, op='delete')
+        record_changes('session', [session_id], op='delete')
+        record_audit('session', 'delete', [(session_id, {"deleted_at": None}, {"deleted_at": deleted_at})])
+        refresh_calendar_days([session_date])
         db.session.commit()
         
         return jsonify({
@@ -403,39 +2200,54 @@ def delete_workout_session(session_id):
 def update_exercise(exercise_id):
     """個別エクササイズを更新"""
     try:
-        exercise = WorkoutLog.query.get_or_404(exercise_id)
         data = request.get_json()
         
         if data is None:
             return jsonify({"error": "No JSON data received"}), 400
         
-        # フィールドを更新
-        if 'name' in data:
-            exercise.exercise_name = data['name']
-        if 'category' in data:
-            exercise.exercise_category = data['category']
-        if 'weight' in data:
-            exercise.weight = data['weight']
-        if 'reps' in data:
-            exercise.reps = data['reps']
-        if 'rest_pause_reps' in data:
-            exercise.rest_pause_reps = data['rest_pause_reps']
-        if 'sets' in data:
-            exercise.sets = data['sets']
-        if 'target_muscle' in data:
-            exercise.target_muscle = data['target_muscle']
-        if 'notes' in data:
-            exercise.notes = data['notes']
+        changes = {key: data[key] for key in EXERCISE_UPDATE_COLUMNS if key in data}
+        values = {EXERCISE_UPDATE_COLUMNS[key]: value for key, value in changes.items()}
+        
+        # 監査履歴用に変更前の値を行ロックして取得
+        before = db.session.query(
+            WorkoutLog.version, *[getattr(WorkoutLog, attribute) for attribute in values]
+        ).filter(
+            WorkoutLog.id == exercise_id, WorkoutLog.tenant_id == current_tenant_id()
+        ).with_for_update().first()
+        if before is None:
+            db.session.rollback()
+            return jsonify({"error": "Exercise not found"}), 404
+        if version_mismatch(before.version, data):
+            db.session.rollback()
+            return jsonify({"error": "Version mismatch", "current_version": before.version}), 412
         
+        # 読み取り後に他の書き込みがあった場合も更新しないよう、読み取ったバージョンを条件にする
+        row = db.session.execute(
+            db.update(WorkoutLog).where(
+                WorkoutLog.id == exercise_id, WorkoutLog.version == before.version
+            ).values(**values, content_hash=None, version=WorkoutLog.version + 1).returning(WorkoutLog.version, WorkoutLog.session_id),
+            execution_options={"synchronize_session": False}
+        ).first()
+        if row is None:
+            db.session.rollback()
+            return jsonify({"error": "Version mismatch"}), 412
+        
+        bump_session_versions([row.session_id])
+        record_changes('exercise', [exercise_id])
+        record_audit('exercise', 'update', [(exercise_id, dict(zip(changes, before[1:])), changes)])
+        refresh_calendar_for_sessions([row.session_id])
         db.session.commit()
         
         log_event("update_exercise", data={"exercise_id": exercise_id, "updated_fields": list(data.keys())})
         
-        return jsonify({
+        response = jsonify({
             "status": "success",
             "message": "Exercise updated successfully",
-            "exercise_id": exercise_id
-        }), 200
+            "exercise_id": exercise_id,
+            "version": row.version
+        })
+        response.set_etag(str(row.version))
+        return response, 200
         
     except Exception as e:
         db.session.rollback()
@@ -445,9 +2257,14 @@ def update_exercise(exercise_id):
 
 @app.route('/api/workout/exercise/<int:exercise_id>', methods=['DELETE'])
 def delete_exercise(exercise_id):
-    """個別エクササイズを削除"""
+    """個別エクササイズをゴミ箱に移動"""
     try:
-        exercise = WorkoutLog.query.get_or_404(exercise_id)
+        exercise = WorkoutLog.query.filter_by(id=exercise_id, tenant_id=current_tenant_id()).first()
+        if exercise is None:
+            return jsonify({"error": "Exercise not found"}), 404
+        
+        if version_mismatch(exercise.version):
+            return jsonify({"error": "Version mismatch", "current_version": exercise.version}), 412
         
         log_event("delete_exercise", data={
             "exercise_id": exercise_id,
@@ -455,7 +2272,12 @@ def delete_exercise(exercise_id):
             "session_id": exercise.session_id
         })
         
-        db.session.delete(exercise)
+        deleted_at = datetime.datetime.utcnow()
+        soft_delete_exercises(WorkoutLog.id == exercise_id, deleted_at)
+        bump_session_versions([exercise.session_id])
+        record_changes('exercise', [exercise_id], op='delete')
+        record_audit('exercise', 'delete', [(exercise_id, {"deleted_at": None}, {"deleted_at": deleted_at})])
+        refresh_calendar_for_sessions([exercise.session_id])
         db.session.commit()
         
         return jsonify({
@@ -470,56 +2292,643 @@ def delete_exercise(exercise_id):
         log_event("delete_exercise", error=error_msg, status="error")
         return jsonify({"error": error_msg}), 500
 
-def create_excel_export(start_date=None, end_date=None, exercise_name=None, target_muscle=None):
-    """筋トレログをExcel形式で出力（フィルタ対応）"""
+def parse_exercise_ids(ids):
+    """IDリストを検証して重複を除いた整数リストを返す（不正な場合はNone）"""
+    if not isinstance(ids, list) or not ids or len(ids) > MAX_BATCH_SIZE:
+        return None
+    if not all(isinstance(exercise_id, int) and not isinstance(exercise_id, bool) for exercise_id in ids):
+        return None
+    return list(dict.fromkeys(ids))
+
+def find_missing_exercise_ids(exercise_ids):
+    """存在しない（または他テナントの）エクササイズIDと、対象エクササイズの所属セッションIDを1クエリで取得"""
+    existing = dict(db.session.query(WorkoutLog.id, WorkoutLog.session_id).filter(
+        WorkoutLog.tenant_id == current_tenant_id(),
+        WorkoutLog.id.in_(exercise_ids)
+    ))
+    missing = [exercise_id for exercise_id in exercise_ids if exercise_id not in existing]
+    return missing, set(existing.values())
+
+@app.route('/api/workout/exercises', methods=['PATCH'])
+def batch_update_exercises():
+    """複数エクササイズを一括更新（同じ変更内容ごとに1つのUPDATE文で適用）"""
     try:
-        # クエリを構築
-        query = WorkoutSession.query
+        data = request.get_json()
         
-        # 日付フィルタ
-        if start_date:
-            try:
-                start_date_obj = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
-                query = query.filter(WorkoutSession.date >= start_date_obj)
-            except ValueError:
-                pass
+        if data is None:
+            return jsonify({"error": "No JSON data received"}), 400
+        
+        # ids + changes（同じ変更）または updates（個別の変更）を正規化
+        if 'updates' in data:
+            updates = data['updates']
+            if not isinstance(updates, list) or not all(isinstance(item, dict) for item in updates):
+                return jsonify({"error": "updates must be a list of objects"}), 400
+            exercise_ids = parse_exercise_ids([item.get('id') for item in updates])
+            changes_list = [{key: value for key, value in item.items() if key not in ('id', 'version')} for item in updates]
+            versions = [item.get('version') for item in updates]
+        else:
+            exercise_ids = parse_exercise_ids(data.get('ids'))
+            changes = data.get('changes')
+            if not isinstance(changes, dict):
+                return jsonify({"error": "changes must be an object"}), 400
+            changes_list = [changes] * len(exercise_ids or [])
+            versions = batch_versions(data, exercise_ids or [])
+            if versions is None:
+                return jsonify({"error": "versions must be a list of integers in the same order as ids"}), 400
+        
+        if exercise_ids is None or len(exercise_ids) != len(changes_list):
+            return jsonify({"error": f"ids must be a list of 1-{MAX_BATCH_SIZE} unique integers"}), 400
+        
+        # 変更内容（と期待バージョン）ごとにIDをグループ化
+        groups = {}
+        for exercise_id, changes, version in zip(exercise_ids, changes_list, versions):
+            unknown = set(changes) - set(EXERCISE_UPDATE_COLUMNS)
+            if unknown or not changes:
+                return jsonify({"error": f"Invalid fields for exercise {exercise_id}: {sorted(unknown) or 'no changes'}"}), 400
+            values = {EXERCISE_UPDATE_COLUMNS[key]: value for key, value in changes.items()}
+            group_key = (json.dumps(values, sort_keys=True, ensure_ascii=False), version)
+            groups.setdefault(group_key, (values, version, []))[2].append(exercise_id)
+        
+        missing, session_ids = find_missing_exercise_ids(exercise_ids)
+        if missing:
+            return jsonify({"error": "Exercises not found", "not_found": missing}), 404
+        
+        # 監査履歴用に変更前の値を行ロックして取得
+        updated_fields = sorted({key for changes in changes_list for key in changes})
+        before_rows = {
+            row[0]: dict(zip(updated_fields, row[1:]))
+            for row in db.session.query(
+                WorkoutLog.id, *[getattr(WorkoutLog, EXERCISE_UPDATE_COLUMNS[key]) for key in updated_fields]
+            ).filter(WorkoutLog.id.in_(exercise_ids)).with_for_update()
+        }
+        
+        for values, version, ids in groups.values():
+            stmt = db.update(WorkoutLog).where(WorkoutLog.id.in_(ids))
+            if version is not None:
+                stmt = stmt.where(WorkoutLog.version == version)
+            result = db.session.execute(
+                stmt.values(**values, content_hash=None, version=WorkoutLog.version + 1),
+                execution_options={"synchronize_session": False}
+            )
+            # バージョン不一致が1件でもあれば全体を取り消す
+            if result.rowcount != len(ids):
+                db.session.rollback()
+                return jsonify({"error": "Version mismatch", "exercise_ids": ids}), 412
+        bump_session_versions(session_ids)
+        record_changes('exercise', exercise_ids)
+        record_audit('exercise', 'update', [
+            (exercise_id, {key: before_rows[exercise_id][key] for key in changes}, changes)
+            for exercise_id, changes in zip(exercise_ids, changes_list)
+        ])
+        refresh_calendar_for_sessions(session_ids)
+        db.session.commit()
+        
+        log_event("batch_update_exercises", data={
+            "exercise_ids": exercise_ids,
+            "updated_fields": updated_fields,
+            "count": len(exercise_ids)
+        })
+        
+        return jsonify({
+            "status": "success",
+            "message": "Exercises updated successfully",
+            "exercise_ids": exercise_ids,
+            "count": len(exercise_ids)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        error_msg = str(e)
+        log_event("batch_update_exercises", error=error_msg, status="error")
+        return jsonify({"error": error_msg}), 500
+
+@app.route('/api/workout/exercises', methods=['DELETE'])
+def batch_delete_exercises():
+    """複数エクササイズを1つのUPDATE文でまとめてゴミ箱に移動"""
+    try:
+        data = request.get_json()
         
-        if end_date:
+        if data is None:
+            return jsonify({"error": "No JSON data received"}), 400
+        
+        exercise_ids = parse_exercise_ids(data.get('ids'))
+        if exercise_ids is None:
+            return jsonify({"error": f"ids must be a list of 1-{MAX_BATCH_SIZE} integers"}), 400
+        versions = batch_versions(data, exercise_ids)
+        if versions is None:
+            return jsonify({"error": "versions must be a list of integers in the same order as ids"}), 400
+        
+        missing, session_ids = find_missing_exercise_ids(exercise_ids)
+        if missing:
+            return jsonify({"error": "Exercises not found", "not_found": missing}), 404
+        
+        # 期待バージョンごとに1つのUPDATE文で削除する
+        groups = {}
+        for exercise_id, version in zip(exercise_ids, versions):
+            groups.setdefault(version, []).append(exercise_id)
+        deleted_at = datetime.datetime.utcnow()
+        for version, ids in groups.items():
+            condition = WorkoutLog.id.in_(ids)
+            if version is not None:
+                condition = db.and_(condition, WorkoutLog.version == version)
+            # バージョン不一致（または他の削除と競合）が1件でもあれば全体を取り消す
+            if len(soft_delete_exercises(condition, deleted_at)) != len(ids):
+                db.session.rollback()
+                return jsonify({"error": "Version mismatch", "exercise_ids": ids}), 412
+        bump_session_versions(session_ids)
+        record_changes('exercise', exercise_ids, op='delete')
+        record_audit('exercise', 'delete', [
+            (exercise_id, {"deleted_at": None}, {"deleted_at": deleted_at}) for exercise_id in exercise_ids
+        ])
+        refresh_calendar_for_sessions(session_ids)
+        db.session.commit()
+        
+        log_event("batch_delete_exercises", data={
+            "exercise_ids": exercise_ids,
+            "count": len(exercise_ids)
+        })
+        
+        return jsonify({
+            "status": "success",
+            "message": "Exercises deleted successfully",
+            "exercise_ids": exercise_ids,
+            "count": len(exercise_ids)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        error_msg = str(e)
+        log_event("batch_delete_exercises", error=error_msg, status="error")
+        return jsonify({"error": error_msg}), 500
+
+# ゴミ箱（論理削除した行の一覧・復元・保持期間後の完全削除）
+TRASH_RETENTION_DAYS = float(os.environ.get('TRASH_RETENTION_DAYS', 30))
+TRASH_PURGE_INTERVAL_SECONDS = float(os.environ.get('TRASH_PURGE_INTERVAL_SECONDS', 3600))  # 0で定期実行しない
+
+def parse_trash_time(value):
+    """復元の基準日時（2025-06-09 または 2025-06-09T12:00、タイムゾーンなしはUTC）をUTCのnaive datetimeに変換"""
+    parsed = datetime.datetime.fromisoformat(str(value))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def list_trash(tenant_id, limit=MAX_BATCH_SIZE):
+    """ゴミ箱のセッション（配下のエクササイズ数付き）と、個別に削除したエクササイズを新しい順に返す"""
+    include_deleted = {"include_deleted": True}
+    sessions = db.session.query(
+        WorkoutSession.id, WorkoutSession.date, WorkoutSession.facility, WorkoutSession.deleted_at,
+        func.count(WorkoutLog.id)
+    ).outerjoin(
+        WorkoutLog, db.and_(WorkoutLog.session_id == WorkoutSession.id, WorkoutLog.deleted_at == WorkoutSession.deleted_at)
+    ).filter(
+        WorkoutSession.tenant_id == tenant_id, WorkoutSession.deleted_at.isnot(None)
+    ).group_by(
+        WorkoutSession.id, WorkoutSession.date, WorkoutSession.facility, WorkoutSession.deleted_at
+    ).order_by(WorkoutSession.deleted_at.desc(), WorkoutSession.id).limit(limit).execution_options(**include_deleted).all()
+    # セッションと一緒に削除されたものはセッション側に含める
+    exercises = db.session.query(
+        WorkoutLog.id, WorkoutLog.session_id, WorkoutSession.date, WorkoutLog.exercise_name, WorkoutLog.deleted_at
+    ).join(
+        WorkoutSession, WorkoutLog.session_id == WorkoutSession.id
+    ).filter(
+        WorkoutLog.tenant_id == tenant_id,
+        WorkoutLog.deleted_at.isnot(None),
+        db.or_(WorkoutSession.deleted_at.is_(None), WorkoutSession.deleted_at != WorkoutLog.deleted_at)
+    ).order_by(WorkoutLog.deleted_at.desc(), WorkoutLog.id).limit(limit).execution_options(**include_deleted).all()
+    
+    purge_after = datetime.timedelta(days=TRASH_RETENTION_DAYS)
+    return {
+        "sessions": [
+            {
+                "id": row[0], "date": row[1].strftime('%Y-%m-%d'), "facility": row[2],
+                "deleted_at": row[3].isoformat(), "purge_at": (row[3] + purge_after).isoformat(),
+                "exercises_count": row[4]
+            }
+            for row in sessions
+        ],
+        "exercises": [
+            {
+                "id": row[0], "session_id": row[1], "date": row[2].strftime('%Y-%m-%d'), "name": row[3],
+                "deleted_at": row[4].isoformat(), "purge_at": (row[4] + purge_after).isoformat()
+            }
+            for row in exercises
+        ],
+        "retention_days": TRASH_RETENTION_DAYS
+    }
+
+def restore_from_trash(tenant_id, session_ids=(), exercise_ids=(), since=None):
+    """ゴミ箱から復元し、(復元したセッションID, エクササイズID, エラーレスポンス) を返す
+
+    since 指定時はその日時以降に削除したものをすべて戻す（その時点の状態への復元）。
+    セッションは一緒に削除されたエクササイズとともに戻し、削除済みセッションのエクササイズを
+    戻す場合はセッションも戻す。同じ日付に有効なセッションがある場合は何も変更しない。
+    """
+    include_deleted = {"include_deleted": True}
+    session_query = db.session.query(WorkoutSession.id, WorkoutSession.date, WorkoutSession.deleted_at).filter(
+        WorkoutSession.tenant_id == tenant_id, WorkoutSession.deleted_at.isnot(None)
+    ).execution_options(**include_deleted)
+    log_query = db.session.query(WorkoutLog.id, WorkoutLog.session_id).filter(
+        WorkoutLog.tenant_id == tenant_id, WorkoutLog.deleted_at.isnot(None)
+    ).execution_options(**include_deleted)
+    
+    if since is not None:
+        sessions = {row[0]: row for row in session_query.filter(WorkoutSession.deleted_at >= since)}
+        logs = dict(log_query.filter(WorkoutLog.deleted_at >= since).all())
+    else:
+        sessions = {row[0]: row for row in session_query.filter(WorkoutSession.id.in_(session_ids))}
+        logs = dict(log_query.filter(WorkoutLog.id.in_(exercise_ids)).all())
+        missing = [session_id for session_id in session_ids if session_id not in sessions]
+        missing_exercises = [exercise_id for exercise_id in exercise_ids if exercise_id not in logs]
+        if missing or missing_exercises:
+            return None, None, (jsonify({
+                "error": "Not found in trash", "not_found": {"sessions": missing, "exercises": missing_exercises}
+            }), 404)
+        # セッションと同じ日時に削除されたエクササイズを一緒に戻す
+        for session_id, _, deleted_at in sessions.values():
+            logs.update(log_query.filter(WorkoutLog.session_id == session_id, WorkoutLog.deleted_at == deleted_at).all())
+    
+    # 削除済みセッションに属するエクササイズはセッションも戻す
+    parent_ids = set(logs.values()) - set(sessions)
+    if parent_ids:
+        sessions.update({row[0]: row for row in session_query.filter(WorkoutSession.id.in_(parent_ids))})
+    
+    # 有効なセッション（または一緒に戻す別のセッション）と日付が重なる場合は復元しない
+    dates = [row[1] for row in sessions.values()]
+    occupied = dict(db.session.query(WorkoutSession.date, WorkoutSession.id).filter(
+        WorkoutSession.tenant_id == tenant_id, WorkoutSession.date.in_(set(dates))
+    ))
+    conflicts = []
+    for session_id, session_date, _ in sorted(sessions.values()):
+        if session_date in occupied:
+            conflicts.append({
+                "session_id": session_id, "date": session_date.strftime('%Y-%m-%d'), "conflicting_session_id": occupied[session_date]
+            })
+        else:
+            occupied[session_date] = session_id
+    if conflicts:
+        return None, None, (jsonify({"error": "Another session already exists on the same date", "conflicts": conflicts}), 409)
+    
+    restored_sessions, restored_exercises = sorted(sessions), sorted(logs)
+    # 復元したエクササイズは受信時の重複排除の対象から外す（削除後に同じ内容が追加されていても復元できるように）
+    for model, ids, values in ((WorkoutSession, restored_sessions, {}), (WorkoutLog, restored_exercises, {'content_hash': None})):
+        if ids:
+            db.session.execute(
+                db.update(model).where(model.id.in_(ids)).values(deleted_at=None, version=model.version + 1, **values),
+                execution_options={"synchronize_session": False}
+            )
+    # 有効なセッションにエクササイズが戻った場合はセッションのバージョンも上げる
+    bump_session_versions(set(logs.values()) - set(sessions))
+    record_changes('session', restored_sessions)
+    record_changes('exercise', restored_exercises)
+    record_audit('session', 'restore', [(row[0], {"deleted_at": row[2]}, {"deleted_at": None}) for row in sessions.values()])
+    record_audit('exercise', 'restore', [(exercise_id, None, {"deleted_at": None}) for exercise_id in restored_exercises])
+    refresh_calendar_days(dates)
+    refresh_calendar_for_sessions(set(logs.values()) - set(sessions))
+    return restored_sessions, restored_exercises, None
+
+def purge_trash(older_than_days=TRASH_RETENTION_DAYS):
+    """保持期間を過ぎたゴミ箱の行を全テナント分完全に削除し、(セッション数, エクササイズ数) を返す"""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+    # エクササイズはセッションと同時か先に削除されているため、先に消せば外部キーに違反しない
+    exercises = db.session.execute(
+        db.delete(WorkoutLog).where(WorkoutLog.deleted_at < cutoff),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    sessions = db.session.execute(
+        db.delete(WorkoutSession).where(
+            WorkoutSession.deleted_at < cutoff,
+            ~db.exists().where(WorkoutLog.session_id == WorkoutSession.id)
+        ),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    db.session.commit()
+    return sessions, exercises
+
+_trash_purger_started = False
+
+def run_trash_purger():
+    """TRASH_PURGE_INTERVAL_SECONDS ごとにゴミ箱を完全削除する（ワーカーごとのデーモンスレッド）"""
+    while True:
+        # ワーカー間で実行時刻をずらす
+        time.sleep(TRASH_PURGE_INTERVAL_SECONDS * random.uniform(0.5, 1.5))
+        with app.app_context():
+            try:
+                sessions, exercises = purge_trash()
+                if sessions or exercises:
+                    log_event("purge_trash", data={"sessions": sessions, "exercises": exercises})
+            except Exception as e:
+                db.session.rollback()
+                log_event("purge_trash", error=str(e), status="error")
+
+@app.before_request
+def start_trash_purger():
+    """最初のリクエストで定期完全削除のスレッドを起動（CLIでは起動しない）"""
+    global _trash_purger_started
+    if _trash_purger_started or TRASH_PURGE_INTERVAL_SECONDS <= 0:
+        return
+    _trash_purger_started = True
+    threading.Thread(target=run_trash_purger, name="trash-purger", daemon=True).start()
+
+@app.route('/api/trash', methods=['GET'])
+def get_trash():
+    """ゴミ箱の一覧（保持期間を過ぎると purge_at 以降に完全削除される）"""
+    try:
+        return jsonify(list_trash(current_tenant_id())), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/trash/restore', methods=['POST'])
+def restore_trash():
+    """ゴミ箱から復元（{"session_ids": [...], "exercise_ids": [...]} または {"since": "2025-06-09T12:00"}）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        since = None
+        if data.get('since'):
             try:
-                end_date_obj = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
-                query = query.filter(WorkoutSession.date <= end_date_obj)
+                since = parse_trash_time(data['since'])
             except ValueError:
-                pass
-        
-        # セッションを取得（日付順）
-        sessions = query.order_by(WorkoutSession.date.asc()).all()
-        
-        # エクササイズ名または筋肉部位でフィルタリング（セッション取得後に適用）
-        if exercise_name or target_muscle:
-            filtered_sessions = []
-            for session in sessions:
-                filtered_exercises = []
-                for exercise in session.workout_logs:
-                    include_exercise = True
-                    
-                    if exercise_name and exercise_name.lower() not in exercise.exercise_name.lower():
-                        include_exercise = False
-                    
-                    if target_muscle and target_muscle.lower() not in (exercise.target_muscle or "").lower():
-                        include_exercise = False
-                    
-                    if include_exercise:
-                        filtered_exercises.append(exercise)
-                
-                # フィルタされたエクササイズがある場合のみセッションを含める
-                if filtered_exercises:
-                    # 一時的にworkout_logsを置換
-                    session._filtered_exercises = filtered_exercises
-                    filtered_sessions.append(session)
-            
-            sessions = filtered_sessions
+                return jsonify({"error": "since must be an ISO date or datetime"}), 400
+            session_ids = exercise_ids = []
+        else:
+            session_ids = parse_exercise_ids(data['session_ids']) if data.get('session_ids') else []
+            exercise_ids = parse_exercise_ids(data['exercise_ids']) if data.get('exercise_ids') else []
+            if session_ids is None or exercise_ids is None or not (session_ids or exercise_ids):
+                return jsonify({"error": f"since, or session_ids/exercise_ids as lists of 1-{MAX_BATCH_SIZE} integers, is required"}), 400
+        
+        restored_sessions, restored_exercises, error = restore_from_trash(current_tenant_id(), session_ids, exercise_ids, since)
+        if error is not None:
+            db.session.rollback()
+            return error
+        db.session.commit()
+        
+        log_event("restore_trash", data={
+            "session_ids": restored_sessions[:LOG_MAX_ITEMS],
+            "exercise_ids": restored_exercises[:LOG_MAX_ITEMS],
+            "since": data.get('since')
+        })
+        return jsonify({
+            "status": "success",
+            "message": "Restored from trash",
+            "session_ids": restored_sessions,
+            "exercise_ids": restored_exercises
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        error_msg = str(e)
+        log_event("restore_trash", error=error_msg, status="error")
+        return jsonify({"error": error_msg}), 500
+
+@app.route('/api/workout/exercise/<int:exercise_id>/history', methods=['GET'])
+def get_exercise_history(exercise_id):
+    """エクササイズの更新・削除・復元の履歴（変更前後の値、古い順）"""
+    try:
+        tenant_id = current_tenant_id()
+        rows = db.session.query(
+            AuditHistory.action, AuditHistory.before, AuditHistory.after, AuditHistory.changed_at
+        ).filter(
+            AuditHistory.tenant_id == tenant_id, AuditHistory.entity == 'exercise', AuditHistory.entity_id == exercise_id
+        ).order_by(AuditHistory.id).all()
+        exists = db.session.query(WorkoutLog.id).filter(
+            WorkoutLog.id == exercise_id, WorkoutLog.tenant_id == tenant_id
+        ).execution_options(include_deleted=True).first() is not None
+        if not rows and not exists:
+            return jsonify({"error": "Exercise not found"}), 404
+        
+        return jsonify({
+            "exercise_id": exercise_id,
+            "history": [
+                {
+                    "action": action,
+                    "before": json.loads(before) if before else None,
+                    "after": json.loads(after) if after else None,
+                    "changed_at": changed_at.isoformat()
+                }
+                for action, before, after, changed_at in rows
+            ]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.cli.command('purge-trash')
+@click.option('--days', default=TRASH_RETENTION_DAYS, show_default=True, type=float, help='この日数より前に削除した行を完全削除')
+def purge_trash_command(days):
+    """ゴミ箱の保持期間を過ぎた行を完全に削除（Webワーカーでも TRASH_PURGE_INTERVAL_SECONDS ごとに実行）"""
+    sessions, exercises = purge_trash(days)
+    print(f"Purged {sessions} sessions and {exercises} exercises deleted more than {days:g} days ago")
+
+# 差分同期（change_log の連番以降の変更だけを返す）
+SYNC_BATCH_SIZE = int(os.environ.get('SYNC_BATCH_SIZE', 500))  # 1レスポンスの変更件数（既定）
+SYNC_MAX_BATCH_SIZE = int(os.environ.get('SYNC_MAX_BATCH_SIZE', 5000))
+
+def collect_changes(tenant_id, since=0, limit=SYNC_BATCH_SIZE):
+    """連番 since より後の変更を最大 limit 件読み、エンティティごとに最新の状態へまとめる
+
+    同じ行への複数の変更は1件にまとめ、更新は現在の行、削除（または既に存在しない行）は
+    IDのみの墓標として返す。コストはデータ量ではなく変更件数に比例する。
+    """
+    changes = db.session.query(ChangeLog.seq, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op).filter(
+        ChangeLog.tenant_id == tenant_id,
+        ChangeLog.seq > since
+    ).order_by(ChangeLog.seq).limit(limit + 1).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    
+    latest = {}
+    for _, entity, entity_id, op in changes:
+        latest[(entity, entity_id)] = op
+    upserted = {'session': [], 'exercise': []}
+    deleted = {'session': set(), 'exercise': set()}
+    for (entity, entity_id), op in latest.items():
+        if op == 'upsert':
+            upserted[entity].append(entity_id)
+        else:
+            deleted[entity].add(entity_id)
+    
+    sessions = []
+    if upserted['session']:
+        for row in db.session.query(
+            WorkoutSession.id, WorkoutSession.date, WorkoutSession.day_of_week, WorkoutSession.facility, WorkoutSession.version
+        ).filter(WorkoutSession.tenant_id == tenant_id, WorkoutSession.id.in_(upserted['session'])).order_by(WorkoutSession.id):
+            sessions.append({
+                'id': row[0], 'date': row[1].strftime('%Y-%m-%d'), 'day_of_week': row[2],
+                'facility': row[3], 'version': row[4]
+            })
+    exercises = []
+    if upserted['exercise']:
+        for row in db.session.query(
+            WorkoutLog.session_id, *[column for _, column in EXERCISE_FIELDS]
+        ).filter(WorkoutLog.tenant_id == tenant_id, WorkoutLog.id.in_(upserted['exercise'])).order_by(WorkoutLog.id):
+            exercises.append({'session_id': row[0], **dict(zip(EXERCISE_KEYS, row[1:]))})
+    # 読み取りまでに削除された行は墓標として返す（後続の削除の変更でも同じ墓標が届く）
+    deleted['session'].update(set(upserted['session']) - {item['id'] for item in sessions})
+    deleted['exercise'].update(set(upserted['exercise']) - {item['id'] for item in exercises})
+    
+    return {
+        "since": since,
+        "next": changes[-1][0] if changes else since,
+        "has_more": has_more,
+        "sessions": sessions,
+        "exercises": exercises,
+        "deleted": {"sessions": sorted(deleted['session']), "exercises": sorted(deleted['exercise'])}
+    }
+
+@app.route('/api/sync', methods=['GET'])
+@read_replica
+def get_sync():
+    """差分同期（since=前回の next、limit=最大件数）。has_more が true の間は next で続けて取得する"""
+    try:
+        try:
+            since = int(request.args.get('since', 0))
+            limit = int(request.args.get('limit', SYNC_BATCH_SIZE))
+        except ValueError:
+            return jsonify({"error": "since and limit must be integers"}), 400
+        if since < 0 or limit < 1:
+            return jsonify({"error": "since must be >= 0 and limit >= 1"}), 400
+        
+        return jsonify(collect_changes(current_tenant_id(), since, min(limit, SYNC_MAX_BATCH_SIZE))), 200
+        
+    except Exception as e:
+        log_event("sync", error=str(e), status="error")
+        return jsonify({"error": str(e)}), 500
+
+@app.cli.command('bench-sync')
+@click.option('--sessions', 'session_count', default=2000, show_default=True, help='生成するセッション数')
+@click.option('--per-session', default=10, show_default=True, help='1セッションあたりのエクササイズ数')
+@click.option('--changes', 'change_count', default=20, show_default=True, help='差分同期の前に更新するエクササイズ数')
+def bench_sync_command(session_count, per_session, change_count):
+    """一時テナントで全件同期（since=0）と少数の変更後の差分同期の時間を比較"""
+    tenant_id = f"bench-{secrets.token_hex(4)}"
+    last_day = datetime.date.today()
+    
+    def timed(label, fn):
+        started = time.perf_counter()
+        result = fn()
+        print(f"{label:40} {(time.perf_counter() - started) * 1000:10.1f} ms")
+        return result
+    
+    def sync_all(since):
+        pages = items = 0
+        while True:
+            result = collect_changes(tenant_id, since)
+            pages += 1
+            items += len(result['sessions']) + len(result['exercises'])
+            since = result['next']
+            if not result['has_more']:
+                return since, pages, items
+    
+    try:
+        db.session.execute(db.insert(WorkoutSession), [
+            {'tenant_id': tenant_id, 'date': last_day - datetime.timedelta(days=i), 'version': 1}
+            for i in range(session_count)
+        ])
+        session_ids = [row[0] for row in db.session.query(WorkoutSession.id).filter(WorkoutSession.tenant_id == tenant_id)]
+        db.session.execute(db.insert(WorkoutLog), [
+            {'tenant_id': tenant_id, 'session_id': session_id, 'exercise_name': f"種目{i}", 'reps': 10, 'sets': 3, 'version': 1}
+            for session_id in session_ids for i in range(per_session)
+        ])
+        exercise_ids = [row[0] for row in db.session.query(WorkoutLog.id).filter(WorkoutLog.tenant_id == tenant_id)]
+        record_changes('session', session_ids, tenant_id=tenant_id)
+        record_changes('exercise', exercise_ids, tenant_id=tenant_id)
+        db.session.commit()
+        print(f"backend: {db.engine.dialect.name}, sessions: {len(session_ids)}, exercises: {len(exercise_ids)}")
+        
+        cursor, pages, items = timed("full sync (since=0)", lambda: sync_all(0))
+        print(f"  pages: {pages}, items: {items}")
+        
+        changed = exercise_ids[::max(1, len(exercise_ids) // max(1, change_count))][:change_count]
+        db.session.execute(
+            db.update(WorkoutLog).where(WorkoutLog.id.in_(changed)).values(reps=12, version=WorkoutLog.version + 1),
+            execution_options={"synchronize_session": False}
+        )
+        record_changes('exercise', changed, tenant_id=tenant_id)
+        db.session.commit()
+        cursor, pages, items = timed(f"delta sync ({len(changed)} changes)", lambda: sync_all(cursor))
+        print(f"  pages: {pages}, items: {items}")
+        timed("empty sync (no changes)", lambda: sync_all(cursor))
+    finally:
+        db.session.rollback()
+        for model in (WorkoutLog, WorkoutSession, ChangeLog):
+            db.session.execute(db.delete(model).where(model.tenant_id == tenant_id))
+        db.session.commit()
+
+def parse_export_date(value):
+    """エクスポートの日付フィルタを解釈（不正な値は指定なし扱い）"""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+def export_query(tenant_id, start_date_obj=None, end_date_obj=None, facility_id=None):
+    """エクスポート用のフラット行クエリ（日付条件は workout_logs.session_date にも付けてパーティションを絞り込む）"""
+    query = db.session.query(
+        WorkoutSession.date,
+        WorkoutSession.day_of_week,
+        WorkoutSession.facility,
+        *[column for _, column in EXERCISE_FIELDS]
+    ).join(
+        WorkoutLog, LIVE_EXERCISE_JOIN
+    ).filter(
+        WorkoutSession.tenant_id == tenant_id,
+        WorkoutLog.tenant_id == tenant_id
+    )
+    if start_date_obj:
+        query = query.filter(WorkoutSession.date >= start_date_obj, WorkoutLog.session_date >= start_date_obj)
+    if end_date_obj:
+        query = query.filter(WorkoutSession.date <= end_date_obj, WorkoutLog.session_date <= end_date_obj)
+    if facility_id is not None:
+        query = query.filter(WorkoutSession.facility_id == facility_id)
+    return query.order_by(WorkoutSession.date.asc(), WorkoutSession.id, WorkoutLog.id)
+
+def collect_export_rows(start_date=None, end_date=None, exercise_name=None, target_muscle=None, facility=None):
+    """エクスポート対象の行（dict）を通常テーブルとアーカイブから日付順に集める"""
+    tenant_id = current_tenant_id()
+    start_date_obj = parse_export_date(start_date)
+    end_date_obj = parse_export_date(end_date)
+    facility_id = facility_filter_id(facility)
+    
+    rows = []
+    for row in export_query(tenant_id, start_date_obj, end_date_obj, facility_id):
+        exercise = dict(zip(EXERCISE_KEYS, row[3:]))
+        exercise.update(date=row[0], day_of_week=row[1], facility=row[2])
+        rows.append(exercise)
+    
+    # アーカイブ済みの年も対象期間に含まれていれば出力する
+    archived = []
+    archived_facility_ids = {}
+    for session_data in load_archived_sessions(tenant_id, start_date_obj, end_date_obj):
+        if facility_id is not None:
+            # アーカイブは施設名のみ保持しているため、名前（別名を含む）から施設を解決して比較
+            name = session_data['facility']
+            if name not in archived_facility_ids:
+                archived_facility_ids[name] = resolve_facility_id(tenant_id, name, create=False)
+            if archived_facility_ids[name] != facility_id:
+                continue
+        session_date = datetime.datetime.strptime(session_data['date'], '%Y-%m-%d').date()
+        for exercise in session_data['exercises']:
+            archived.append(dict(exercise, date=session_date, day_of_week=session_data['day_of_week'], facility=session_data['facility']))
+    if archived:
+        rows = sorted(archived + rows, key=lambda exercise: exercise['date'])
+    
+    # エクササイズ名または筋肉部位でフィルタリング
+    if exercise_name:
+        rows = [exercise for exercise in rows if exercise_name.lower() in (exercise['name'] or "").lower()]
+    if target_muscle:
+        rows = [exercise for exercise in rows if target_muscle.lower() in (exercise['target_muscle'] or "").lower()]
+    return rows
+
+def create_excel_export(start_date=None, end_date=None, exercise_name=None, target_muscle=None, facility=None):
+    """筋トレログをExcel形式で出力（フィルタ対応）"""
+    try:
+        rows = collect_export_rows(start_date, end_date, exercise_name, target_muscle, facility)
+        
+        # Excelワークブックを作成（openpyxlはここで初めてインポート）
+        from openpyxl import Workbook
+        from openpyxl.styles import Font, PatternFill, Alignment
         
-        # Excelワークブックを作成
         wb = Workbook()
         ws = wb.active
         ws.title = "筋トレログ"
@@ -544,34 +2953,31 @@ def create_excel_export(start_date=None, end_date=None, exercise_name=None, targ
         
         # データ行を追加
         row_num = 2
-        for session in sessions:
-            # フィルタされたエクササイズがある場合はそれを使用、なければ全て
-            exercises = getattr(session, '_filtered_exercises', session.workout_logs)
-            for exercise in exercises:
-                # レストレップ回数の表示形式
-                rest_pause_display = ""
-                if exercise.rest_pause_reps and exercise.rest_pause_reps > 0:
-                    rest_pause_display = str(exercise.rest_pause_reps)
-                
-                # データ行
-                data_row = [
-                    session.date.strftime('%Y/%m/%d'),  # 日付
-                    session.day_of_week or "",          # 曜日
-                    session.facility or "",             # 施設名
-                    exercise.exercise_name or "",       # 種目
-                    exercise.exercise_category or "",   # 種別
-                    exercise.weight or "",              # 重量(kg)
-                    exercise.reps or "",                # 回数(rep)
-                    rest_pause_display,                 # レストレップ
-                    exercise.sets or "",                # セット数
-                    exercise.target_muscle or "",       # 部位
-                    exercise.notes or ""                # 備考
-                ]
-                
-                for col_num, value in enumerate(data_row, 1):
-                    ws.cell(row=row_num, column=col_num, value=value)
-                
-                row_num += 1
+        for exercise in rows:
+            # レストレップ回数の表示形式
+            rest_pause_display = ""
+            if exercise['rest_pause_reps'] and exercise['rest_pause_reps'] > 0:
+                rest_pause_display = str(exercise['rest_pause_reps'])
+            
+            # データ行
+            data_row = [
+                exercise['date'].strftime('%Y/%m/%d'),  # 日付
+                exercise['day_of_week'] or "",          # 曜日
+                exercise['facility'] or "",             # 施設名
+                exercise['name'] or "",                 # 種目
+                exercise['category'] or "",             # 種別
+                exercise['weight'] or "",               # 重量(kg)
+                exercise['reps'] or "",                 # 回数(rep)
+                rest_pause_display,                     # レストレップ
+                exercise['sets'] or "",                 # セット数
+                exercise['target_muscle'] or "",        # 部位
+                exercise['notes'] or ""                 # 備考
+            ]
+            
+            for col_num, value in enumerate(data_row, 1):
+                ws.cell(row=row_num, column=col_num, value=value)
+            
+            row_num += 1
         
         # 列幅の自動調整
         for column in ws.columns:
@@ -597,6 +3003,8 @@ def create_excel_export(start_date=None, end_date=None, exercise_name=None, targ
         raise Exception(f"Excel export error: {str(e)}")
 
 @app.route('/api/export/excel', methods=['GET'])
+@read_replica
+@conditional_get(workout_data_stamp)
 def export_excel():
     """筋トレログをExcelファイルでダウンロード（フィルタ対応）"""
     try:
@@ -605,13 +3013,15 @@ def export_excel():
         end_date = request.args.get('end_date')
         exercise_name = request.args.get('exercise_name')
         target_muscle = request.args.get('target_muscle')
+        facility = request.args.get('facility')
         
         # Excelファイルを生成（フィルタ適用）
         excel_buffer = create_excel_export(
             start_date=start_date,
             end_date=end_date, 
             exercise_name=exercise_name,
-            target_muscle=target_muscle
+            target_muscle=target_muscle,
+            facility=facility
         )
         
         # ファイル名生成（フィルタ条件を含む）
@@ -627,6 +3037,8 @@ def export_excel():
             filename_parts.append(f"exercise_{exercise_name[:10]}")
         if target_muscle:
             filename_parts.append(f"muscle_{target_muscle[:10]}")
+        if facility:
+            filename_parts.append(f"facility_{facility[:10]}")
             
         filename_parts.append(datetime.datetime.now().strftime('%Y%m%d_%H%M%S'))
         filename = "_".join(filename_parts) + ".xlsx"
@@ -643,7 +3055,8 @@ def export_excel():
                 "start_date": start_date,
                 "end_date": end_date,
                 "exercise_name": exercise_name,
-                "target_muscle": target_muscle
+                "target_muscle": target_muscle,
+                "facility": facility
             }
         })
         
@@ -655,36 +3068,42 @@ def export_excel():
         return jsonify({"error": error_msg}), 500
 
 @app.route('/workouts')
+@conditional_get(workout_data_stamp)
 def view_workouts():
     """筋トレログの一覧表示"""
     try:
-        sessions = WorkoutSession.query.order_by(WorkoutSession.date.desc()).limit(30).all()
-        
-        sessions_data = []
-        for session in sessions:
-            session_data = {
-                'id': session.id,
-                'date': session.date.strftime('%Y-%m-%d'),
-                'day_of_week': session.day_of_week,
-                'facility': session.facility,
-                'exercises': []
+        calendar_year = request.args.get('year', datetime.date.today().year, type=int)
+        if not MIN_CALENDAR_YEAR <= calendar_year <= MAX_CALENDAR_YEAR:
+            return f"year は {MIN_CALENDAR_YEAR}〜{MAX_CALENDAR_YEAR} で指定してください", 400
+        
+        # 最新30セッションのIDをサブクエリで絞り込み、エクササイズと一括取得（?facility= で施設を指定）
+        facility_name = request.args.get('facility')
+        recent_ids = db.session.query(WorkoutSession.id).filter(
+            WorkoutSession.tenant_id == current_tenant_id()
+        )
+        facility_id = facility_filter_id(facility_name)
+        if facility_id is not None:
+            recent_ids = recent_ids.filter(WorkoutSession.facility_id == facility_id)
+        recent_ids = recent_ids.order_by(
+            WorkoutSession.date.desc()
+        ).limit(30).subquery()
+        sessions_data = fetch_sessions_data(db.select(recent_ids.c.id), order_desc=True)
+        
+        # 年間カレンダー（日別配列から描画、セッションの再クエリはしない）
+        calendar_data = calendar_payload(calendar_year, get_calendar_data(current_tenant_id(), calendar_year))
+        year_start = datetime.date(calendar_year, 1, 1)
+        calendar_cells = [None] * year_start.weekday() + [
+            {
+                "date": (year_start + datetime.timedelta(days=i)).isoformat(),
+                "intensity": calendar_data["intensity"][i],
+                "sets": calendar_data["sets"][i],
+                "muscles": [
+                    name for bit, name in enumerate(calendar_data["muscle_groups"])
+                    if calendar_data["muscles"][i] & (1 << bit)
+                ],
             }
-            
-            for log in session.workout_logs:
-                exercise_data = {
-                    'id': log.id,
-                    'name': log.exercise_name,
-                    'category': log.exercise_category,
-                    'weight': log.weight,
-                    'reps': log.reps,
-                    'rest_pause_reps': log.rest_pause_reps,
-                    'sets': log.sets,
-                    'target_muscle': log.target_muscle,
-                    'notes': log.notes
-                }
-                session_data['exercises'].append(exercise_data)
-            
-            sessions_data.append(session_data)
+            for i in range(len(calendar_data["intensity"]))
+        ]
         
         html = '''
         <!DOCTYPE html>
@@ -692,39 +3111,9 @@ def view_workouts():
         <head>
             <title>筋トレログ - GPTs Action Test</title>
             <meta charset="utf-8">
-            <style>
-                body { font-family: Arial, sans-serif; margin: 20px; }
-                .container { max-width: 1200px; margin: 0 auto; }
-                .session { margin: 20px 0; padding: 20px; border: 1px solid #ddd; border-radius: 8px; border-left: 4px solid #4CAF50; position: relative; }
-                .session-header { background: #f8f9fa; padding: 15px; margin: -20px -20px 15px -20px; border-radius: 8px 8px 0 0; }
-                .session-date { font-size: 1.2em; font-weight: bold; color: #2c3e50; }
-                .session-info { color: #666; margin-top: 5px; }
-                .exercise { margin: 10px 0; padding: 15px; background: #f9f9f9; border-radius: 5px; position: relative; }
-                .exercise-header { font-weight: bold; color: #34495e; margin-bottom: 8px; display: flex; justify-content: space-between; align-items: center; }
-                .exercise-details { display: grid; grid-template-columns: repeat(auto-fit, minmax(120px, 1fr)); gap: 10px; font-size: 0.9em; }
-                .detail-item { background: white; padding: 8px; border-radius: 3px; }
-                .detail-label { font-weight: bold; color: #7f8c8d; }
-                .detail-value { color: #2c3e50; }
-                .notes { margin-top: 10px; padding: 10px; background: #fff3cd; border-radius: 3px; font-style: italic; }
-                .button { background: #007cba; color: white; padding: 10px 20px; text-decoration: none; border-radius: 3px; display: inline-block; margin: 5px; border: none; cursor: pointer; }
-                .button:hover { background: #005a8b; }
-                .button-small { padding: 5px 10px; font-size: 0.8em; margin: 2px; }
-                .button-edit { background: #28a745; }
-                .button-edit:hover { background: #218838; }
-                .button-delete { background: #dc3545; }
-                .button-delete:hover { background: #c82333; }
-                .session-delete { position: absolute; top: 15px; right: 15px; }
-                .exercise-actions { display: flex; gap: 5px; }
-                .reps-display { font-weight: bold; }
-                .rest-pause { color: #e74c3c; }
-                .nav-buttons { margin-bottom: 20px; }
-                .stats { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 15px; margin-bottom: 20px; }
-                .stat-card { background: #f8f9fa; padding: 15px; border-radius: 8px; text-align: center; }
-                .stat-value { font-size: 1.5em; font-weight: bold; color: #2c3e50; }
-                .stat-label { color: #7f8c8d; margin-top: 5px; }
-            </style>
+            <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
         </head>
-        <body>
+        <body class="page-workouts">
             <div class="container">
                 <h1>筋トレログ</h1>
                 
@@ -732,10 +3121,16 @@ def view_workouts():
                     <a href="/" class="button">← ホームに戻る</a>
                     <a href="/workouts/weekly" class="button">週次サマリ</a>
                     <a href="/workouts/monthly" class="button">月次サマリ</a>
+                    <a href="/workouts/analytics" class="button">トレーニング負荷</a>
+                    <a href="/workouts/facilities" class="button">施設別</a>
                     <a href="/logs" class="button">システムログ</a>
                     <a href="/export" class="button" style="background: #28a745;">📊 Excel エクスポート</a>
                 </div>
                 
+                {% if facility_name %}
+                <p>施設「{{ facility_name }}」のセッションのみ表示しています（<a href="/workouts">すべて表示</a>）</p>
+                {% endif %}
+                
                 <div class="stats">
                     <div class="stat-card">
                         <div class="stat-value">{{ sessions_data|length }}</div>
@@ -745,6 +3140,27 @@ def view_workouts():
                         <div class="stat-value">{{ total_exercises }}</div>
                         <div class="stat-label">総エクササイズ数</div>
                     </div>
+                    <div class="stat-card">
+                        <div class="stat-value">{{ calendar_data.training_days }}</div>
+                        <div class="stat-label">{{ calendar_data.year }}年のトレーニング日数</div>
+                    </div>
+                </div>
+                
+                <div class="calendar">
+                    <div class="calendar-header">
+                        <a href="?year={{ calendar_data.year - 1 }}">←</a>
+                        <span>{{ calendar_data.year }}年 トレーニングカレンダー</span>
+                        <a href="?year={{ calendar_data.year + 1 }}">→</a>
+                    </div>
+                    <div class="calendar-grid">
+                        {% for cell in calendar_cells %}
+                        {% if cell %}
+                        <div class="calendar-day calendar-level-{{ cell.intensity }}" title="{{ cell.date }}{% if cell.intensity %}: {{ cell.sets }}セット {{ cell.muscles|join('・') }}{% endif %}"></div>
+                        {% else %}
+                        <div></div>
+                        {% endif %}
+                        {% endfor %}
+                    </div>
                 </div>
                 
                 {% for session in sessions_data %}
@@ -811,114 +3227,72 @@ def view_workouts():
                 {% endfor %}
             </div>
             
-            <script>
-            function deleteSession(sessionId) {
-                if (confirm('このセッション全体を削除しますか？')) {
-                    fetch(`/api/workout/${sessionId}`, {
-                        method: 'DELETE'
-                    })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.status === 'success') {
-                            document.getElementById(`session-${sessionId}`).remove();
-                            alert('セッションを削除しました');
-                            location.reload();
-                        } else {
-                            alert('削除に失敗しました: ' + data.error);
-                        }
-                    })
-                    .catch(error => {
-                        alert('エラーが発生しました: ' + error);
-                    });
-                }
-            }
-            
-            function deleteExercise(exerciseId) {
-                if (confirm('このエクササイズを削除しますか？')) {
-                    fetch(`/api/workout/exercise/${exerciseId}`, {
-                        method: 'DELETE'
-                    })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.status === 'success') {
-                            document.getElementById(`exercise-${exerciseId}`).remove();
-                            alert('エクササイズを削除しました');
-                        } else {
-                            alert('削除に失敗しました: ' + data.error);
-                        }
-                    })
-                    .catch(error => {
-                        alert('エラーが発生しました: ' + error);
-                    });
-                }
-            }
-            
-            function editExercise(exerciseId) {
-                const newReps = prompt('新しい回数を入力してください:');
-                if (newReps !== null && newReps !== '') {
-                    const updateData = { reps: parseInt(newReps) };
-                    
-                    fetch(`/api/workout/exercise/${exerciseId}`, {
-                        method: 'PUT',
-                        headers: {
-                            'Content-Type': 'application/json'
-                        },
-                        body: JSON.stringify(updateData)
-                    })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.status === 'success') {
-                            alert('エクササイズを更新しました');
-                            location.reload();
-                        } else {
-                            alert('更新に失敗しました: ' + data.error);
-                        }
-                    })
-                    .catch(error => {
-                        alert('エラーが発生しました: ' + error);
-                    });
-                }
-            }
-            </script>
+            <script src="{{ asset_url('js/workouts.js') }}"></script>
         </body>
         </html>
         '''
         
         total_exercises = sum(len(session['exercises']) for session in sessions_data)
-        return render_template_string(html, sessions_data=sessions_data, total_exercises=total_exercises)
+        return render_template_string(
+            html,
+            sessions_data=sessions_data,
+            total_exercises=total_exercises,
+            calendar_data=calendar_data,
+            calendar_cells=calendar_cells,
+            facility_name=facility_name
+        )
         
     except Exception as e:
         return f"エラーが発生しました: {str(e)}", 500
 
+def summary_window_start(weeks=None, months=None):
+    """サマリの集計開始日（最新セッションの週・月を含めて weeks 週 / months ヶ月前の初日）"""
+    latest = db.session.query(func.max(WorkoutLog.session_date)).filter(
+        WorkoutLog.tenant_id == current_tenant_id()
+    ).scalar() or datetime.date.today()
+    if weeks:
+        return latest - datetime.timedelta(days=latest.weekday(), weeks=weeks - 1)
+    month_index = latest.year * 12 + latest.month - 1 - (months - 1)
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
 @app.route('/workouts/weekly')
+@read_replica
+@conditional_get(workout_data_stamp)
 def view_weekly_summary():
     """週次サマリ表示"""
     try:
-        from sqlalchemy import func, text
+        # 最新セッションの週から遡って8週間（日付範囲で絞り、パーティションを限定する）
+        since = summary_window_start(weeks=8)
         
         # 過去8週間のデータを取得
         weekly_data = db.session.query(
-            func.date_trunc('week', WorkoutSession.date).label('week_start'),
+            week_start(WorkoutSession.date).label('week_start'),
             func.count(WorkoutSession.id).label('session_count'),
             func.count(WorkoutLog.id).label('exercise_count')
-        ).join(WorkoutLog).group_by(
-            func.date_trunc('week', WorkoutSession.date)
+        ).join(WorkoutLog, LIVE_EXERCISE_JOIN).filter(
+            WorkoutSession.tenant_id == current_tenant_id(),
+            WorkoutSession.date >= since,
+            WorkoutLog.session_date >= since
+        ).group_by(
+            week_start(WorkoutSession.date)
         ).order_by(
-            func.date_trunc('week', WorkoutSession.date).desc()
+            week_start(WorkoutSession.date).desc()
         ).limit(8).all()
         
         # 筋肉部位別の週次統計
         muscle_stats = db.session.query(
             WorkoutLog.target_muscle,
             func.count(WorkoutLog.id).label('exercise_count'),
-            func.date_trunc('week', WorkoutSession.date).label('week_start')
+            week_start(WorkoutSession.date).label('week_start')
         ).join(WorkoutSession).filter(
+            WorkoutLog.tenant_id == current_tenant_id(),
+            WorkoutLog.session_date >= since,
             WorkoutLog.target_muscle.isnot(None)
         ).group_by(
             WorkoutLog.target_muscle,
-            func.date_trunc('week', WorkoutSession.date)
+            week_start(WorkoutSession.date)
         ).order_by(
-            func.date_trunc('week', WorkoutSession.date).desc()
+            week_start(WorkoutSession.date).desc()
         ).limit(50).all()
         
         html = '''
@@ -927,24 +3301,9 @@ def view_weekly_summary():
         <head>
             <title>週次サマリ - 筋トレログ</title>
             <meta charset="utf-8">
-            <style>
-                body { font-family: Arial, sans-serif; margin: 20px; }
-                .container { max-width: 1200px; margin: 0 auto; }
-                .week-summary { margin: 20px 0; padding: 20px; border: 1px solid #ddd; border-radius: 8px; border-left: 4px solid #2196F3; }
-                .week-header { font-size: 1.2em; font-weight: bold; color: #2c3e50; margin-bottom: 15px; }
-                .stats-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); gap: 15px; }
-                .stat-card { background: #f8f9fa; padding: 15px; border-radius: 8px; text-align: center; }
-                .stat-value { font-size: 1.5em; font-weight: bold; color: #2c3e50; }
-                .stat-label { color: #7f8c8d; margin-top: 5px; font-size: 0.9em; }
-                .muscle-stats { margin-top: 15px; }
-                .muscle-item { display: inline-block; background: #e3f2fd; padding: 5px 10px; margin: 3px; border-radius: 15px; font-size: 0.9em; }
-                .button { background: #007cba; color: white; padding: 10px 20px; text-decoration: none; border-radius: 3px; display: inline-block; margin: 5px; }
-                .button:hover { background: #005a8b; }
-                .nav-buttons { margin-bottom: 20px; }
-                .chart-container { background: white; padding: 20px; border-radius: 8px; margin: 20px 0; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
-            </style>
+            <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
         </head>
-        <body>
+        <body class="page-weekly">
             <div class="container">
                 <h1>週次サマリ</h1>
                 
@@ -995,10 +3354,15 @@ def view_weekly_summary():
         return f"エラーが発生しました: {str(e)}", 500
 
 @app.route('/workouts/monthly')
+@read_replica
+@conditional_get(workout_data_stamp)
 def view_monthly_summary():
     """月次サマリ表示"""
     try:
-        from sqlalchemy import func, extract
+        from sqlalchemy import extract
+        
+        # 最新セッションの月から遡って6ヶ月（日付範囲で絞り、パーティションを限定する）
+        since = summary_window_start(months=6)
         
         # 過去6ヶ月のデータを取得
         monthly_data = db.session.query(
@@ -1007,7 +3371,11 @@ def view_monthly_summary():
             func.count(WorkoutSession.id).label('session_count'),
             func.count(WorkoutLog.id).label('exercise_count'),
             func.count(func.distinct(WorkoutLog.exercise_name)).label('unique_exercises')
-        ).join(WorkoutLog).group_by(
+        ).join(WorkoutLog, LIVE_EXERCISE_JOIN).filter(
+            WorkoutSession.tenant_id == current_tenant_id(),
+            WorkoutSession.date >= since,
+            WorkoutLog.session_date >= since
+        ).group_by(
             extract('year', WorkoutSession.date),
             extract('month', WorkoutSession.date)
         ).order_by(
@@ -1022,6 +3390,8 @@ def view_monthly_summary():
             WorkoutLog.target_muscle,
             func.count(WorkoutLog.id).label('exercise_count')
         ).join(WorkoutSession).filter(
+            WorkoutLog.tenant_id == current_tenant_id(),
+            WorkoutLog.session_date >= since,
             WorkoutLog.target_muscle.isnot(None)
         ).group_by(
             extract('year', WorkoutSession.date),
@@ -1037,97 +3407,1425 @@ def view_monthly_summary():
         <!DOCTYPE html>
         <html>
         <head>
-            <title>月次サマリ - 筋トレログ</title>
+            <title>月次サマリ - 筋トレログ</title>
+            <meta charset="utf-8">
+            <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
+        </head>
+        <body class="page-monthly">
+            <div class="container">
+                <h1>月次サマリ</h1>
+                
+                <div class="nav-buttons">
+                    <a href="/workouts" class="button">← ワークアウト一覧</a>
+                    <a href="/workouts/weekly" class="button">週次サマリ</a>
+                    <a href="/" class="button">ホーム</a>
+                </div>
+                
+                {% for month in monthly_data %}
+                <div class="month-summary">
+                    <div class="month-header">{{ month.year }}年{{ month.month }}月</div>
+                    <div class="stats-grid">
+                        <div class="stat-card">
+                            <div class="stat-value">{{ month.session_count }}</div>
+                            <div class="stat-label">トレーニング日数</div>
+                        </div>
+                        <div class="stat-card">
+                            <div class="stat-value">{{ month.exercise_count }}</div>
+                            <div class="stat-label">総エクササイズ数</div>
+                        </div>
+                        <div class="stat-card">
+                            <div class="stat-value">{{ month.unique_exercises }}</div>
+                            <div class="stat-label">ユニーク種目数</div>
+                        </div>
+                        <div class="stat-card">
+                            <div class="stat-value">{{ "%.1f"|format(month.exercise_count / month.session_count if month.session_count > 0 else 0) }}</div>
+                            <div class="stat-label">1日平均エクササイズ数</div>
+                        </div>
+                    </div>
+                    
+                    <div class="muscle-stats">
+                        <strong>主要対象筋肉 TOP5:</strong>
+                        {% set month_muscles = [] %}
+                        {% for muscle in monthly_muscle_stats %}
+                            {% if muscle.year == month.year and muscle.month == month.month %}
+                                {% set _ = month_muscles.append(muscle) %}
+                            {% endif %}
+                        {% endfor %}
+                        {% for muscle in month_muscles[:5] %}
+                        <span class="muscle-item">{{ muscle.target_muscle }} ({{ muscle.exercise_count }}回)</span>
+                        {% endfor %}
+                    </div>
+                </div>
+                {% else %}
+                <p>まだ月次データがありません。</p>
+                {% endfor %}
+            </div>
+        </body>
+        </html>
+        '''
+        
+        return render_template_string(html, monthly_data=monthly_data, monthly_muscle_stats=monthly_muscle_stats)
+        
+    except Exception as e:
+        return f"エラーが発生しました: {str(e)}", 500
+
+# トレーニング負荷分析
+# 重量文字列（例: "80kg", "20kg×2", "135lb"）から数値を取り出す
+WEIGHT_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(kg|lbs?|ポンド)?\s*(?:[×xX*]\s*(\d+))?')
+LB_TO_KG = 0.45359237
+UNCATEGORIZED_MUSCLE = '未分類'
+ACUTE_WEEKS = 1
+CHRONIC_WEEKS = 4
+
+_weight_cache = {}
+
+def parse_weight_kg(weight):
+    """重量文字列をkgに変換（ダンベル×2などは合計、解釈できない場合は0）"""
+    if not weight:
+        return 0.0
+    cached = _weight_cache.get(weight)
+    if cached is not None:
+        return cached
+    match = WEIGHT_PATTERN.search(weight)
+    kg = 0.0
+    if match:
+        kg = float(match.group(1))
+        if match.group(2) and match.group(2) != 'kg':
+            kg *= LB_TO_KG
+        if match.group(3):
+            kg *= int(match.group(3))
+    if len(_weight_cache) < 10000:
+        _weight_cache[weight] = kg
+    return kg
+
+def week_start_of(week_index):
+    """週番号（0001-01-01の週を0とする月曜始まり）から週の開始日"""
+    return datetime.date.fromordinal(week_index * 7 + 1)
+
+def aggregate_training_rows(rows):
+    """(日付, 部位, 重量, 回数, セット数, レストレップ) の行を列配列にして週×部位で集計
+
+    戻り値は {週番号: {部位: [ハードセット数, トン数(kg), レストレップ回数, 総回数]}}。
+    """
+    import numpy as np
+    
+    if not rows:
+        return {}
+    count = len(rows)
+    dates, muscles, weights, reps, sets, rest_pause = zip(*rows)
+    week = np.fromiter(((d.toordinal() - 1) // 7 for d in dates), dtype=np.int64, count=count)
+    weight_kg = np.fromiter((parse_weight_kg(w) for w in weights), dtype=np.float64, count=count)
+    reps = np.fromiter((r or 0 for r in reps), dtype=np.float64, count=count)
+    sets = np.fromiter((s or 0 for s in sets), dtype=np.float64, count=count)
+    rest_pause = np.fromiter((r or 0 for r in rest_pause), dtype=np.float64, count=count)
+    muscle_names, muscle_codes = np.unique(
+        np.array([m or UNCATEGORIZED_MUSCLE for m in muscles], dtype=object), return_inverse=True
+    )
+    
+    total_reps = reps * sets + rest_pause
+    tonnage = weight_kg * total_reps
+    
+    # 週×部位の組をキーにしてbincountで一括集計
+    week_values, week_codes = np.unique(week, return_inverse=True)
+    keys = week_codes.reshape(-1) * len(muscle_names) + muscle_codes.reshape(-1)
+    size = len(week_values) * len(muscle_names)
+    sums = np.stack([
+        np.bincount(keys, weights=column, minlength=size)
+        for column in (sets, tonnage, rest_pause, total_reps)
+    ], axis=1)
+    present = np.bincount(keys, minlength=size) > 0
+    
+    result = {}
+    for key in np.flatnonzero(present):
+        week_value = int(week_values[key // len(muscle_names)])
+        muscle = muscle_names[key % len(muscle_names)]
+        result.setdefault(week_value, {})[muscle] = sums[key].tolist()
+    return result
+
+# テナントごとの集計キャッシュ
+# sessions: {セッションID: (日付, バージョン)} / weeks: aggregate_training_rows の結果
+_training_cache = {}
+_training_lock = threading.Lock()
+
+def refresh_training_cache(tenant_id):
+    """セッションのバージョンを比較し、変更のあった週だけ再集計する
+
+    エクササイズの追加・更新・削除はセッションのバージョンを上げるため、
+    他のワーカーでの書き込みもこの比較で検出できる。
+    """
+    snapshot = {
+        session_id: (session_date, version)
+        for session_id, session_date, version in db.session.query(
+            WorkoutSession.id, WorkoutSession.date, WorkoutSession.version
+        ).filter(WorkoutSession.tenant_id == tenant_id)
+    }
+    
+    with _training_lock:
+        cache = _training_cache.setdefault(tenant_id, {"sessions": {}, "weeks": {}})
+        previous = cache["sessions"]
+        changed = {
+            session_id for session_id in set(snapshot) | set(previous)
+            if snapshot.get(session_id) != previous.get(session_id)
+        }
+        dirty_weeks = {
+            (entry[0].toordinal() - 1) // 7
+            for session_id in changed
+            for entry in (snapshot.get(session_id), previous.get(session_id)) if entry
+        }
+        if not dirty_weeks:
+            return cache["weeks"], 0
+        
+        # 変更のあった週に属するセッションの行だけを取得
+        session_ids = [
+            session_id for session_id, (session_date, _) in snapshot.items()
+            if (session_date.toordinal() - 1) // 7 in dirty_weeks
+        ]
+        rows = []
+        if session_ids:
+            rows = db.session.query(
+                WorkoutSession.date,
+                WorkoutLog.target_muscle,
+                WorkoutLog.weight,
+                WorkoutLog.reps,
+                WorkoutLog.sets,
+                WorkoutLog.rest_pause_reps
+            ).join(WorkoutLog, LIVE_EXERCISE_JOIN).filter(
+                WorkoutLog.tenant_id == tenant_id,
+                WorkoutSession.id.in_(session_ids)
+            ).all()
+        
+        weeks = cache["weeks"]
+        for week in dirty_weeks:
+            weeks.pop(week, None)
+        weeks.update(aggregate_training_rows(rows))
+        cache["sessions"] = snapshot
+        return weeks, len(dirty_weeks)
+
+def compute_training_load(tenant_id, weeks_limit=12):
+    """部位別の週次ハードセット・トン数・急性:慢性負荷比（ACWR）・レストレップ寄与率を計算"""
+    import numpy as np
+    
+    weeks, recomputed = refresh_training_cache(tenant_id)
+    if not weeks:
+        return {"weeks": [], "muscles": [], "recomputed_weeks": recomputed}
+    
+    # 週を連続した行、部位を列とする行列に展開（トレーニングのない週は0）
+    first_week, last_week = min(weeks), max(weeks)
+    muscles = sorted({muscle for week_data in weeks.values() for muscle in week_data})
+    muscle_index = {muscle: index for index, muscle in enumerate(muscles)}
+    matrix = np.zeros((last_week - first_week + 1, len(muscles), 4))
+    for week, week_data in weeks.items():
+        for muscle, values in week_data.items():
+            matrix[week - first_week, muscle_index[muscle]] = values
+    
+    hard_sets, tonnage, rest_pause, total_reps = (matrix[:, :, i] for i in range(4))
+    
+    # ACWR = 直近1週のトン数 / 直近4週の平均トン数（累積和で全週を一括計算）
+    cumulative = np.vstack([np.zeros((1, len(muscles))), np.cumsum(tonnage, axis=0)])
+    window_end = np.arange(1, len(tonnage) + 1)
+    acute = (cumulative[window_end] - cumulative[np.maximum(window_end - ACUTE_WEEKS, 0)]) / ACUTE_WEEKS
+    chronic = (cumulative[window_end] - cumulative[np.maximum(window_end - CHRONIC_WEEKS, 0)]) / CHRONIC_WEEKS
+    with np.errstate(divide='ignore', invalid='ignore'):
+        acwr = np.where(chronic > 0, acute / chronic, np.nan)
+        # 慢性負荷の期間（4週）がそろわない最初の週はACWRを出さない
+        acwr[:CHRONIC_WEEKS - 1] = np.nan
+        rest_pause_share = np.where(total_reps > 0, rest_pause / total_reps, 0.0)
+    
+    result_weeks = []
+    for row in range(len(tonnage) - 1, max(len(tonnage) - weeks_limit, 0) - 1, -1):
+        muscles_data = {}
+        for column, muscle in enumerate(muscles):
+            if hard_sets[row, column] == 0 and tonnage[row, column] == 0:
+                continue
+            muscles_data[muscle] = {
+                "hard_sets": int(hard_sets[row, column]),
+                "tonnage_kg": round(float(tonnage[row, column]), 1),
+                "acwr": None if np.isnan(acwr[row, column]) else round(float(acwr[row, column]), 2),
+                "rest_pause_reps": int(rest_pause[row, column]),
+                "rest_pause_share": round(float(rest_pause_share[row, column]), 3),
+            }
+        result_weeks.append({
+            "week_start": week_start_of(first_week + row).isoformat(),
+            "total_hard_sets": int(hard_sets[row].sum()),
+            "total_tonnage_kg": round(float(tonnage[row].sum()), 1),
+            "muscles": muscles_data,
+        })
+    return {"weeks": result_weeks, "muscles": muscles, "recomputed_weeks": recomputed}
+
+@app.route('/api/analytics/training-load', methods=['GET'])
+@read_replica
+@conditional_get(workout_data_stamp)
+def get_training_load():
+    """部位別トレーニング負荷（週次）をJSONで取得"""
+    try:
+        weeks_limit = min(max(request.args.get('weeks', 12, type=int), 1), 104)
+        return jsonify(compute_training_load(current_tenant_id(), weeks_limit)), 200
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/workouts/analytics')
+@read_replica
+@conditional_get(workout_data_stamp)
+def view_training_load():
+    """トレーニング負荷ダッシュボード"""
+    try:
+        weeks_limit = min(max(request.args.get('weeks', 12, type=int), 1), 104)
+        analytics = compute_training_load(current_tenant_id(), weeks_limit)
+        
+        html = '''
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>トレーニング負荷 - 筋トレログ</title>
+            <meta charset="utf-8">
+            <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
+        </head>
+        <body class="page-analytics">
+            <div class="container">
+                <h1>トレーニング負荷</h1>
+                
+                <div class="nav-buttons">
+                    <a href="/workouts" class="button">← ワークアウト一覧</a>
+                    <a href="/workouts/weekly" class="button">週次サマリ</a>
+                    <a href="/workouts/monthly" class="button">月次サマリ</a>
+                    <a href="/" class="button">ホーム</a>
+                </div>
+                
+                <div class="info-box">
+                    ハードセット = 記録したセット数 / トン数 = 重量 × (回数 × セット数 + レストレップ回数)<br>
+                    ACWR = 直近1週のトン数 ÷ 直近4週の平均トン数（0.8〜1.3が目安、1.5超は急増）
+                </div>
+                
+                {% for week in analytics.weeks %}
+                <div class="week-summary">
+                    <div class="week-header">{{ week.week_start }}の週</div>
+                    <div class="stats-grid">
+                        <div class="stat-card">
+                            <div class="stat-value">{{ week.total_hard_sets }}</div>
+                            <div class="stat-label">ハードセット数</div>
+                        </div>
+                        <div class="stat-card">
+                            <div class="stat-value">{{ "{:,.0f}".format(week.total_tonnage_kg) }}</div>
+                            <div class="stat-label">トン数 (kg)</div>
+                        </div>
+                    </div>
+                    {% if week.muscles %}
+                    <table>
+                        <tr><th>部位</th><th>ハードセット</th><th>トン数 (kg)</th><th>ACWR</th><th>レストレップ</th><th>レストレップ寄与率</th></tr>
+                        {% for muscle, stats in week.muscles.items() %}
+                        <tr>
+                            <td>{{ muscle }}</td>
+                            <td>{{ stats.hard_sets }}</td>
+                            <td>{{ "{:,.0f}".format(stats.tonnage_kg) }}</td>
+                            <td class="{{ 'acwr-high' if stats.acwr and stats.acwr > 1.5 else ('acwr-low' if stats.acwr and stats.acwr < 0.8 else '') }}">{{ stats.acwr if stats.acwr is not none else '-' }}</td>
+                            <td>{{ stats.rest_pause_reps }}回</td>
+                            <td>{{ "%.1f"|format(stats.rest_pause_share * 100) }}%</td>
+                        </tr>
+                        {% endfor %}
+                    </table>
+                    {% else %}
+                    <p>この週はトレーニングがありません。</p>
+                    {% endif %}
+                </div>
+                {% else %}
+                <p>まだトレーニングデータがありません。</p>
+                {% endfor %}
+            </div>
+        </body>
+        </html>
+        '''
+        
+        return render_template_string(html, analytics=analytics)
+        
+    except Exception as e:
+        return f"エラーが発生しました: {str(e)}", 500
+
+# 列指向の分析スナップショット
+# テナントごとに workout_logs × workout_sessions を列ごとの生バイナリ（np.memmap で読む）で保持する。
+# 新しいエクササイズは追記し、既存行の更新・削除を検出した場合や一定時間経過後は作り直す。
+SNAPSHOT_DIR = DATA_DIR / "snapshots"
+SNAPSHOT_MAX_AGE_SECONDS = float(os.environ.get('SNAPSHOT_MAX_AGE_SECONDS', 3600))
+SNAPSHOT_BATCH_ROWS = 50000
+SNAPSHOT_COLUMNS = (
+    ('log_id', 'int64'),
+    ('day', 'int32'),        # date.toordinal()
+    ('facility', 'int32'),   # meta['facilities'] の添字
+    ('exercise', 'int32'),   # meta['exercises'] の添字
+    ('muscle', 'int32'),     # meta['muscles'] の添字
+    ('weight_kg', 'float32'),
+    ('reps', 'float32'),
+    ('sets', 'float32'),
+    ('rest_pause', 'float32'),
+)
+SNAPSHOT_DIMENSIONS = ('week', 'month', 'exercise', 'muscle', 'facility')
+SNAPSHOT_METRICS = ('count', 'sets', 'reps', 'tonnage', 'max_weight')
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+_snapshot_lock = threading.Lock()
+
+def write_json_atomic(path, data):
+    """一時ファイルに書いてから置き換える（読み手が書きかけを読まないように）"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def read_snapshot_meta(tenant_dir):
+    """現在の世代のメタ情報（なければ None）"""
+    try:
+        generation = (tenant_dir / 'CURRENT').read_text().strip()
+        with open(tenant_dir / generation / 'meta.json', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def snapshot_source_batches(tenant_id, after_log_id):
+    """スナップショット元の行（ID順）を SNAPSHOT_BATCH_ROWS 件ずつ返す"""
+    result = db.session.execute(
+        db.select(
+            WorkoutLog.id, WorkoutLog.version, WorkoutSession.date, WorkoutSession.facility,
+            WorkoutLog.exercise_name, WorkoutLog.target_muscle, WorkoutLog.weight,
+            WorkoutLog.reps, WorkoutLog.sets, WorkoutLog.rest_pause_reps
+        ).join(
+            WorkoutSession, WorkoutLog.session_id == WorkoutSession.id
+        ).where(
+            WorkoutLog.tenant_id == tenant_id,
+            WorkoutLog.id > after_log_id
+        ).order_by(WorkoutLog.id).execution_options(yield_per=SNAPSHOT_BATCH_ROWS)
+    )
+    return result.partitions()
+
+def encode_names(names, dictionary, codes):
+    """文字列を辞書の添字に変換（未登録の文字列は辞書に追加）"""
+    encoded = []
+    for name in names:
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(dictionary)
+            dictionary.append(name)
+        encoded.append(code)
+    return encoded
+
+def append_snapshot_rows(generation_dir, meta, batches):
+    """行を列ファイルの末尾に追記し、meta の行数・ウォーターマークを更新（追記した行数を返す）"""
+    import numpy as np
+    
+    dictionaries = {
+        key: (meta[key], {name: code for code, name in enumerate(meta[key])})
+        for key in ('facilities', 'exercises', 'muscles')
+    }
+    appended = 0
+    for rows in batches:
+        count = len(rows)
+        log_ids, versions, dates, facilities, exercises, muscles, weights, reps, sets, rest_pause = zip(*rows)
+        arrays = {
+            'log_id': np.array(log_ids, dtype=np.int64),
+            'day': np.fromiter((d.toordinal() for d in dates), dtype=np.int32, count=count),
+            'facility': np.array(encode_names((f or '' for f in facilities), *dictionaries['facilities']), dtype=np.int32),
+            'exercise': np.array(encode_names((e or '' for e in exercises), *dictionaries['exercises']), dtype=np.int32),
+            'muscle': np.array(encode_names((m or UNCATEGORIZED_MUSCLE for m in muscles), *dictionaries['muscles']), dtype=np.int32),
+            'weight_kg': np.fromiter((parse_weight_kg(w) for w in weights), dtype=np.float32, count=count),
+            'reps': np.fromiter((r or 0 for r in reps), dtype=np.float32, count=count),
+            'sets': np.fromiter((s or 0 for s in sets), dtype=np.float32, count=count),
+            'rest_pause': np.fromiter((r or 0 for r in rest_pause), dtype=np.float32, count=count),
+        }
+        for name, dtype in SNAPSHOT_COLUMNS:
+            with open(generation_dir / f"{name}.bin", 'ab') as f:
+                f.write(arrays[name].astype(dtype, copy=False).tobytes())
+        meta['rows'] += count
+        meta['watermark'] = int(log_ids[-1])
+        meta['version_sum'] += sum(versions)
+        appended += count
+    return appended
+
+def open_snapshot_columns(generation_dir, meta):
+    """列ファイルを読み取り専用のmemmapで開く（meta の行数までを使う）"""
+    import numpy as np
+    
+    if meta['rows'] == 0:
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in SNAPSHOT_COLUMNS}
+    return {
+        name: np.memmap(generation_dir / f"{name}.bin", dtype=dtype, mode='r', shape=(meta['rows'],))
+        for name, dtype in SNAPSHOT_COLUMNS
+    }
+
+def refresh_snapshot(tenant_id):
+    """スナップショットを最新化して (meta, 列のdict, 更新種別 none/append/rebuild) を返す
+
+    ウォーターマーク以下の行数とバージョン合計が一致すれば既存行は未変更とみなし、新しい行だけ追記する。
+    ワーカー間はファイルロックで排他する。
+    """
+    import fcntl
+    
+    tenant_dir = SNAPSHOT_DIR / tenant_id
+    tenant_dir.mkdir(parents=True, exist_ok=True)
+    with _snapshot_lock, open(tenant_dir / 'lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        meta = read_snapshot_meta(tenant_dir)
+        if meta is not None and time.time() - meta['built_at'] < SNAPSHOT_MAX_AGE_SECONDS:
+            count, version_sum = db.session.query(
+                func.count(WorkoutLog.id), func.coalesce(func.sum(WorkoutLog.version), 0)
+            ).filter(
+                WorkoutLog.tenant_id == tenant_id,
+                WorkoutLog.id <= meta['watermark']
+            ).one()
+            if count == meta['rows'] and version_sum == meta['version_sum']:
+                generation_dir = tenant_dir / meta['generation']
+                refreshed = 'none'
+                if append_snapshot_rows(generation_dir, meta, snapshot_source_batches(tenant_id, meta['watermark'])):
+                    write_json_atomic(generation_dir / 'meta.json', meta)
+                    refreshed = 'append'
+                return meta, open_snapshot_columns(generation_dir, meta), refreshed
+        
+        # 新しい世代に全件を書き出してから切り替え、古い世代を削除
+        generation = f"gen-{time.time_ns()}"
+        generation_dir = tenant_dir / generation
+        generation_dir.mkdir()
+        meta = {
+            'generation': generation, 'built_at': time.time(),
+            'rows': 0, 'watermark': 0, 'version_sum': 0,
+            'facilities': [], 'exercises': [], 'muscles': [],
+        }
+        for name, _ in SNAPSHOT_COLUMNS:
+            (generation_dir / f"{name}.bin").touch()
+        append_snapshot_rows(generation_dir, meta, snapshot_source_batches(tenant_id, 0))
+        write_json_atomic(generation_dir / 'meta.json', meta)
+        (tenant_dir / 'CURRENT.tmp').write_text(generation)
+        os.replace(tenant_dir / 'CURRENT.tmp', tenant_dir / 'CURRENT')
+        for path in tenant_dir.glob('gen-*'):
+            if path.name != generation:
+                shutil.rmtree(path, ignore_errors=True)
+        return meta, open_snapshot_columns(generation_dir, meta), 'rebuild'
+
+def aggregate_snapshot(columns, meta, group_by, metrics, start_date=None, end_date=None):
+    """スナップショットの列をベクトル演算で集計（group_by の各次元の組ごとに metrics を計算）"""
+    import numpy as np
+    
+    day = np.asarray(columns['day'])
+    mask = np.ones(len(day), dtype=bool)
+    if start_date:
+        mask &= day >= start_date.toordinal()
+    if end_date:
+        mask &= day <= end_date.toordinal()
+    selected = {name: np.asarray(column)[mask] for name, column in columns.items()}
+    
+    dimension_values = {
+        'week': lambda: (selected['day'].astype(np.int64) - 1) // 7,
+        'month': lambda: (selected['day'].astype(np.int64) - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64),
+        'exercise': lambda: selected['exercise'],
+        'muscle': lambda: selected['muscle'],
+        'facility': lambda: selected['facility'],
+    }
+    dimension_labels = {
+        'week': lambda value: week_start_of(int(value)).isoformat(),
+        'month': lambda value: f"{1970 + int(value) // 12:04d}-{int(value) % 12 + 1:02d}",
+        'exercise': lambda value: meta['exercises'][value],
+        'muscle': lambda value: meta['muscles'][value],
+        'facility': lambda value: meta['facilities'][value],
+    }
+    
+    # 各次元を密な番号にして混合基数で1つのキーにまとめる
+    key = np.zeros(len(selected['day']), dtype=np.int64)
+    uniques = []
+    for dimension in group_by:
+        values, inverse = np.unique(dimension_values[dimension](), return_inverse=True)
+        key = key * len(values) + inverse.reshape(-1)
+        uniques.append(values)
+    groups, inverse = np.unique(key, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    
+    total_reps = selected['reps'].astype(np.float64) * selected['sets'] + selected['rest_pause']
+    results = {}
+    if 'count' in metrics:
+        results['count'] = np.bincount(inverse, minlength=len(groups))
+    if 'sets' in metrics:
+        results['sets'] = np.bincount(inverse, weights=selected['sets'], minlength=len(groups))
+    if 'reps' in metrics:
+        results['reps'] = np.bincount(inverse, weights=total_reps, minlength=len(groups))
+    if 'tonnage' in metrics:
+        results['tonnage'] = np.bincount(inverse, weights=selected['weight_kg'] * total_reps, minlength=len(groups))
+    if 'max_weight' in metrics and len(groups):
+        order = np.argsort(inverse, kind='stable')
+        starts = np.searchsorted(inverse[order], np.arange(len(groups)))
+        results['max_weight'] = np.maximum.reduceat(selected['weight_kg'][order], starts)
+    
+    rows = []
+    for index, group in enumerate(groups.tolist()):
+        row = {}
+        for dimension, values in zip(reversed(group_by), reversed(uniques)):
+            group, position = divmod(group, len(values))
+            row[dimension] = dimension_labels[dimension](values[position])
+        row = {dimension: row[dimension] for dimension in group_by}
+        for metric, values in results.items():
+            value = values[index].item()
+            row[metric] = round(value, 2) if isinstance(value, float) else value
+        rows.append(row)
+    return rows
+
+@app.route('/api/analytics/aggregate', methods=['GET'])
+@read_replica
+@conditional_get(workout_data_stamp)
+def get_snapshot_aggregate():
+    """列指向スナップショットでの集計（group_by=week,muscle&metrics=count,tonnage&start_date=&end_date=）"""
+    try:
+        group_by = [name.strip() for name in request.args.get('group_by', 'week').split(',') if name.strip()]
+        metrics = [name.strip() for name in request.args.get('metrics', ','.join(SNAPSHOT_METRICS)).split(',') if name.strip()]
+        invalid = [name for name in group_by if name not in SNAPSHOT_DIMENSIONS] + [name for name in metrics if name not in SNAPSHOT_METRICS]
+        if not group_by or len(group_by) > 3 or len(set(group_by)) != len(group_by) or invalid:
+            return jsonify({
+                "error": "Invalid group_by or metrics",
+                "invalid": invalid,
+                "dimensions": list(SNAPSHOT_DIMENSIONS),
+                "metrics": list(SNAPSHOT_METRICS)
+            }), 400
+        start_date = parse_export_date(request.args.get('start_date'))
+        end_date = parse_export_date(request.args.get('end_date'))
+        
+        meta, columns, refreshed = refresh_snapshot(current_tenant_id())
+        rows = aggregate_snapshot(columns, meta, group_by, metrics, start_date, end_date)
+        return jsonify({
+            "group_by": group_by,
+            "metrics": metrics,
+            "rows": rows,
+            "snapshot": {"rows": meta['rows'], "generation": meta['generation'], "refreshed": refreshed}
+        }), 200
+        
+    except Exception as e:
+        log_event("snapshot_aggregate", error=str(e), status="error")
+        return jsonify({"error": str(e)}), 500
+
+@app.cli.command('bench-snapshot')
+@click.option('--rows', 'row_count', default=1000000, show_default=True, help='生成するエクササイズ行数')
+@click.option('--per-session', default=50, show_default=True, help='1セッションあたりのエクササイズ数')
+def bench_snapshot_command(row_count, per_session):
+    """一時テナントに合成データを入れ、週×部位の集計をSQLとスナップショットで比較"""
+    import numpy as np
+    
+    tenant_id = f"bench-{secrets.token_hex(4)}"
+    rng = np.random.default_rng(0)
+    exercises = [('ベンチプレス', '胸'), ('スクワット', '脚'), ('デッドリフト', '背中'), ('ショルダープレス', '肩'), ('カール', '腕'), ('プランク', None)]
+    session_count = (row_count + per_session - 1) // per_session
+    last_day = datetime.date.today()
+    
+    def timed(label, fn):
+        started = time.perf_counter()
+        result = fn()
+        print(f"{label:48} {(time.perf_counter() - started) * 1000:10.1f} ms")
+        return result
+    
+    def insert_data():
+        db.session.execute(db.insert(WorkoutSession), [
+            {'tenant_id': tenant_id, 'date': last_day - datetime.timedelta(days=i), 'facility': f"ジム{i % 3}", 'version': 1}
+            for i in range(session_count)
+        ])
+        sessions = dict(db.session.query(WorkoutSession.date, WorkoutSession.id).filter(WorkoutSession.tenant_id == tenant_id))
+        choices = rng.integers(0, len(exercises), row_count)
+        weights = rng.integers(20, 150, row_count)
+        for start in range(0, row_count, SNAPSHOT_BATCH_ROWS):
+            batch = []
+            for i in range(start, min(start + SNAPSHOT_BATCH_ROWS, row_count)):
+                session_date = last_day - datetime.timedelta(days=i // per_session)
+                name, muscle = exercises[choices[i]]
+                batch.append({
+                    'tenant_id': tenant_id, 'session_id': sessions[session_date], 'session_date': session_date,
+                    'exercise_name': name, 'weight': f"{weights[i]}kg", 'reps': 10, 'sets': 3,
+                    'rest_pause_reps': int(i % 7 == 0), 'target_muscle': muscle, 'version': 1
+                })
+            db.session.execute(db.insert(WorkoutLog), batch)
+        db.session.commit()
+    
+    def sql_aggregate():
+        return db.session.query(
+            week_start(WorkoutSession.date),
+            WorkoutLog.target_muscle,
+            func.count(WorkoutLog.id),
+            func.sum(WorkoutLog.sets),
+            func.sum(WorkoutLog.reps * WorkoutLog.sets + func.coalesce(WorkoutLog.rest_pause_reps, 0))
+        ).join(WorkoutSession, WorkoutLog.session_id == WorkoutSession.id).filter(
+            WorkoutLog.tenant_id == tenant_id
+        ).group_by(week_start(WorkoutSession.date), WorkoutLog.target_muscle).all()
+    
+    print(f"backend: {db.engine.dialect.name}, rows: {row_count}, sessions: {session_count}")
+    try:
+        timed("insert synthetic rows", insert_data)
+        sql_rows = timed("SQL GROUP BY week, muscle", sql_aggregate)
+        timed("snapshot full build", lambda: refresh_snapshot(tenant_id))
+        meta, columns, _ = timed("snapshot refresh check (no changes)", lambda: refresh_snapshot(tenant_id))
+        snapshot_rows = timed("snapshot aggregate week, muscle", lambda: aggregate_snapshot(
+            columns, meta, ['week', 'muscle'], ['count', 'sets', 'reps']))
+        timed("snapshot aggregate week, muscle + tonnage/max", lambda: aggregate_snapshot(
+            columns, meta, ['week', 'muscle'], list(SNAPSHOT_METRICS)))
+        timed("snapshot aggregate month, facility, exercise", lambda: aggregate_snapshot(
+            columns, meta, ['month', 'facility', 'exercise'], ['count', 'tonnage']))
+        print(f"groups: SQL {len(sql_rows)}, snapshot {len(snapshot_rows)}; "
+              f"total count SQL {sum(row[2] for row in sql_rows)}, snapshot {sum(row['count'] for row in snapshot_rows)}")
+    finally:
+        db.session.rollback()
+        db.session.execute(db.delete(WorkoutLog).where(WorkoutLog.tenant_id == tenant_id))
+        db.session.execute(db.delete(WorkoutSession).where(WorkoutSession.tenant_id == tenant_id))
+        db.session.commit()
+        shutil.rmtree(SNAPSHOT_DIR / tenant_id, ignore_errors=True)
+
+# 施設（表記ゆれを正規化・別名で統合し、施設別に集計）
+WEEKDAY_NAMES = ('日', '月', '火', '水', '木', '金', '土')  # extract('dow') の 0=日曜 順
+FACILITY_SUMMARY_MONTHS = 12
+
+def normalize_facility_name(name):
+    """施設名の照合キー（全角半角・大文字小文字・空白の違いを無視）"""
+    if not name:
+        return ''
+    return re.sub(r'\s+', '', unicodedata.normalize('NFKC', name)).casefold()[:100]
+
+def resolve_facility_id(tenant_id, name, create=True):
+    """施設名（別名を含む）から施設IDを取得。create=True なら未登録の施設を作成する"""
+    key = normalize_facility_name(name)
+    if not key:
+        return None
+    facility_id = db.session.query(FacilityAlias.facility_id).filter(
+        FacilityAlias.tenant_id == tenant_id, FacilityAlias.alias == key
+    ).scalar()
+    if facility_id is None:
+        facility_id = db.session.query(Facility.id).filter(
+            Facility.tenant_id == tenant_id, Facility.normalized_name == key
+        ).scalar()
+    if facility_id is None and create:
+        # 同じ施設の同時登録は一意インデックスで1行にまとめる
+        db.session.execute(dialect_insert(Facility).values(
+            tenant_id=tenant_id, name=name.strip()[:100], normalized_name=key, created_at=datetime.datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=[Facility.tenant_id, Facility.normalized_name]))
+        facility_id = db.session.query(Facility.id).filter(
+            Facility.tenant_id == tenant_id, Facility.normalized_name == key
+        ).scalar()
+    return facility_id
+
+def backfill_session_facilities():
+    """facility_id が未設定で施設名のあるセッションを施設に紐付け（init-db から呼ぶ）"""
+    pairs = db.session.query(WorkoutSession.tenant_id, WorkoutSession.facility).filter(
+        WorkoutSession.facility_id.is_(None),
+        WorkoutSession.facility.isnot(None)
+    ).distinct().all()
+    for tenant_id, name in pairs:
+        facility_id = resolve_facility_id(tenant_id, name)
+        if facility_id is not None:
+            db.session.execute(
+                db.update(WorkoutSession).where(
+                    WorkoutSession.tenant_id == tenant_id,
+                    WorkoutSession.facility == name,
+                    WorkoutSession.facility_id.is_(None)
+                ).values(facility_id=facility_id),
+                execution_options={"synchronize_session": False}
+            )
+
+def facility_filter_id(name):
+    """一覧・エクスポートの施設フィルタ（未登録の施設名は -1 で0件にする）"""
+    if not name:
+        return None
+    facility_id = resolve_facility_id(current_tenant_id(), name, create=False)
+    return facility_id if facility_id is not None else -1
+
+def list_facilities(tenant_id):
+    """施設一覧（別名・訪問回数・最終訪問日つき、訪問回数の多い順）"""
+    visits = {
+        facility_id: (count, last_visit)
+        for facility_id, count, last_visit in db.session.query(
+            WorkoutSession.facility_id, func.count(WorkoutSession.id), func.max(WorkoutSession.date)
+        ).filter(
+            WorkoutSession.tenant_id == tenant_id,
+            WorkoutSession.facility_id.isnot(None)
+        ).group_by(WorkoutSession.facility_id)
+    }
+    aliases = {}
+    for facility_id, alias in db.session.query(FacilityAlias.facility_id, FacilityAlias.alias).filter(
+        FacilityAlias.tenant_id == tenant_id
+    ).order_by(FacilityAlias.alias):
+        aliases.setdefault(facility_id, []).append(alias)
+    
+    facilities = [
+        {
+            "id": facility.id,
+            "name": facility.name,
+            "aliases": aliases.get(facility.id, []),
+            "visits": visits.get(facility.id, (0, None))[0],
+            "last_visit": visits[facility.id][1].isoformat() if facility.id in visits else None,
+        }
+        for facility in Facility.query.filter(Facility.tenant_id == tenant_id)
+    ]
+    facilities.sort(key=lambda facility: (-facility["visits"], facility["name"]))
+    return facilities
+
+# 施設別サマリのキャッシュ {(テナント, 施設ID): (スタンプ, サマリ)}
+# スタンプはテナントのセッション件数・バージョン合計・最大ID（エクササイズの変更でもバージョンが上がる）
+_facility_summary_cache = {}
+
+def facility_summary_stamp(tenant_id):
+    return tuple(db.session.query(
+        func.count(WorkoutSession.id), func.coalesce(func.sum(WorkoutSession.version), 0), func.max(WorkoutSession.id)
+    ).filter(WorkoutSession.tenant_id == tenant_id).one())
+
+def compute_facility_summary(tenant_id, facility_id):
+    """施設別サマリ（訪問頻度・実施種目・施設ごとの自己ベスト）をグループ化したSQLで計算"""
+    from sqlalchemy import extract
+    
+    in_facility = (WorkoutSession.tenant_id == tenant_id, WorkoutSession.facility_id == facility_id)
+    total, first_visit, last_visit = db.session.query(
+        func.count(WorkoutSession.id), func.min(WorkoutSession.date), func.max(WorkoutSession.date)
+    ).filter(*in_facility).one()
+    
+    by_month = db.session.query(
+        extract('year', WorkoutSession.date), extract('month', WorkoutSession.date), func.count(WorkoutSession.id)
+    ).filter(*in_facility).group_by(
+        extract('year', WorkoutSession.date), extract('month', WorkoutSession.date)
+    ).order_by(
+        extract('year', WorkoutSession.date).desc(), extract('month', WorkoutSession.date).desc()
+    ).limit(FACILITY_SUMMARY_MONTHS).all()
+    
+    by_weekday = dict(db.session.query(
+        extract('dow', WorkoutSession.date), func.count(WorkoutSession.id)
+    ).filter(*in_facility).group_by(extract('dow', WorkoutSession.date)).all())
+    
+    exercises = db.session.query(
+        WorkoutLog.exercise_name,
+        func.count(func.distinct(WorkoutLog.session_id)),
+        func.coalesce(func.sum(WorkoutLog.sets), 0)
+    ).join(WorkoutSession, WorkoutLog.session_id == WorkoutSession.id).filter(
+        *in_facility, WorkoutLog.tenant_id == tenant_id
+    ).group_by(WorkoutLog.exercise_name).order_by(func.count(func.distinct(WorkoutLog.session_id)).desc()).all()
+    
+    # 重量は文字列のため (種目, 施設, 重量表記) の組ごとにまとめてからkgに変換して比較
+    weights = db.session.query(
+        WorkoutLog.exercise_name, WorkoutSession.facility_id, WorkoutLog.weight
+    ).join(WorkoutSession, WorkoutLog.session_id == WorkoutSession.id).filter(
+        WorkoutLog.tenant_id == tenant_id,
+        WorkoutLog.exercise_name.in_([row[0] for row in exercises]),
+        WorkoutLog.weight.isnot(None)
+    ).group_by(WorkoutLog.exercise_name, WorkoutSession.facility_id, WorkoutLog.weight).all()
+    facility_best = {}
+    overall_best = {}
+    for exercise_name, row_facility_id, weight in weights:
+        kg = parse_weight_kg(weight)
+        overall_best[exercise_name] = max(overall_best.get(exercise_name, 0.0), kg)
+        if row_facility_id == facility_id and kg > facility_best.get(exercise_name, (0.0, None))[0]:
+            facility_best[exercise_name] = (kg, weight)
+    
+    weeks = ((last_visit - first_visit).days // 7 + 1) if total else 0
+    return {
+        "visits": {
+            "total": total,
+            "first_visit": first_visit.isoformat() if first_visit else None,
+            "last_visit": last_visit.isoformat() if last_visit else None,
+            "per_week": round(total / weeks, 2) if weeks else 0,
+            "by_month": [{"month": f"{int(year):04d}-{int(month):02d}", "visits": count} for year, month, count in by_month],
+            "by_weekday": {WEEKDAY_NAMES[int(dow)]: by_weekday.get(dow, 0) for dow in sorted(by_weekday)},
+        },
+        "exercises": [{"name": name, "sessions": sessions, "sets": int(sets)} for name, sessions, sets in exercises],
+        "personal_records": [
+            {
+                "exercise": exercise_name,
+                "best_kg": round(kg, 2),
+                "weight": weight,
+                "overall_best_kg": round(overall_best[exercise_name], 2),
+                "is_overall_best": kg >= overall_best[exercise_name],
+            }
+            for exercise_name, (kg, weight) in sorted(facility_best.items(), key=lambda item: -item[1][0])
+        ],
+    }
+
+def get_facility_summary(tenant_id, facility_id):
+    """施設別サマリ（データが変わっていなければキャッシュを返す）"""
+    stamp = facility_summary_stamp(tenant_id)
+    cached = _facility_summary_cache.get((tenant_id, facility_id))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    summary = compute_facility_summary(tenant_id, facility_id)
+    _facility_summary_cache[(tenant_id, facility_id)] = (stamp, summary)
+    return summary
+
+@app.route('/api/facilities', methods=['GET'])
+@read_replica
+def get_facilities():
+    """施設一覧（別名・訪問回数つき）"""
+    try:
+        return jsonify({"facilities": list_facilities(current_tenant_id())}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/facilities/<int:facility_id>/summary', methods=['GET'])
+@read_replica
+def get_facility_summary_api(facility_id):
+    """施設別サマリ（訪問頻度・実施種目・施設ごとの自己ベスト）"""
+    try:
+        facility = db.session.get(Facility, facility_id)
+        if facility is None or facility.tenant_id != current_tenant_id():
+            return jsonify({"error": "Facility not found"}), 404
+        summary = get_facility_summary(facility.tenant_id, facility.id)
+        return jsonify(dict(summary, facility={"id": facility.id, "name": facility.name})), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/facilities/<int:facility_id>/aliases', methods=['POST'])
+def add_facility_alias(facility_id):
+    """施設に別名を追加（別名が既存の別施設なら、その施設のセッションと別名を統合する）"""
+    try:
+        tenant_id = current_tenant_id()
+        facility = db.session.get(Facility, facility_id)
+        if facility is None or facility.tenant_id != tenant_id:
+            return jsonify({"error": "Facility not found"}), 404
+        data = request.get_json(silent=True) or {}
+        key = normalize_facility_name(data.get('alias'))
+        if not key:
+            return jsonify({"error": "alias is required"}), 400
+        
+        merged_id = resolve_facility_id(tenant_id, key, create=False)
+        if merged_id is not None and merged_id != facility.id:
+            moved_ids = db.session.execute(
+                db.update(WorkoutSession).where(
+                    WorkoutSession.tenant_id == tenant_id, WorkoutSession.facility_id == merged_id
+                ).values(facility_id=facility.id).returning(WorkoutSession.id),
+                execution_options={"synchronize_session": False}
+            ).scalars().all()
+            # 移動したセッションのバージョンを上げて変更フィードに記録（ETag・同期・他ワーカーの施設サマリに反映）
+            bump_session_versions(moved_ids)
+            db.session.execute(
+                db.update(FacilityAlias).where(
+                    FacilityAlias.tenant_id == tenant_id, FacilityAlias.facility_id == merged_id
+                ).values(facility_id=facility.id),
+                execution_options={"synchronize_session": False}
+            )
+            merged_name = db.session.get(Facility, merged_id).normalized_name
+            db.session.execute(db.delete(Facility).where(Facility.id == merged_id))
+            # 統合された施設の正規名も別名として残す
+            if db.session.get(FacilityAlias, (tenant_id, merged_name)) is None:
+                db.session.add(FacilityAlias(tenant_id=tenant_id, alias=merged_name, facility_id=facility.id))
+        
+        if key != facility.normalized_name:
+            alias = db.session.get(FacilityAlias, (tenant_id, key))
+            if alias is None:
+                db.session.add(FacilityAlias(tenant_id=tenant_id, alias=key, facility_id=facility.id))
+            else:
+                alias.facility_id = facility.id
+        db.session.commit()
+        for cache_key in [cache_key for cache_key in _facility_summary_cache if cache_key[0] == tenant_id]:
+            _facility_summary_cache.pop(cache_key, None)
+        
+        log_event("add_facility_alias", data={"facility_id": facility.id, "alias": key, "merged_facility_id": merged_id if merged_id != facility.id else None})
+        facility_data = next(item for item in list_facilities(tenant_id) if item["id"] == facility.id)
+        return jsonify(facility_data), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        error_msg = str(e)
+        log_event("add_facility_alias", error=error_msg, status="error")
+        return jsonify({"error": error_msg}), 500
+
+@app.route('/workouts/facilities')
+@read_replica
+def view_facilities():
+    """施設別サマリ表示"""
+    try:
+        tenant_id = current_tenant_id()
+        facilities = list_facilities(tenant_id)
+        selected = request.args.get('id', type=int) or (facilities[0]["id"] if facilities else None)
+        facility = next((item for item in facilities if item["id"] == selected), None)
+        summary = get_facility_summary(tenant_id, facility["id"]) if facility else None
+        
+        html = '''
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>施設別サマリ - 筋トレログ</title>
             <meta charset="utf-8">
-            <style>
-                body { font-family: Arial, sans-serif; margin: 20px; }
-                .container { max-width: 1200px; margin: 0 auto; }
-                .month-summary { margin: 20px 0; padding: 20px; border: 1px solid #ddd; border-radius: 8px; border-left: 4px solid #FF9800; }
-                .month-header { font-size: 1.3em; font-weight: bold; color: #2c3e50; margin-bottom: 15px; }
-                .stats-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); gap: 15px; margin-bottom: 15px; }
-                .stat-card { background: #f8f9fa; padding: 15px; border-radius: 8px; text-align: center; }
-                .stat-value { font-size: 1.5em; font-weight: bold; color: #2c3e50; }
-                .stat-label { color: #7f8c8d; margin-top: 5px; font-size: 0.9em; }
-                .muscle-stats { margin-top: 15px; }
-                .muscle-item { display: inline-block; background: #fff3e0; padding: 5px 10px; margin: 3px; border-radius: 15px; font-size: 0.9em; }
-                .button { background: #007cba; color: white; padding: 10px 20px; text-decoration: none; border-radius: 3px; display: inline-block; margin: 5px; }
-                .button:hover { background: #005a8b; }
-                .nav-buttons { margin-bottom: 20px; }
-                .progress-bar { background: #e0e0e0; height: 10px; border-radius: 5px; margin: 10px 0; }
-                .progress-fill { background: #4CAF50; height: 100%; border-radius: 5px; transition: width 0.3s ease; }
-            </style>
+            <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
         </head>
-        <body>
+        <body class="page-facilities">
             <div class="container">
-                <h1>月次サマリ</h1>
+                <h1>施設別サマリ</h1>
                 
                 <div class="nav-buttons">
                     <a href="/workouts" class="button">← ワークアウト一覧</a>
-                    <a href="/workouts/weekly" class="button">週次サマリ</a>
+                    <a href="/workouts/analytics" class="button">トレーニング負荷</a>
                     <a href="/" class="button">ホーム</a>
                 </div>
                 
-                {% for month in monthly_data %}
-                <div class="month-summary">
-                    <div class="month-header">{{ month.year }}年{{ month.month }}月</div>
-                    <div class="stats-grid">
-                        <div class="stat-card">
-                            <div class="stat-value">{{ month.session_count }}</div>
-                            <div class="stat-label">トレーニング日数</div>
-                        </div>
-                        <div class="stat-card">
-                            <div class="stat-value">{{ month.exercise_count }}</div>
-                            <div class="stat-label">総エクササイズ数</div>
-                        </div>
-                        <div class="stat-card">
-                            <div class="stat-value">{{ month.unique_exercises }}</div>
-                            <div class="stat-label">ユニーク種目数</div>
-                        </div>
-                        <div class="stat-card">
-                            <div class="stat-value">{{ "%.1f"|format(month.exercise_count / month.session_count if month.session_count > 0 else 0) }}</div>
-                            <div class="stat-label">1日平均エクササイズ数</div>
-                        </div>
-                    </div>
-                    
-                    <div class="muscle-stats">
-                        <strong>主要対象筋肉 TOP5:</strong>
-                        {% set month_muscles = [] %}
-                        {% for muscle in monthly_muscle_stats %}
-                            {% if muscle.year == month.year and muscle.month == month.month %}
-                                {% set _ = month_muscles.append(muscle) %}
-                            {% endif %}
-                        {% endfor %}
-                        {% for muscle in month_muscles[:5] %}
-                        <span class="muscle-item">{{ muscle.target_muscle }} ({{ muscle.exercise_count }}回)</span>
-                        {% endfor %}
-                    </div>
+                {% if facilities %}
+                <div class="facility-list">
+                    {% for item in facilities %}
+                    <a href="?id={{ item.id }}" class="facility-item {{ 'selected' if facility and item.id == facility.id }}">{{ item.name }} ({{ item.visits }})</a>
+                    {% endfor %}
+                </div>
+                {% endif %}
+                
+                {% if facility %}
+                <h2>{{ facility.name }}</h2>
+                {% if facility.aliases %}<div class="aliases">別名: {{ facility.aliases | join(', ') }}</div>{% endif %}
+                <p><a href="/workouts?facility={{ facility.name | urlencode }}">この施設のワークアウト</a> ・ <a href="/api/export/excel?facility={{ facility.name | urlencode }}">Excelエクスポート</a></p>
+                
+                <div class="stats-grid">
+                    <div class="stat-card"><div class="stat-value">{{ summary.visits.total }}</div><div class="stat-label">訪問回数</div></div>
+                    <div class="stat-card"><div class="stat-value">{{ summary.visits.per_week }}</div><div class="stat-label">週あたり訪問</div></div>
+                    <div class="stat-card"><div class="stat-value">{{ summary.visits.first_visit or '-' }}</div><div class="stat-label">初回</div></div>
+                    <div class="stat-card"><div class="stat-value">{{ summary.visits.last_visit or '-' }}</div><div class="stat-label">最終</div></div>
                 </div>
+                
+                <h3>月別訪問</h3>
+                <table>
+                    <tr><th>月</th><th>訪問</th></tr>
+                    {% for month in summary.visits.by_month %}
+                    <tr><td>{{ month.month }}</td><td>{{ month.visits }}</td></tr>
+                    {% endfor %}
+                </table>
+                
+                <h3>施設での自己ベスト</h3>
+                <table>
+                    <tr><th>種目</th><th>この施設</th><th>全施設</th></tr>
+                    {% for record in summary.personal_records %}
+                    <tr>
+                        <td>{{ record.exercise }}</td>
+                        <td class="{{ 'best' if record.is_overall_best }}">{{ record.weight }} ({{ record.best_kg }}kg)</td>
+                        <td>{{ record.overall_best_kg }}kg</td>
+                    </tr>
+                    {% endfor %}
+                </table>
+                
+                <h3>実施種目</h3>
+                <table>
+                    <tr><th>種目</th><th>セッション数</th><th>セット数</th></tr>
+                    {% for exercise in summary.exercises %}
+                    <tr><td>{{ exercise.name }}</td><td>{{ exercise.sessions }}</td><td>{{ exercise.sets }}</td></tr>
+                    {% endfor %}
+                </table>
                 {% else %}
-                <p>まだ月次データがありません。</p>
-                {% endfor %}
+                <p>まだ施設の記録がありません。</p>
+                {% endif %}
             </div>
         </body>
         </html>
         '''
         
-        return render_template_string(html, monthly_data=monthly_data, monthly_muscle_stats=monthly_muscle_stats)
+        return render_template_string(html, facilities=facilities, facility=facility, summary=summary)
         
     except Exception as e:
         return f"エラーが発生しました: {str(e)}", 500
 
-@app.route('/logs')
-def view_logs():
-    """処理ログの表示"""
-    logs = []
-    if LOGS_FILE.exists():
+# トレーニングカレンダー（年ごとの日別コンパクト配列）
+# 1年分を [セッション数: uint8 ×366][セット数: uint16 ×366][部位ビット: uint16 ×366] のバイナリで保持
+CALENDAR_DAYS = 366
+MUSCLE_GROUPS = (
+    ('胸', ('胸', 'chest', 'pec')),
+    ('背中', ('背', '広背', '僧帽', 'back', 'lat', 'trap')),
+    ('脚', ('脚', '大腿', 'ハム', '臀', 'お尻', 'ふくらはぎ', 'leg', 'quad', 'hamstring', 'glute', 'calf')),
+    ('肩', ('肩', '三角', 'shoulder', 'delt')),
+    ('腕', ('腕', '二頭', '三頭', 'bicep', 'tricep', 'arm')),
+    ('腹', ('腹', '体幹', 'abs', 'core')),
+    ('その他', ()),
+)
+_muscle_group_cache = {}
+
+def muscle_group_bit(target_muscle):
+    """対象筋肉を部位グループのビットに変換"""
+    if not target_muscle:
+        return 0
+    bit = _muscle_group_cache.get(target_muscle)
+    if bit is None:
+        name = target_muscle.lower()
+        index = next(
+            (i for i, (_, keywords) in enumerate(MUSCLE_GROUPS) if any(keyword in name for keyword in keywords)),
+            len(MUSCLE_GROUPS) - 1
+        )
+        bit = 1 << index
+        if len(_muscle_group_cache) < 10000:
+            _muscle_group_cache[target_muscle] = bit
+    return bit
+
+def empty_calendar():
+    """空のカレンダー配列 (セッション数, セット数, 部位ビット)"""
+    return bytearray(CALENDAR_DAYS), array('H', bytes(CALENDAR_DAYS * 2)), array('H', bytes(CALENDAR_DAYS * 2))
+
+def unpack_calendar(data):
+    """バイナリから (セッション数, セット数, 部位ビット) の配列に展開"""
+    sessions = bytearray(data[:CALENDAR_DAYS])
+    sets = array('H')
+    sets.frombytes(data[CALENDAR_DAYS:CALENDAR_DAYS * 3])
+    muscles = array('H')
+    muscles.frombytes(data[CALENDAR_DAYS * 3:CALENDAR_DAYS * 5])
+    return sessions, sets, muscles
+
+def pack_calendar(sessions, sets, muscles):
+    """配列をバイナリに詰める"""
+    return bytes(sessions) + sets.tobytes() + muscles.tobytes()
+
+def aggregate_calendar_days(tenant_id, dates):
+    """指定日の (セッション数, セット数, 部位ビット) を1クエリで集計"""
+    days = {day: [0, 0, 0] for day in dates}
+    if not days:
+        return days
+    rows = db.session.query(
+        WorkoutSession.date, WorkoutSession.id, WorkoutLog.sets, WorkoutLog.target_muscle
+    ).outerjoin(WorkoutLog, LIVE_EXERCISE_JOIN).filter(
+        WorkoutSession.tenant_id == tenant_id,
+        WorkoutSession.date.in_(list(days))
+    ).all()
+    
+    seen_sessions = set()
+    for day, session_id, sets, target_muscle in rows:
+        values = days[day]
+        if session_id not in seen_sessions:
+            seen_sessions.add(session_id)
+            values[0] += 1
+        values[1] += sets or 0
+        values[2] |= muscle_group_bit(target_muscle)
+    return days
+
+def build_calendar(tenant_id, year):
+    """1年分のカレンダー配列をDBから作成"""
+    sessions, sets, muscles = empty_calendar()
+    rows = db.session.query(
+        WorkoutSession.date, WorkoutSession.id, WorkoutLog.sets, WorkoutLog.target_muscle
+    ).outerjoin(WorkoutLog, LIVE_EXERCISE_JOIN).filter(
+        WorkoutSession.tenant_id == tenant_id,
+        WorkoutSession.date >= datetime.date(year, 1, 1),
+        WorkoutSession.date <= datetime.date(year, 12, 31)
+    ).all()
+    
+    seen_sessions = set()
+    for day, session_id, day_sets, target_muscle in rows:
+        index = day.timetuple().tm_yday - 1
+        if session_id not in seen_sessions:
+            seen_sessions.add(session_id)
+            sessions[index] = min(sessions[index] + 1, 255)
+        sets[index] = min(sets[index] + (day_sets or 0), 65535)
+        muscles[index] |= muscle_group_bit(target_muscle)
+    return pack_calendar(sessions, sets, muscles)
+
+# カレンダーを表示できる年の範囲（datetime.date で扱える範囲）
+MIN_CALENDAR_YEAR = 1900
+MAX_CALENDAR_YEAR = 9999
+
+def get_calendar_data(tenant_id, year):
+    """カレンダー配列を取得（未作成の年はその場で集計し、保存はしない。GETで書き込まない）"""
+    index = db.session.get(CalendarIndex, (tenant_id, year))
+    if index is not None:
+        return index.data
+    return build_calendar(tenant_id, year)
+
+def refresh_calendar_days(dates, tenant_id=None):
+    """書き込み後に、作成済みのカレンダー配列の該当日だけを更新（コミットは呼び出し側）"""
+    tenant_id = tenant_id or current_tenant_id()
+    dates_by_year = {}
+    for day in set(dates):
+        dates_by_year.setdefault(day.year, []).append(day)
+    
+    for year, year_dates in dates_by_year.items():
+        index_query = db.session.query(CalendarIndex).filter_by(tenant_id=tenant_id, year=year)
+        index = index_query.with_for_update().first()
+        if index is None:
+            # 未作成の年はこの書き込みを含めて1年分を作成する
+            created = db.session.execute(
+                dialect_insert(CalendarIndex).values(
+                    tenant_id=tenant_id, year=year, data=build_calendar(tenant_id, year),
+                    updated_at=datetime.datetime.utcnow()
+                ).on_conflict_do_nothing(index_elements=[CalendarIndex.tenant_id, CalendarIndex.year])
+            ).rowcount
+            if created:
+                continue
+            # 同時に作成された場合は、その配列にこの書き込みの日を反映する
+            index = index_query.with_for_update().first()
+        sessions, sets, muscles = unpack_calendar(index.data)
+        for day, (day_sessions, day_sets, day_muscles) in aggregate_calendar_days(tenant_id, year_dates).items():
+            position = day.timetuple().tm_yday - 1
+            sessions[position] = min(day_sessions, 255)
+            sets[position] = min(day_sets, 65535)
+            muscles[position] = day_muscles
+        index.data = pack_calendar(sessions, sets, muscles)
+        index.updated_at = datetime.datetime.utcnow()
+
+def refresh_calendar_for_sessions(session_ids, tenant_id=None):
+    """セッションIDから日付を求めてカレンダーを更新"""
+    if not session_ids:
+        return
+    tenant_id = tenant_id or current_tenant_id()
+    dates = [row[0] for row in db.session.query(WorkoutSession.date).filter(
+        WorkoutSession.tenant_id == tenant_id,
+        WorkoutSession.id.in_(list(session_ids))
+    )]
+    refresh_calendar_days(dates, tenant_id)
+
+def calendar_payload(year, data):
+    """カレンダー配列をJSON用のdictに変換（セット数から強度0〜4を算出）"""
+    sessions, sets, muscles = unpack_calendar(data)
+    days_in_year = 366 if calendar.isleap(year) else 365
+    trained_sets = sorted(value for value in sets[:days_in_year] if value)
+    # トレーニング日のセット数の四分位で強度を決める
+    thresholds = [trained_sets[len(trained_sets) * q // 4] for q in (1, 2, 3)] if trained_sets else []
+    intensity = [
+        0 if not sessions[i] else 1 + sum(sets[i] > threshold for threshold in thresholds)
+        for i in range(days_in_year)
+    ]
+    return {
+        "year": year,
+        "start": datetime.date(year, 1, 1).isoformat(),
+        "muscle_groups": [name for name, _ in MUSCLE_GROUPS],
+        "sessions": list(sessions[:days_in_year]),
+        "sets": sets[:days_in_year].tolist(),
+        "muscles": muscles[:days_in_year].tolist(),
+        "intensity": intensity,
+        "training_days": sum(1 for value in sessions[:days_in_year] if value),
+    }
+
+@app.route('/api/calendar', methods=['GET'])
+@conditional_get(workout_data_stamp)
+def get_calendar():
+    """年間トレーニングカレンダー（format=binary で生の配列を返す）"""
+    try:
+        year = request.args.get('year', datetime.date.today().year, type=int)
+        if not MIN_CALENDAR_YEAR <= year <= MAX_CALENDAR_YEAR:
+            return jsonify({"error": "year is out of range"}), 400
+        data = get_calendar_data(current_tenant_id(), year)
+        
+        if request.args.get('format') == 'binary':
+            response = make_response(data)
+            response.headers['Content-Type'] = 'application/octet-stream'
+            response.headers['X-Calendar-Layout'] = 'sessions:u8[366],sets:u16le[366],muscles:u16le[366]'
+            return response
+        
+        return jsonify(calendar_payload(year, data)), 200
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ログ・受信データ・会話ビューアの検索とページング
+VIEWER_PER_PAGE = 20
+VIEWER_MAX_PER_PAGE = 100
+
+def viewer_params():
+    """ビューアの検索条件（event_type, status, since, until, q, page, per_page）をクエリから取得"""
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    try:
+        per_page = min(max(int(request.args.get('per_page', VIEWER_PER_PAGE)), 1), VIEWER_MAX_PER_PAGE)
+    except ValueError:
+        per_page = VIEWER_PER_PAGE
+    return {
+        'event_type': request.args.get('event_type', '').strip(),
+        'status': request.args.get('status', '').strip(),
+        'since': viewer_time(request.args.get('since', '')),
+        'until': viewer_time(request.args.get('until', '')),
+        'q': request.args.get('q', '').strip(),
+        'page': page,
+        'per_page': per_page,
+    }
+
+def viewer_time(value):
+    """since/until をタイムスタンプと文字列で比較できる形（"2025-06-09" / "2025-06-09T12:00"）に揃える（不正な値は指定なし）"""
+    value = value.strip().replace(' ', 'T', 1)
+    try:
+        datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return ''
+    return value
+
+def entry_matches(entry, params, search_text=None):
+    """エントリが検索条件に合うか
+
+    since はその時刻以降、until はその日付・時刻を含む（タイムスタンプの先頭を until の長さで比較）。
+    search_text は検索用テキスト、またはそれを返す関数（キーワード指定時だけ呼ぶ）。
+    """
+    if params['event_type'] and entry.get('event_type') != params['event_type']:
+        return False
+    if params['status'] and entry.get('status') != params['status']:
+        return False
+    timestamp = entry.get('timestamp') or ''
+    if params['since'] and timestamp < params['since']:
+        return False
+    if params['until'] and timestamp[:len(params['until'])] > params['until']:
+        return False
+    if params['q']:
+        if search_text is None:
+            search_text = json.dumps(entry, ensure_ascii=False, default=str).lower()
+        elif callable(search_text):
+            search_text = search_text()
+        if params['q'].lower() not in search_text:
+            return False
+    return True
+
+def paginate_entries(newest_first, params, load=None):
+    """新しい順の (エントリ, 検索用テキスト) を走査し、条件に合うもののうち指定ページ分だけ返す
+
+    load を指定した場合、エントリは絞り込み用の項目だけで、ページに含めるものだけを load で読み込む。
+    """
+    start = (params['page'] - 1) * params['per_page']
+    end = start + params['per_page']
+    items = []
+    total = 0
+    for entry, search_text in newest_first:
+        if entry_matches(entry, params, search_text):
+            if start <= total < end:
+                items.append(entry)
+            total += 1
+    return {
+        'items': [load(item) for item in items] if load else items,
+        'total': total,
+        'page': params['page'],
+        'per_page': params['per_page'],
+        'pages': max((total + params['per_page'] - 1) // params['per_page'], 1),
+    }
+
+def query_logs(params):
+    """現在のテナントの処理ログ（リングバッファ）を検索"""
+    entries = log_buffer.entries(current_tenant_id())
+    return paginate_entries(((entry, None) for entry in reversed(entries)), params)
+
+def query_data_file(default_path, params):
+    """現在のテナントの受信データ・会話データファイルを索引で検索（読み込むのはキーワード検索とページの行だけ）"""
+    path = tenant_data_file(default_path)
+    migrate_legacy_data_file(path)
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return paginate_entries((), params)
+    with f:
+        rows = data_file_index.rows(path, f)[-DATA_FILE_MAX_ENTRIES:]
+        newest_first = ((row, lambda row=row: read_span(f, row["span"]).decode('utf-8').lower()) for row in reversed(rows))
+        return paginate_entries(newest_first, params, load=lambda row: json.loads(read_span(f, row["span"])))
+
+def viewer_page_url(page):
+    """検索条件を保ったまま別ページへのURLを作る"""
+    args = request.args.to_dict()
+    args['page'] = page
+    return url_for(request.endpoint, **args)
+
+# 各ビューア共通の検索フォームとページャ
+VIEWER_FILTER_HTML = '''
+<form method="get" class="viewer-filter" style="margin: 10px 0; padding: 10px; background: #f9f9f9; border-radius: 5px;">
+    {% if event_filters %}
+    <input type="text" name="event_type" value="{{ params.event_type }}" placeholder="イベント種別">
+    <select name="status">
+        <option value="">ステータス（すべて）</option>
+        <option value="success" {{ 'selected' if params.status == 'success' }}>success</option>
+        <option value="error" {{ 'selected' if params.status == 'error' }}>error</option>
+    </select>
+    {% endif %}
+    <input type="text" name="since" value="{{ params.since }}" placeholder="開始 (YYYY-MM-DD)">
+    <input type="text" name="until" value="{{ params.until }}" placeholder="終了 (YYYY-MM-DD)">
+    <input type="search" name="q" value="{{ params.q }}" placeholder="キーワード">
+    <button type="submit">検索</button>
+    <span style="color: #666;">{{ result.total }}件</span>
+</form>
+'''
+
+VIEWER_PAGER_HTML = '''
+{% if result.pages > 1 %}
+<div class="pager" style="margin: 15px 0;">
+    {% if result.page > 1 %}<a href="{{ page_url(result.page - 1) }}" class="button">← 新しい</a>{% endif %}
+    <span>{{ result.page }} / {{ result.pages }}</span>
+    {% if result.page < result.pages %}<a href="{{ page_url(result.page + 1) }}" class="button">古い →</a>{% endif %}
+</div>
+{% endif %}
+'''
+
+def render_viewer(html, result, params, event_filters=False, **context):
+    """検索フォーム・ページャ付きでビューアを描画"""
+    widgets = {'params': params, 'result': result, 'event_filters': event_filters, 'page_url': viewer_page_url}
+    return render_template_string(
+        html,
+        filter_form=render_template_string(VIEWER_FILTER_HTML, **widgets),
+        pager=render_template_string(VIEWER_PAGER_HTML, **widgets),
+        **context
+    )
+
+@app.route('/api/logs', methods=['GET'])
+@conditional_get(log_buffer_stamp)
+def get_logs():
+    """処理ログをJSONで取得（検索・ページング対応）"""
+    return jsonify(query_logs(viewer_params()))
+
+@app.route('/api/received-data', methods=['GET'])
+@conditional_get(lambda: data_file_stamp(RECEIVED_DATA_FILE))
+def get_received_data():
+    """受信データをJSONで取得（検索・ページング対応）"""
+    return jsonify(query_data_file(RECEIVED_DATA_FILE, viewer_params()))
+
+@app.route('/api/conversations', methods=['GET'])
+@conditional_get(lambda: data_file_stamp(CONVERSATIONS_FILE))
+def get_conversations():
+    """会話データをJSONで取得（検索・ページング対応）"""
+    return jsonify(query_data_file(CONVERSATIONS_FILE, viewer_params()))
+
+def format_sse(event):
+    """(ID, 種別, データ) をSSEのメッセージに整形"""
+    event_id, event_type, payload = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+@app.route('/api/events/stream', methods=['GET'])
+def stream_events():
+    """処理ログ・ワークアウト・会話の保存をServer-Sent Eventsで配信（?types=log,workout,conversation で絞り込み）"""
+    event_types = {name.strip() for name in request.args.get('types', '').split(',') if name.strip()} or None
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    except (TypeError, ValueError):
+        last_event_id = None
+    
+    subscriber = event_broker.subscribe(current_tenant_id(), event_types, last_event_id)
+    if subscriber is None:
+        response = jsonify({"error": "Too many event stream subscribers"})
+        response.headers['Retry-After'] = str(int(EVENT_HEARTBEAT_SECONDS))
+        return response, 503
+    
+    def generate():
+        deadline = time.monotonic() + EVENT_STREAM_MAX_SECONDS
         try:
-            with open(LOGS_FILE, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        except:
-            logs = []
+            yield f"retry: {int(EVENT_HEARTBEAT_SECONDS * 1000)}\n\n"
+            while time.monotonic() < deadline:
+                # イベントがなければ一定間隔でハートビート（コメント行）を送る
+                if not subscriber.ready.wait(EVENT_HEARTBEAT_SECONDS):
+                    yield ": heartbeat\n\n"
+                    continue
+                events = subscriber.drain()
+                if subscriber.dropped:
+                    yield format_sse((0, "dropped", {"count": subscriber.dropped}))
+                    subscriber.dropped = 0
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            event_broker.unsubscribe(subscriber)
     
-    # 最新のログから表示
-    logs.reverse()
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/logs/live')
+def view_live_logs():
+    """処理ログのライブ表示（/api/events/stream を購読）"""
+    html = '''
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>ライブログ - GPTs Action Test</title>
+        <meta charset="utf-8">
+        <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
+    </head>
+    <body class="page-live">
+        <div class="container">
+            <h1>ライブログ</h1>
+            <p><a href="/" class="button">← ホームに戻る</a> <a href="/logs" class="button">処理ログ（検索）</a></p>
+            <div class="status" id="status">接続中...</div>
+            <div id="events"></div>
+        </div>
+        <script src="{{ asset_url('js/live.js') }}"></script>
+    </body>
+    </html>
+    '''
+    return render_template_string(html)
+
+@app.route('/logs')
+@conditional_get(log_buffer_stamp)
+def view_logs():
+    """処理ログの表示（メモリ上のリングバッファから、ディスクは読まない）"""
+    params = viewer_params()
+    result = query_logs(params)
     
     html = '''
     <!DOCTYPE html>
@@ -1135,27 +4833,18 @@ def view_logs():
     <head>
         <title>処理ログ - GPTs Action Test</title>
         <meta charset="utf-8">
-        <style>
-            body { font-family: Arial, sans-serif; margin: 20px; }
-            .container { max-width: 1000px; margin: 0 auto; }
-            .log-entry { margin: 10px 0; padding: 15px; border: 1px solid #ddd; border-radius: 5px; }
-            .log-success { border-left: 4px solid #4CAF50; }
-            .log-error { border-left: 4px solid #f44336; }
-            .timestamp { color: #666; font-size: 0.9em; }
-            .data { background: #f5f5f5; padding: 10px; margin: 10px 0; border-radius: 3px; font-family: monospace; }
-            .button { background: #007cba; color: white; padding: 10px 20px; text-decoration: none; border-radius: 3px; display: inline-block; margin: 5px; }
-            .button:hover { background: #005a8b; }
-        </style>
+        <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
     </head>
-    <body>
+    <body class="page-logs">
         <div class="container">
             <h1>処理ログ</h1>
-            <p><a href="/" class="button">← ホームに戻る</a> <a href="/data" class="button">受信データを見る</a> <a href="/conversations" class="button">会話データを見る</a></p>
+            <p><a href="/" class="button">← ホームに戻る</a> <a href="/logs/live" class="button">ライブ表示</a> <a href="/data" class="button">受信データを見る</a> <a href="/conversations" class="button">会話データを見る</a></p>
+            {{ filter_form | safe }}
             
             {% if logs %}
                 {% for log in logs %}
                 <div class="log-entry {{ 'log-success' if log.status == 'success' else 'log-error' }}">
-                    <div class="timestamp">{{ log.timestamp }}</div>
+                    <div class="timestamp">{{ log.timestamp }}<span class="level">{{ log.level }}</span></div>
                     <div><strong>イベント:</strong> {{ log.event_type }}</div>
                     <div><strong>ステータス:</strong> {{ log.status }}</div>
                     {% if log.error %}
@@ -1167,28 +4856,22 @@ def view_logs():
                     {% endif %}
                 </div>
                 {% endfor %}
+                {{ pager | safe }}
             {% else %}
-                <p>まだログがありません。</p>
+                <p>{{ '条件に合うログがありません。' if request.args else 'まだログがありません。' }}</p>
             {% endif %}
         </div>
     </body>
     </html>
     '''
-    return render_template_string(html, logs=logs)
+    return render_viewer(html, result, params, event_filters=True, logs=result['items'])
 
 @app.route('/data')
+@conditional_get(lambda: data_file_stamp(RECEIVED_DATA_FILE))
 def view_data():
     """受信データの表示"""
-    received_data = []
-    if RECEIVED_DATA_FILE.exists():
-        try:
-            with open(RECEIVED_DATA_FILE, 'r', encoding='utf-8') as f:
-                received_data = json.load(f)
-        except:
-            received_data = []
-    
-    # 最新のデータから表示
-    received_data.reverse()
+    params = viewer_params()
+    result = query_data_file(RECEIVED_DATA_FILE, params)
     
     html = '''
     <!DOCTYPE html>
@@ -1196,20 +4879,13 @@ def view_data():
     <head>
         <title>受信データ - GPTs Action Test</title>
         <meta charset="utf-8">
-        <style>
-            body { font-family: Arial, sans-serif; margin: 20px; }
-            .container { max-width: 1000px; margin: 0 auto; }
-            .data-entry { margin: 10px 0; padding: 15px; border: 1px solid #ddd; border-radius: 5px; border-left: 4px solid #2196F3; }
-            .timestamp { color: #666; font-size: 0.9em; }
-            .data { background: #f5f5f5; padding: 10px; margin: 10px 0; border-radius: 3px; font-family: monospace; }
-            .button { background: #007cba; color: white; padding: 10px 20px; text-decoration: none; border-radius: 3px; display: inline-block; margin: 5px; }
-            .button:hover { background: #005a8b; }
-        </style>
+        <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
     </head>
-    <body>
+    <body class="page-data">
         <div class="container">
             <h1>受信データ</h1>
             <p><a href="/" class="button">← ホームに戻る</a> <a href="/logs" class="button">処理ログを見る</a> <a href="/conversations" class="button">会話データを見る</a></p>
+            {{ filter_form | safe }}
             
             {% if received_data %}
                 {% for entry in received_data %}
@@ -1218,28 +4894,22 @@ def view_data():
                     <div class="data">{{ entry.data | tojson(indent=2) }}</div>
                 </div>
                 {% endfor %}
+                {{ pager | safe }}
             {% else %}
-                <p>まだ受信データがありません。</p>
+                <p>{{ '条件に合う受信データがありません。' if request.args else 'まだ受信データがありません。' }}</p>
             {% endif %}
         </div>
     </body>
     </html>
     '''
-    return render_template_string(html, received_data=received_data)
+    return render_viewer(html, result, params, received_data=result['items'])
 
 @app.route('/conversations')
+@conditional_get(lambda: data_file_stamp(CONVERSATIONS_FILE))
 def view_conversations():
     """会話データの表示"""
-    conversations = []
-    if CONVERSATIONS_FILE.exists():
-        try:
-            with open(CONVERSATIONS_FILE, 'r', encoding='utf-8') as f:
-                conversations = json.load(f)
-        except:
-            conversations = []
-    
-    # 最新の会話から表示
-    conversations.reverse()
+    params = viewer_params()
+    result = query_data_file(CONVERSATIONS_FILE, params)
     
     html = '''
     <!DOCTYPE html>
@@ -1247,33 +4917,13 @@ def view_conversations():
     <head>
         <title>会話データ - GPTs Action Test</title>
         <meta charset="utf-8">
-        <style>
-            body { font-family: Arial, sans-serif; margin: 20px; }
-            .container { max-width: 1200px; margin: 0 auto; }
-            .conversation-entry { margin: 15px 0; padding: 20px; border: 1px solid #ddd; border-radius: 8px; border-left: 4px solid #9C27B0; }
-            .timestamp { color: #666; font-size: 0.9em; margin-bottom: 10px; }
-            .conversation-id { color: #9C27B0; font-weight: bold; margin-bottom: 10px; }
-            .section { margin: 10px 0; }
-            .section-title { font-weight: bold; color: #333; margin-bottom: 5px; }
-            .user-input { background: #e3f2fd; padding: 10px; border-radius: 5px; margin: 5px 0; }
-            .assistant-response { background: #f3e5f5; padding: 10px; border-radius: 5px; margin: 5px 0; }
-            .summary { background: #fff3e0; padding: 10px; border-radius: 5px; margin: 5px 0; }
-            .topics { background: #e8f5e8; padding: 10px; border-radius: 5px; margin: 5px 0; }
-            .sentiment { display: inline-block; padding: 3px 8px; border-radius: 12px; font-size: 0.8em; }
-            .sentiment-positive { background: #4CAF50; color: white; }
-            .sentiment-negative { background: #f44336; color: white; }
-            .sentiment-neutral { background: #757575; color: white; }
-            .metadata { background: #f5f5f5; padding: 10px; border-radius: 5px; margin: 5px 0; font-family: monospace; font-size: 0.9em; }
-            .button { background: #007cba; color: white; padding: 10px 20px; text-decoration: none; border-radius: 3px; display: inline-block; margin: 5px; }
-            .button:hover { background: #005a8b; }
-            .tags { margin: 5px 0; }
-            .tag { background: #e0e0e0; padding: 2px 6px; border-radius: 3px; font-size: 0.8em; margin-right: 5px; }
-        </style>
+        <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
     </head>
-    <body>
+    <body class="page-conversations">
         <div class="container">
             <h1>会話データ</h1>
             <p><a href="/" class="button">← ホームに戻る</a> <a href="/logs" class="button">処理ログを見る</a> <a href="/data" class="button">受信データを見る</a></p>
+            {{ filter_form | safe }}
             
             {% if conversations %}
                 {% for conversation in conversations %}
@@ -1357,25 +5007,29 @@ def view_conversations():
                     {% endif %}
                 </div>
                 {% endfor %}
+                {{ pager | safe }}
             {% else %}
-                <p>まだ会話データがありません。</p>
+                <p>{{ '条件に合う会話データがありません。' if request.args else 'まだ会話データがありません。' }}</p>
             {% endif %}
         </div>
     </body>
     </html>
     '''
-    return render_template_string(html, conversations=conversations)
+    return render_viewer(html, result, params, conversations=result['items'])
 
 @app.route('/export')
+@read_replica
 def export_page():
     """エクスポートページ（フィルター付き）"""
     try:
         # ユニークな種目名と筋肉部位を取得
-        unique_exercises = db.session.query(WorkoutLog.exercise_name).distinct().order_by(WorkoutLog.exercise_name).all()
-        unique_muscles = db.session.query(WorkoutLog.target_muscle).filter(WorkoutLog.target_muscle.isnot(None)).distinct().order_by(WorkoutLog.target_muscle).all()
+        tenant_logs = db.session.query(WorkoutLog).filter(WorkoutLog.tenant_id == current_tenant_id())
+        unique_exercises = tenant_logs.with_entities(WorkoutLog.exercise_name).distinct().order_by(WorkoutLog.exercise_name).all()
+        unique_muscles = tenant_logs.with_entities(WorkoutLog.target_muscle).filter(WorkoutLog.target_muscle.isnot(None)).distinct().order_by(WorkoutLog.target_muscle).all()
         
         exercises = [ex[0] for ex in unique_exercises]
         muscles = [muscle[0] for muscle in unique_muscles]
+        facilities = [facility["name"] for facility in list_facilities(current_tenant_id())]
         
         html = '''
         <!DOCTYPE html>
@@ -1383,28 +5037,9 @@ def export_page():
         <head>
             <title>Excelエクスポート - 筋トレログ</title>
             <meta charset="utf-8">
-            <style>
-                body { font-family: Arial, sans-serif; margin: 20px; }
-                .container { max-width: 800px; margin: 0 auto; }
-                .filter-section { background: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0; }
-                .filter-group { margin: 15px 0; }
-                .filter-label { display: block; font-weight: bold; margin-bottom: 5px; color: #2c3e50; }
-                .filter-input { width: 100%; padding: 8px; border: 1px solid #ddd; border-radius: 4px; font-size: 14px; }
-                .filter-select { width: 100%; padding: 8px; border: 1px solid #ddd; border-radius: 4px; font-size: 14px; }
-                .button { background: #007cba; color: white; padding: 12px 24px; text-decoration: none; border-radius: 4px; display: inline-block; margin: 10px 5px; border: none; cursor: pointer; font-size: 16px; }
-                .button:hover { background: #005a8b; }
-                .button-export { background: #28a745; }
-                .button-export:hover { background: #218838; }
-                .button-clear { background: #6c757d; }
-                .button-clear:hover { background: #545b62; }
-                .nav-buttons { margin-bottom: 20px; }
-                .filter-row { display: grid; grid-template-columns: 1fr 1fr; gap: 15px; }
-                .info-box { background: #e3f2fd; padding: 15px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #2196F3; }
-                .export-options { margin: 20px 0; }
-                .export-preview { background: #fff3e0; padding: 15px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #FF9800; }
-            </style>
+            <link rel="stylesheet" href="{{ asset_url('css/app.css') }}">
         </head>
-        <body>
+        <body class="page-export">
             <div class="container">
                 <h1>Excel エクスポート</h1>
                 
@@ -1415,7 +5050,7 @@ def export_page():
                 
                 <div class="info-box">
                     <strong>📊 Excelエクスポート機能</strong><br>
-                    筋トレログをExcelファイルでダウンロードできます。日付、種目、筋肉部位でフィルタリングできます。
+                    筋トレログをExcelファイルでダウンロードできます。日付、種目、筋肉部位、施設でフィルタリングできます。
                 </div>
                 
                 <form id="exportForm" class="filter-section">
@@ -1453,6 +5088,18 @@ def export_page():
                         </div>
                     </div>
                     
+                    <div class="filter-row">
+                        <div class="filter-group">
+                            <label class="filter-label">施設</label>
+                            <select id="facility" name="facility" class="filter-select">
+                                <option value="">すべての施設</option>
+                                {% for facility in facilities %}
+                                <option value="{{ facility }}">{{ facility }}</option>
+                                {% endfor %}
+                            </select>
+                        </div>
+                    </div>
+                    
                     <div class="export-options">
                         <button type="button" onclick="exportExcel()" class="button button-export">📊 Excelダウンロード</button>
                         <button type="button" onclick="clearFilters()" class="button button-clear">フィルタークリア</button>
@@ -1473,93 +5120,916 @@ def export_page():
                 </div>
             </div>
             
-            <script>
-            function exportExcel() {
-                const form = document.getElementById('exportForm');
-                const formData = new FormData(form);
-                
-                // クエリパラメータを構築
-                const params = new URLSearchParams();
-                for (let [key, value] of formData.entries()) {
-                    if (value) {
-                        params.append(key, value);
-                    }
-                }
-                
-                // Excelダウンロード用URLを構築
-                const downloadUrl = '/api/export/excel?' + params.toString();
-                
-                // ダウンロードを開始
-                window.location.href = downloadUrl;
-            }
-            
-            function clearFilters() {
-                document.getElementById('start_date').value = '';
-                document.getElementById('end_date').value = '';
-                document.getElementById('exercise_name').value = '';
-                document.getElementById('target_muscle').value = '';
-                document.getElementById('previewSection').style.display = 'none';
-            }
-            
-            function previewData() {
-                const form = document.getElementById('exportForm');
-                const formData = new FormData(form);
-                
-                // フィルター条件を表示
-                let previewText = 'フィルター条件:<br>';
-                
-                const startDate = formData.get('start_date');
-                const endDate = formData.get('end_date');
-                const exerciseName = formData.get('exercise_name');
-                const targetMuscle = formData.get('target_muscle');
-                
-                if (startDate) previewText += `・ 開始日: ${startDate}<br>`;
-                if (endDate) previewText += `・ 終了日: ${endDate}<br>`;
-                if (exerciseName) previewText += `・ 種目名: ${exerciseName}<br>`;
-                if (targetMuscle) previewText += `・ 筋肉部位: ${targetMuscle}<br>`;
-                
-                if (!startDate && !endDate && !exerciseName && !targetMuscle) {
-                    previewText += '・ フィルターなし（全データ）<br>';
-                }
-                
-                document.getElementById('previewContent').innerHTML = previewText;
-                document.getElementById('previewSection').style.display = 'block';
-            }
-            
-            // ページ読み込み時にデフォルト日付を設定（オプション）
-            document.addEventListener('DOMContentLoaded', function() {
-                // 今日の日付を取得
-                const today = new Date();
-                const todayStr = today.toISOString().split('T')[0];
-                
-                // 30日前の日付を計算
-                const thirtyDaysAgo = new Date(today);
-                thirtyDaysAgo.setDate(today.getDate() - 30);
-                const thirtyDaysAgoStr = thirtyDaysAgo.toISOString().split('T')[0];
-                
-                // デフォルトで過去30日を設定しない（ユーザーが手動で設定）
-                // document.getElementById('start_date').value = thirtyDaysAgoStr;
-                // document.getElementById('end_date').value = todayStr;
-            });
-            </script>
+            <script src="{{ asset_url('js/export.js') }}"></script>
         </body>
         </html>
         '''
         
-        return render_template_string(html, exercises=exercises, muscles=muscles)
+        return render_template_string(html, exercises=exercises, muscles=muscles, facilities=facilities)
         
     except Exception as e:
         return f"エラーが発生しました: {str(e)}", 500
 
+# 年単位パーティションとアーカイブ
+PARTITION_YEARS_AHEAD = 1  # partition-logs で先行作成する将来の年数
+
+def is_logs_partitioned():
+    """workout_logs がパーティションテーブルか（PostgreSQLのみ）"""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'workout_logs'::regclass"
+    )).first() is not None
+
+def create_log_partition(year):
+    """指定年のパーティションを作成（既存なら何もしない）"""
+    db.session.execute(text(
+        f"CREATE TABLE IF NOT EXISTS workout_logs_y{year:04d} PARTITION OF workout_logs "
+        f"FOR VALUES FROM ('{year:04d}-01-01') TO ('{year + 1:04d}-01-01')"
+    ))
+
+def partition_workout_logs():
+    """既存の workout_logs を session_date の年単位レンジパーティションに移し替える
+
+    主キーは (id, session_date) になる。範囲外の日付はデフォルトパーティションに入る。
+    """
+    db.session.execute(text('ALTER TABLE workout_logs RENAME TO workout_logs_unpartitioned'))
+    db.session.execute(text('ALTER TABLE workout_logs_unpartitioned RENAME CONSTRAINT workout_logs_pkey TO workout_logs_unpartitioned_pkey'))
+    for ddl in SCHEMA_INDEXES:
+        if ' ON workout_logs ' in ddl:
+            db.session.execute(text(f"DROP INDEX IF EXISTS {ddl.split(' IF NOT EXISTS ')[1].split()[0]}"))
+    db.session.execute(text(
+        'CREATE TABLE workout_logs (LIKE workout_logs_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (session_date)'
+    ))
+    db.session.execute(text('ALTER TABLE workout_logs ADD PRIMARY KEY (id, session_date)'))
+    db.session.execute(text(
+        'ALTER TABLE workout_logs ADD CONSTRAINT workout_logs_session_id_fkey '
+        'FOREIGN KEY (session_id) REFERENCES workout_sessions (id)'
+    ))
+    db.session.execute(text('CREATE TABLE workout_logs_default PARTITION OF workout_logs DEFAULT'))
+    first_year = db.session.execute(text('SELECT MIN(session_date) FROM workout_logs_unpartitioned')).scalar()
+    for year in range(first_year.year if first_year else datetime.date.today().year, datetime.date.today().year + 1):
+        create_log_partition(year)
+    db.session.execute(text('INSERT INTO workout_logs SELECT * FROM workout_logs_unpartitioned'))
+    # IDのシーケンスを新しいテーブルに付け替えてから旧テーブルを削除
+    db.session.execute(text('ALTER SEQUENCE workout_logs_id_seq OWNED BY workout_logs.id'))
+    db.session.execute(text('DROP TABLE workout_logs_unpartitioned'))
+    for ddl in SCHEMA_INDEXES:
+        if ' ON workout_logs ' in ddl:
+            db.session.execute(text(ddl))
+
+def explain_export(year):
+    """指定年のエクスポートクエリの実行計画（パーティションの絞り込み確認用）"""
+    query = export_query(DEFAULT_TENANT_ID, datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+    sql = str(query.statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    prefix = 'EXPLAIN' if db.engine.dialect.name == 'postgresql' else 'EXPLAIN QUERY PLAN'
+    return [' '.join(str(column) for column in row) for row in db.session.execute(text(f'{prefix} {sql}'))]
+
+@app.cli.command('partition-logs')
+@click.option('--years-ahead', default=PARTITION_YEARS_AHEAD, show_default=True, help='先行作成する将来の年数')
+@click.option('--explain', 'explain_year', type=int, default=None, help='指定年のエクスポートクエリの実行計画を表示')
+def partition_logs_command(years_ahead, explain_year):
+    """workout_logs を年単位でパーティション化し、将来の年のパーティションを作成（PostgreSQLのみ）"""
+    if db.engine.dialect.name != 'postgresql':
+        print("Partitioning requires PostgreSQL; skipped (session_date filters still use ix_workout_logs_tenant_session_date)")
+    else:
+        if not is_logs_partitioned():
+            partition_workout_logs()
+            print("Converted workout_logs to a partitioned table")
+        this_year = datetime.date.today().year
+        for year in range(this_year, this_year + years_ahead + 1):
+            create_log_partition(year)
+        db.session.commit()
+        partitions = db.session.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'workout_logs'::regclass ORDER BY c.relname"
+        )).scalars().all()
+        print(f"Partitions: {', '.join(partitions)}")
+    if explain_year is not None:
+        print('\n'.join(explain_export(explain_year)))
+
+def load_archived_sessions(tenant_id, start_date_obj=None, end_date_obj=None):
+    """アーカイブ済みセッションのうち期間内のものを日付順に返す"""
+    query = WorkoutArchive.query.filter(WorkoutArchive.tenant_id == tenant_id)
+    if start_date_obj:
+        query = query.filter(WorkoutArchive.year >= start_date_obj.year)
+    if end_date_obj:
+        query = query.filter(WorkoutArchive.year <= end_date_obj.year)
+    
+    start_key = start_date_obj.isoformat() if start_date_obj else ''
+    end_key = end_date_obj.isoformat() if end_date_obj else '9999-12-31'
+    sessions = []
+    for archive in query.order_by(WorkoutArchive.year):
+        sessions.extend(
+            session_data for session_data in json.loads(zlib.decompress(archive.data))
+            if start_key <= session_data['date'] <= end_key
+        )
+    return sessions
+
+def archive_year(tenant_id, year):
+    """テナントの指定年のセッションを圧縮アーカイブに移し、通常テーブルから削除する
+
+    ゴミ箱にあるセッションと、ゴミ箱にあるエクササイズを含むセッションは復元できるよう残し、
+    purge-trash で完全に削除された後のアーカイブで移す。(移した件数, 残した件数) を返す。
+    """
+    year_range = (
+        WorkoutSession.tenant_id == tenant_id,
+        WorkoutSession.date >= datetime.date(year, 1, 1),
+        WorkoutSession.date <= datetime.date(year, 12, 31)
+    )
+    # 論理削除の除外条件が付かないようテーブルで参照する
+    logs = WorkoutLog.__table__
+    has_trashed_exercises = db.exists().where(logs.c.session_id == WorkoutSession.id, logs.c.deleted_at.isnot(None))
+    skipped = db.session.query(func.count(WorkoutSession.id)).filter(
+        *year_range, db.or_(WorkoutSession.deleted_at.isnot(None), has_trashed_exercises)
+    ).execution_options(include_deleted=True).scalar()
+    session_ids = db.select(WorkoutSession.id).where(*year_range, ~has_trashed_exercises)
+    sessions = fetch_sessions_data(session_ids, tenant_id=tenant_id)
+    if not sessions:
+        return 0, skipped
+    
+    archive = db.session.get(WorkoutArchive, (tenant_id, year))
+    if archive is None:
+        archive = WorkoutArchive(tenant_id=tenant_id, year=year)
+        db.session.add(archive)
+        archived = {}
+    else:
+        archived = {session_data['date']: session_data for session_data in json.loads(zlib.decompress(archive.data))}
+    # 同じ日付が既にアーカイブされていればエクササイズを追加する
+    for session_data in sessions:
+        if session_data['date'] in archived:
+            archived[session_data['date']]['exercises'].extend(session_data['exercises'])
+        else:
+            archived[session_data['date']] = session_data
+    merged = [archived[key] for key in sorted(archived)]
+    archive.data = zlib.compress(json.dumps(merged, ensure_ascii=False).encode('utf-8'), 9)
+    archive.session_count = len(merged)
+    archive.exercise_count = sum(len(session_data['exercises']) for session_data in merged)
+    archive.archived_at = datetime.datetime.utcnow()
+    
+    ids = [session_data['id'] for session_data in sessions]
+    # 通常テーブルから消えるため同期クライアントには削除として通知する
+    record_changes('exercise', [exercise['id'] for session_data in sessions for exercise in session_data['exercises']],
+                   op='delete', tenant_id=tenant_id)
+    record_changes('session', ids, op='delete', tenant_id=tenant_id)
+    db.session.execute(
+        db.delete(WorkoutLog).where(
+            WorkoutLog.session_id.in_(ids),
+            WorkoutLog.session_date >= datetime.date(year, 1, 1),
+            WorkoutLog.session_date <= datetime.date(year, 12, 31)
+        ),
+        execution_options={"synchronize_session": False}
+    )
+    db.session.execute(
+        db.delete(WorkoutSession).where(WorkoutSession.id.in_(ids)),
+        execution_options={"synchronize_session": False}
+    )
+    return len(sessions), skipped
+
+@app.cli.command('archive-logs')
+@click.option('--before', 'before_year', type=int, required=True, help='この年より前のデータをアーカイブ')
+@click.option('--tenant', 'tenant_id', default=None, help='対象テナント（省略時は全テナント）')
+def archive_logs_command(before_year, tenant_id):
+    """古い年のセッションを圧縮アーカイブ（workout_archives）に移動（Excelエクスポートには引き続き含まれる）"""
+    query = db.session.query(WorkoutSession.tenant_id, WorkoutSession.date).filter(
+        WorkoutSession.date < datetime.date(before_year, 1, 1)
+    )
+    if tenant_id:
+        query = query.filter(WorkoutSession.tenant_id == tenant_id)
+    targets = sorted({(row_tenant, row_date.year) for row_tenant, row_date in query})
+    for row_tenant, year in targets:
+        count, skipped = archive_year(row_tenant, year)
+        db.session.commit()
+        print(f"Archived {count} session(s): tenant={row_tenant} year={year}"
+              + (f" (skipped {skipped} with items in the trash; run purge-trash first)" if skipped else ""))
+    if not targets:
+        print("Nothing to archive")
+
+# 既存テーブルに後から追加したカラム（init-db で不足分のみ追加）
+SCHEMA_COLUMNS = {
+    'workout_sessions': [
+        ('version', 'INTEGER NOT NULL DEFAULT 1'),
+        ('tenant_id', f"VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_TENANT_ID}'"),
+        ('facility_id', 'INTEGER REFERENCES facilities (id)'),
+        ('deleted_at', 'TIMESTAMP'),
+    ],
+    'workout_logs': [
+        ('version', 'INTEGER NOT NULL DEFAULT 1'),
+        ('tenant_id', f"VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_TENANT_ID}'"),
+        ('session_date', 'DATE'),
+        ('deleted_at', 'TIMESTAMP'),
+        ('content_hash', 'VARCHAR(32)'),
+    ],
+}
+
+# 既存テーブルに作成するインデックス（廃止したインデックスは削除）
+SCHEMA_INDEXES = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_workout_sessions_live_date ON workout_sessions (tenant_id, date) WHERE deleted_at IS NULL',
+    'CREATE INDEX IF NOT EXISTS ix_workout_sessions_trash ON workout_sessions (tenant_id, deleted_at) WHERE deleted_at IS NOT NULL',
+    'CREATE INDEX IF NOT EXISTS ix_workout_logs_live_session ON workout_logs (tenant_id, session_id) WHERE deleted_at IS NULL',
+    'CREATE INDEX IF NOT EXISTS ix_workout_logs_trash ON workout_logs (tenant_id, deleted_at) WHERE deleted_at IS NOT NULL',
+    'CREATE INDEX IF NOT EXISTS ix_workout_logs_tenant_session_date ON workout_logs (tenant_id, session_date)',
+    'CREATE INDEX IF NOT EXISTS ix_workout_sessions_tenant_facility ON workout_sessions (tenant_id, facility_id, date)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_workout_logs_live_content ON workout_logs (tenant_id, session_id, session_date, content_hash) '
+    'WHERE deleted_at IS NULL AND content_hash IS NOT NULL',
+]
+# 論理削除の導入で部分インデックスに置き換えたものを含む
+DROPPED_INDEXES = ['uq_workout_sessions_date', 'uq_workout_sessions_tenant_date', 'ix_workout_logs_tenant_session']
+
+def merge_duplicate_sessions():
+    """テナント内で同じ日付の重複セッションを最小IDのセッションに統合"""
+    duplicates = db.session.query(
+        WorkoutSession.tenant_id, WorkoutSession.date, func.min(WorkoutSession.id)
+    ).group_by(
+        WorkoutSession.tenant_id, WorkoutSession.date
+    ).having(func.count(WorkoutSession.id) > 1).all()
+    
+    for tenant_id, session_date, keep_id in duplicates:
+        duplicate_ids = [row[0] for row in db.session.query(WorkoutSession.id).filter(
+            WorkoutSession.tenant_id == tenant_id,
+            WorkoutSession.date == session_date,
+            WorkoutSession.id != keep_id
+        )]
+        db.session.execute(
+            db.update(WorkoutLog).where(WorkoutLog.session_id.in_(duplicate_ids)).values(session_id=keep_id),
+            execution_options={"synchronize_session": False}
+        )
+        db.session.execute(
+            db.delete(WorkoutSession).where(WorkoutSession.id.in_(duplicate_ids)),
+            execution_options={"synchronize_session": False}
+        )
+    return len(duplicates)
+
+def migrate_schema():
+    """既存データベースを現在のモデルに合わせる（何度実行しても安全）"""
+    inspector = db.inspect(db.engine)
+    for table, columns in SCHEMA_COLUMNS.items():
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        for name, ddl in columns:
+            if name not in existing:
+                db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+    
+    # エクササイズのテナントを所属セッションに揃える
+    db.session.execute(text(
+        'UPDATE workout_logs SET tenant_id = (SELECT s.tenant_id FROM workout_sessions s WHERE s.id = workout_logs.session_id) '
+        'WHERE tenant_id <> (SELECT s.tenant_id FROM workout_sessions s WHERE s.id = workout_logs.session_id)'
+    ))
+    # パーティションキー用のセッション日付を補完
+    db.session.execute(text(
+        'UPDATE workout_logs SET session_date = (SELECT s.date FROM workout_sessions s WHERE s.id = workout_logs.session_id) '
+        'WHERE session_date IS NULL'
+    ))
+    
+    # 施設名のみ記録されているセッションを施設テーブルに紐付け
+    backfill_session_facilities()
+    
+    # 一意インデックス作成前に重複セッションを統合
+    merged = merge_duplicate_sessions()
+    if merged:
+        # 統合でセッション数が変わるためカレンダー配列は次回の書き込み時に作り直す（それまでは表示時に集計）
+        db.session.execute(db.delete(CalendarIndex))
+    for index_name in DROPPED_INDEXES:
+        db.session.execute(text(f'DROP INDEX IF EXISTS {index_name}'))
+    for ddl in SCHEMA_INDEXES:
+        db.session.execute(text(ddl))
+    db.session.commit()
+    return merged
+
 def create_tables():
-    """データベーステーブルを作成"""
+    """データベーステーブルを作成し、既存テーブルを移行"""
     with app.app_context():
         db.create_all()
+        return migrate_schema()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """テーブルを作成（デプロイ時に一度だけ実行: flask --app app init-db）"""
+    started = time.perf_counter()
+    merged = create_tables()
+    if merged:
+        print(f"Merged duplicate sessions for {merged} date(s)")
+    print(f"Database tables are ready ({(time.perf_counter() - started) * 1000:.1f}ms)")
+
+@app.cli.command('create-tenant')
+@click.argument('tenant_id')
+@click.option('--name', default=None, help='表示名')
+def create_tenant_command(tenant_id, name):
+    """テナントを作成してAPIキーを発行（キーはこの時だけ表示される）"""
+    if not TENANT_ID_PATTERN.match(tenant_id) or tenant_id == DEFAULT_TENANT_ID:
+        raise click.BadParameter('tenant_id must match [a-z0-9][a-z0-9_-]{0,63} and not be "default"')
+    if db.session.get(Tenant, tenant_id) is not None:
+        raise click.ClickException(f'Tenant already exists: {tenant_id}')
+    
+    api_key = secrets.token_urlsafe(32)
+    db.session.add(Tenant(id=tenant_id, name=name or tenant_id, api_key_hash=hash_api_key(api_key)))
+    db.session.commit()
+    print(f"Tenant: {tenant_id}")
+    print(f"API key: {api_key}")
+
+def percentile(values, ratio):
+    """ソート済みでないリストの百分位（最近傍）"""
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * ratio), len(ordered) - 1)]
+
+def delete_tenant_data(tenant_id):
+    """確認用の一時テナントのデータをすべて削除"""
+    db.session.rollback()
+    for model in (WorkoutLog, WorkoutSession, FacilityAlias, Facility, CalendarIndex, WorkoutArchive, ChangeLog, AuditHistory):
+        db.session.execute(db.delete(model).where(model.tenant_id == tenant_id))
+    db.session.execute(db.delete(Tenant).where(Tenant.id == tenant_id))
+    db.session.commit()
+    forget_tenant(tenant_id)
+    shutil.rmtree(DATA_DIR / "tenants" / tenant_id, ignore_errors=True)
+
+@app.cli.command('check-routes')
+@click.option('--repeat', default=10, show_default=True, help='各ルートの実行回数')
+def check_routes_command(repeat):
+    """一時テナントで主要ルートを一通り実行し、ステータスと所要時間を表示（バックエンド間の比較用）
+
+    作成したデータは終了時に削除する。4xx/5xxがあれば終了コード1。
+    """
+    tenant_id = f"check-{secrets.token_hex(4)}"
+    api_key = secrets.token_urlsafe(32)
+    db.session.add(Tenant(id=tenant_id, name=tenant_id, api_key_hash=hash_api_key(api_key)))
+    db.session.commit()
+    
+    client = unlimited_test_client()
+    adapter = app.url_map.bind('localhost')
+    timings = {}
+    failures = []
+    
+    def call(method, url, **kwargs):
+        started = time.perf_counter()
+        response = client.open(url, method=method, headers={'X-API-Key': api_key}, **kwargs)
+        endpoint = adapter.match(url.split('?')[0], method=method)[0]
+        timings.setdefault(f"{method} {endpoint}", []).append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            failures.append(f"{method} {url} -> {response.status_code}")
+        return response
+    
+    try:
+        first_day = datetime.date.today() - datetime.timedelta(days=repeat * 2)
+        session_ids = []
+        for i in range(repeat):
+            response = call('POST', '/api/workout', json={
+                'date': (first_day + datetime.timedelta(days=i * 2)).isoformat(),
+                'facility': 'check-routes',
+                'exercises': [
+                    {'name': 'ベンチプレス', 'category': 'フリーウェイト', 'weight': '60kg', 'reps': 10, 'sets': 3, 'target_muscle': '胸'},
+                    {'name': 'スクワット', 'category': 'フリーウェイト', 'weight': '80kg', 'reps': 8, 'sets': 3, 'target_muscle': '脚'},
+                ]
+            })
+            session_ids.append((response.get_json() or {}).get('session_id'))
+        session_ids = [session_id for session_id in session_ids if session_id]
+        
+        exercise_ids = []
+        for session_id in session_ids:
+            session_data = call('GET', f'/api/workout/{session_id}').get_json() or {}
+            exercise_ids.extend(exercise['id'] for exercise in session_data.get('exercises', []))
+        for exercise_id in exercise_ids[::2]:
+            call('PUT', f'/api/workout/exercise/{exercise_id}', json={'reps': 9})
+        call('PATCH', '/api/workout/exercises', json={'ids': exercise_ids, 'changes': {'notes': 'check-routes'}})
+        
+        static_urls = tuple(asset_url(name) for name in static_asset_names())
+        for _ in range(repeat):
+            for url in ('/workouts', '/workouts/weekly', '/workouts/monthly', '/workouts/analytics',
+                        '/api/analytics/training-load', '/api/calendar', '/api/export/excel', '/export',
+                        '/api/logs', '/logs', '/data', '/conversations', '/api/sync', '/api/trash',
+                        '/api/workout/duplicates', '/healthz') + static_urls:
+                call('GET', url)
+            call('POST', '/api/receive', json={'message': 'check-routes'})
+            call('POST', '/api/workout/parse', json={'texts': ['ベンチプレス 60kg×10 3set', 'スクワット 80kg 8回 3セット']})
+            call('POST', '/api/conversation', json={'user_input': 'check-routes', 'conversation_summary': 'check-routes'})
+        
+        for exercise_id in exercise_ids[1::2]:
+            call('DELETE', f'/api/workout/exercise/{exercise_id}')
+        for session_id in session_ids:
+            call('DELETE', f'/api/workout/{session_id}')
+    finally:
+        delete_tenant_data(tenant_id)
+    
+    print(f"backend: {db.engine.dialect.name} ({db.engine.url.render_as_string(hide_password=True)})")
+    print(f"{'route':40} {'count':>5} {'mean ms':>9} {'p95 ms':>9}")
+    for route, values in timings.items():
+        print(f"{route:40} {len(values):5} {sum(values) / len(values):9.2f} {percentile(values, 0.95):9.2f}")
+    if failures:
+        raise click.ClickException("Failed requests:\n" + "\n".join(failures))
+
+@app.cli.command('check-compression')
+@click.option('--sessions', 'session_count', default=30, show_default=True, help='作成するセッション数')
+def check_compression_command(session_count):
+    """一時テナントで主要ページ・APIの転送バイト数（無圧縮 / gzip / brotli）と再検証（304）の結果を表示"""
+    tenant_id = f"check-{secrets.token_hex(4)}"
+    api_key = secrets.token_urlsafe(32)
+    db.session.add(Tenant(id=tenant_id, name=tenant_id, api_key_hash=hash_api_key(api_key)))
+    db.session.commit()
+    
+    client = unlimited_test_client()
+    brotli = load_brotli()
+    totals = [0, 0, 0]
+    try:
+        first_day = datetime.date.today() - datetime.timedelta(days=session_count * 2)
+        session_id = None
+        for i in range(session_count):
+            response = client.post('/api/workout', headers={'X-API-Key': api_key}, json={
+                'date': (first_day + datetime.timedelta(days=i * 2)).isoformat(),
+                'facility': 'check-compression',
+                'exercises': [
+                    {'name': name, 'category': 'フリーウェイト', 'weight': '60kg', 'reps': 10, 'sets': 3, 'target_muscle': muscle, 'notes': 'フォーム確認'}
+                    for name, muscle in (('ベンチプレス', '胸'), ('スクワット', '脚'), ('デッドリフト', '背中'), ('ショルダープレス', '肩'))
+                ]
+            })
+            session_id = session_id or (response.get_json() or {}).get('session_id')
+            client.post('/api/receive', headers={'X-API-Key': api_key}, json={'message': f'check-compression {i}', 'data': {'index': i}})
+            client.post('/api/conversation', headers={'X-API-Key': api_key}, json={
+                'user_input': f'check-compression {i}', 'conversation_summary': 'check-compression'
+            })
+        
+        # 静的ファイルは初回のみ転送され、以降はブラウザのキャッシュから読まれる
+        static_urls = tuple(asset_url(name) for name in static_asset_names())
+        print(f"{'route':34} {'identity':>9} {'gzip':>9} {'br':>9} {'saved':>6} {'revalidate':>11}")
+        for url in ('/workouts', '/workouts/weekly', '/workouts/monthly', '/workouts/analytics', '/api/calendar',
+                    '/api/export/excel', '/logs', '/api/logs', '/data', '/api/received-data', '/conversations',
+                    '/export', f'/api/workout/{session_id}') + static_urls:
+            sizes = []
+            for encoding in ('identity', 'gzip', 'br'):
+                if encoding == 'br' and brotli is None:
+                    sizes.append(None)
+                    continue
+                response = client.get(url, headers={'X-API-Key': api_key, 'Accept-Encoding': encoding})
+                sizes.append(len(response.data))
+                etag = response.headers.get('ETag')
+            revalidate = client.get(url, headers={'X-API-Key': api_key, 'Accept-Encoding': 'gzip', 'If-None-Match': etag or ''})
+            best = min(size for size in sizes if size is not None)
+            for index, size in enumerate(sizes):
+                totals[index] += size or 0
+            print(f"{url:34} {sizes[0]:9} {sizes[1]:9} {sizes[2] if sizes[2] is not None else '-':>9} "
+                  f"{(1 - best / sizes[0]) * 100 if sizes[0] else 0:5.0f}% {revalidate.status_code:>5} {len(revalidate.data):4} B")
+        print(f"{'total':34} {totals[0]:9} {totals[1]:9} {totals[2] if brotli else '-':>9}"
+              + ("" if brotli else "  (brotli not installed: pip install brotli)"))
+    finally:
+        delete_tenant_data(tenant_id)
+
+# OpenAPIスキーマからのリクエスト検証
+JSON_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+    'null': type(None),
+}
+
+def is_valid_date(value):
+    try:
+        datetime.date.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
+def is_valid_datetime(value):
+    try:
+        datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return True
+    except ValueError:
+        return False
+
+FORMAT_CHECKS = {'date': is_valid_date, 'date-time': is_valid_datetime}
+
+def compile_schema(schema, spec, compiled_refs):
+    """JSONスキーマ（OpenAPIのサブセット）を検証関数 validate(value, path, errors) に変換
+
+    起動時に一度だけ呼び出し、リクエストごとにはスキーマを解釈しない。
+    任意プロパティの null はGPTsが送りがちなため許容する。
+    """
+    if '$ref' in schema:
+        ref = schema['$ref']
+        if ref not in compiled_refs:
+            target = spec
+            for part in ref.lstrip('#/').split('/'):
+                target = target[part]
+            # 循環参照に備えて先に登録してから中身を差し替える
+            validators = []
+            compiled_refs[ref] = lambda value, path, errors: validators[0](value, path, errors)
+            validators.append(compile_schema(target, spec, compiled_refs))
+        return compiled_refs[ref]
+    
+    schema_types = schema.get('type')
+    if isinstance(schema_types, str):
+        schema_types = [schema_types]
+    expected = tuple(JSON_TYPES[name] for name in schema_types or ())
+    allows_bool = 'boolean' in (schema_types or ())
+    enum = schema.get('enum')
+    format_name = schema.get('format')
+    format_check = FORMAT_CHECKS.get(format_name)
+    required = tuple(schema.get('required', ()))
+    properties = [
+        (key, '.' + key, compile_schema(value, spec, compiled_refs))
+        for key, value in schema.get('properties', {}).items()
+    ]
+    items = compile_schema(schema['items'], spec, compiled_refs) if 'items' in schema else None
+    all_of = [compile_schema(sub, spec, compiled_refs) for sub in schema.get('allOf', ())]
+    type_label = '|'.join(schema_types or ())
+    
+    def validate(value, path, errors):
+        if expected and (not isinstance(value, expected) or (isinstance(value, bool) and not allows_bool)):
+            errors.append(f"{path}: expected {type_label}")
+            return
+        if enum is not None and value not in enum:
+            errors.append(f"{path}: must be one of {enum}")
+        if format_check is not None and isinstance(value, str) and not format_check(value):
+            errors.append(f"{path}: invalid {format_name}")
+        if isinstance(value, dict):
+            for key in required:
+                if key not in value or value[key] is None:
+                    errors.append(f"{path}.{key}: required")
+            for key, suffix, validator in properties:
+                property_value = value.get(key)
+                if property_value is not None:
+                    validator(property_value, path + suffix, errors)
+        if items is not None and isinstance(value, list):
+            for index, item in enumerate(value):
+                items(item, f"{path}[{index}]", errors)
+        for validator in all_of:
+            validator(value, path, errors)
+    
+    return validate
+
+def compile_operation(operation, spec, compiled_refs):
+    """1オペレーションの検証関数（ボディとクエリパラメータ）を作成"""
+    body_schema = operation.get('requestBody', {}).get('content', {}).get('application/json', {}).get('schema')
+    body_required = operation.get('requestBody', {}).get('required', False)
+    body_validator = compile_schema(body_schema, spec, compiled_refs) if body_schema else None
+    
+    query_params = []
+    for parameter in operation.get('parameters', ()):
+        if parameter.get('in') != 'query':
+            continue
+        parameter_schema = parameter.get('schema', {})
+        query_params.append((
+            parameter['name'],
+            parameter.get('required', False),
+            parameter_schema.get('type') in ('integer', 'number'),
+            compile_schema(parameter_schema, spec, compiled_refs)
+        ))
+    
+    def validate(body, args):
+        errors = []
+        if body_validator is not None:
+            if body is None:
+                if body_required:
+                    errors.append("body: required")
+            else:
+                body_validator(body, "body", errors)
+        for name, required, numeric, validator in query_params:
+            value = args.get(name)
+            if value in (None, ''):
+                if required:
+                    errors.append(f"query.{name}: required")
+                continue
+            if numeric:
+                try:
+                    value = int(value)
+                except ValueError:
+                    errors.append(f"query.{name}: expected number")
+                    continue
+            validator(value, f"query.{name}", errors)
+        return errors
+    
+    return validate
+
+def load_request_validators(schema_dir=SCHEMA_DIR):
+    """スキーマファイルを読み込み、(エンドポイント名, メソッド) → 検証関数のリストを作成
+
+    同じオペレーションが複数ファイルにある場合は、いずれかのスキーマに適合すれば有効とする。
+    """
+    adapter = app.url_map.bind('localhost')
+    validators = {}
+    for schema_file in sorted(schema_dir.glob('*-schema.json')):
+        with open(schema_file, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        compiled_refs = {}
+        for path, operations in spec.get('paths', {}).items():
+            # OpenAPIのパスをFlaskのルートに対応付ける（パスパラメータはダミー値で照合）
+            sample_path = re.sub(r'\{[^}]+\}', '1', path)
+            for method, operation in operations.items():
+                try:
+                    endpoint, _ = adapter.match(sample_path, method=method.upper())
+                except HTTPException:
+                    continue
+                validators.setdefault((endpoint, method.upper()), []).append(
+                    (operation.get('operationId'), compile_operation(operation, spec, compiled_refs))
+                )
+    return validators
+
+REQUEST_VALIDATORS = {}
+
+def validate_request_data(endpoint, method, body, args):
+    """リクエストを検証してエラーのリストを返す（空なら有効、検証対象外も空）"""
+    candidates = REQUEST_VALIDATORS.get((endpoint, method))
+    if not candidates:
+        return []
+    first_errors = None
+    for _, validator in candidates:
+        errors = validator(body, args)
+        if not errors:
+            return []
+        if first_errors is None:
+            first_errors = errors
+    return first_errors
+
+@app.before_request
+def validate_request():
+    """OpenAPIスキーマに基づいてリクエストボディ・クエリを検証"""
+    if SCHEMA_VALIDATION == 'off' or (request.endpoint, request.method) not in REQUEST_VALIDATORS:
+        return
+    # NDJSONなどJSON以外のボディは各ハンドラで処理する
+    if request.content_length and not request.is_json:
+        return
+    body = request.get_json(silent=True) if request.content_length else None
+    if body is None and request.content_length:
+        return
+    
+    errors = validate_request_data(request.endpoint, request.method, body, request.args)
+    if errors:
+        log_event(request.endpoint, error="Request validation failed", data={"errors": errors[:20]}, status="error", level=logging.WARNING)
+        if SCHEMA_VALIDATION == 'enforce':
+            return jsonify({"error": "Request validation failed", "details": errors[:20]}), 400
+
+def example_from_schema(schema, spec, depth=0):
+    """スキーマのexampleからサンプルデータを生成（ベンチマーク用）"""
+    if '$ref' in schema:
+        target = spec
+        for part in schema['$ref'].lstrip('#/').split('/'):
+            target = target[part]
+        return example_from_schema(target, spec, depth)
+    if 'example' in schema:
+        return schema['example']
+    if 'allOf' in schema:
+        merged = {}
+        for sub in schema['allOf']:
+            merged.update(example_from_schema(sub, spec, depth) or {})
+        return merged
+    schema_type = schema.get('type')
+    if schema_type == 'object':
+        return {key: example_from_schema(value, spec, depth + 1) for key, value in schema.get('properties', {}).items()}
+    if schema_type == 'array':
+        return [example_from_schema(schema.get('items', {}), spec, depth + 1) for _ in range(10 if depth < 2 else 1)]
+    if 'enum' in schema:
+        return schema['enum'][0]
+    if schema.get('format') == 'date':
+        return '2025-06-09'
+    if schema.get('format') == 'date-time':
+        return '2025-06-09T12:00:00'
+    return {'integer': 1, 'number': 1.0, 'boolean': True}.get(schema_type, 'text')
+
+@app.cli.command('bench-validation')
+@click.option('--iterations', default=10000, help='オペレーションごとの試行回数')
+def bench_validation_command(iterations):
+    """スキーマ検証のリクエストあたりのオーバーヘッドを計測"""
+    for schema_file in sorted(SCHEMA_DIR.glob('*-schema.json')):
+        with open(schema_file, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        for path, operations in spec.get('paths', {}).items():
+            for method, operation in operations.items():
+                body_schema = operation.get('requestBody', {}).get('content', {}).get('application/json', {}).get('schema')
+                if not body_schema:
+                    continue
+                body = example_from_schema(body_schema, spec)
+                validator = compile_operation(operation, spec, {})
+                errors = validator(body, {})
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    validator(body, {})
+                per_request_us = (time.perf_counter() - started) / iterations * 1e6
+                print(f"{schema_file.name:40} {operation.get('operationId'):24} "
+                      f"{per_request_us:8.2f}us/request  body={len(json.dumps(body))}B  errors={len(errors)}")
+
+@app.cli.command('check-replicas')
+def check_replicas_command():
+    """プライマリと各リードレプリカの接続とセッション件数を表示"""
+    for bind_key in (None,) + REPLICA_BIND_KEYS:
+        engine = db.engines[bind_key]
+        try:
+            with engine.connect() as conn:
+                count = conn.execute(text('SELECT count(*) FROM workout_sessions')).scalar()
+            print(f"{bind_key or 'primary':12} {engine.url.render_as_string(hide_password=True)}  sessions={count}")
+        except Exception as e:
+            print(f"{bind_key or 'primary':12} {engine.url.render_as_string(hide_password=True)}  error={e}")
+
+# ウォームアップとヘルスチェック
+# gunicorn の post_fork（gunicorn.conf.py）で各ワーカーがリクエストを受ける前に実行する
+WARMUP = os.environ.get('WARMUP', '1') == '1'
+WARMUP_POOL_CONNECTIONS = int(os.environ.get('WARMUP_POOL_CONNECTIONS', 4))  # エンジンごとに事前に開く接続数（プールサイズが上限）
+WARMUP_TENANTS = int(os.environ.get('WARMUP_TENANTS', 5))  # 集計キャッシュを準備するテナント数（直近に記録のあった順）
+WARMUP_PAGES = ('/', '/workouts', '/workouts/weekly', '/workouts/monthly', '/workouts/analytics',
+                '/workouts/facilities', '/logs', '/logs/live', '/data', '/conversations', '/export')
+WARMUP_RETRY_SECONDS = float(os.environ.get('WARMUP_RETRY_SECONDS', 10))  # /readyz からの再試行間隔（失敗のたびに倍）
+WARMUP_RETRY_MAX_SECONDS = 300
+# ウォームアップのページ取得に付けるWSGI environキー（default テナント・読み取り専用で処理する。HTTPヘッダからは設定できない）
+WARMUP_ENVIRON = 'gpts_action.warmup'
+
+# ワーカーごとのウォームアップ状態（status: pending / running / done / failed）
+warmup_state = {"status": "pending", "timings": {}, "details": {}, "errors": {}}
+_warmup_lock = threading.Lock()
+_warmup_start_lock = threading.Lock()
+_warmup_retry = {"failures": 0, "next_at": 0.0}
+
+def is_warmup_request():
+    return has_request_context() and bool(request.environ.get(WARMUP_ENVIRON))
+
+@event.listens_for(RoutingSession, 'before_commit')
+def reject_warmup_commit(session):
+    """ウォームアップのリクエストではコミットさせない（変更はリクエスト終了時に破棄される）"""
+    if is_warmup_request():
+        raise RuntimeError("warm-up requests are read-only")
+
+def pool_status(engine):
+    """接続プールの使用状況（QueuePool 以外は None）"""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return None
+    return {"size": pool.size(), "checked_in": pool.checkedin(), "checked_out": pool.checkedout()}
+
+def warm_up_pool():
+    """プライマリと各リードレプリカの接続を事前に開いてプールへ戻す"""
+    opened = {}
+    for bind_key in (None,) + REPLICA_BIND_KEYS:
+        engine = db.engines[bind_key]
+        count = min(WARMUP_POOL_CONNECTIONS, engine.pool.size()) if isinstance(engine.pool, QueuePool) else 1
+        connections = []
+        try:
+            # 同時にチェックアウトして別々の接続を確立させる
+            for _ in range(max(count, 1)):
+                connection = engine.connect()
+                connections.append(connection)
+                connection.execute(text('SELECT 1'))
+        finally:
+            for connection in connections:
+                connection.close()
+        opened[bind_key or 'primary'] = len(connections)
+    return opened
+
+def warm_up_imports():
+    """初回リクエストで遅延インポートされる重いモジュールを読み込む"""
+    import numpy  # noqa: F401
+    import openpyxl.styles  # noqa: F401
+    modules = ['numpy', 'openpyxl']
+    if load_brotli():
+        modules.append('brotli')
+    return modules
+
+def warm_up_templates():
+    """HTMLページを一度取得してテンプレートをコンパイル済みにする（静的ファイルのハッシュも計算される）
+
+    before_request を含む通常のリクエスト処理を通し、読み取り専用の default テナントとして取得する。
+    """
+    client = unlimited_test_client()
+    client.environ_base[WARMUP_ENVIRON] = True
+    for path in WARMUP_PAGES:
+        response = client.get(path)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{path} -> {response.status_code}")
+    return {"pages": len(WARMUP_PAGES), "templates": len(app.jinja_env.string_templates)}
+
+def warm_up_summary_cache():
+    """直近に記録のあったテナントの集計キャッシュを作成"""
+    tenant_ids = [
+        tenant_id for tenant_id, in db.session.query(WorkoutSession.tenant_id)
+        .group_by(WorkoutSession.tenant_id)
+        .order_by(func.max(WorkoutSession.date).desc())
+        .limit(WARMUP_TENANTS)
+    ]
+    return {tenant_id: refresh_training_cache(tenant_id)[1] for tenant_id in tenant_ids}
+
+WARMUP_STEPS = (
+    ("db_pool", warm_up_pool),
+    ("imports", warm_up_imports),
+    ("templates", warm_up_templates),
+    ("summary_cache", warm_up_summary_cache),
+)
+
+def warm_up(notify=None):
+    """ウォームアップの各ステップを実行し、所要時間(ms)を warmup_state に記録
+
+    notify はステップごとに呼ぶコールバック（gunicorn ワーカーのハートビート用）。
+    実行中に呼ばれた場合は何もせず現在の状態を返す。
+    """
+    if not _warmup_lock.acquire(blocking=False):
+        return warmup_state
+    try:
+        warmup_state.update(status="running", timings={}, details={}, errors={})
+        started = time.perf_counter()
+        with app.app_context():
+            for step, step_func in WARMUP_STEPS:
+                step_started = time.perf_counter()
+                try:
+                    warmup_state["details"][step] = step_func()
+                except Exception as e:
+                    db.session.rollback()
+                    warmup_state["errors"][step] = str(e)
+                warmup_state["timings"][step] = round((time.perf_counter() - step_started) * 1000, 2)
+                if notify:
+                    notify()
+            db.session.remove()
+        warmup_state["timings"]["total"] = round((time.perf_counter() - started) * 1000, 2)
+        warmup_state["status"] = "failed" if warmup_state["errors"] else "done"
+        if warmup_state["errors"]:
+            # 失敗が続くほど /readyz からの再試行間隔を空ける
+            _warmup_retry["failures"] += 1
+            delay = min(WARMUP_RETRY_SECONDS * 2 ** (_warmup_retry["failures"] - 1), WARMUP_RETRY_MAX_SECONDS)
+            _warmup_retry["next_at"] = time.monotonic() + delay
+        else:
+            _warmup_retry["failures"] = 0
+        log_event("warmup", data={"pid": os.getpid(), **warmup_state},
+                  status="error" if warmup_state["errors"] else "success")
+        return warmup_state
+    finally:
+        _warmup_lock.release()
+
+def start_background_warm_up():
+    """ウォームアップをバックグラウンドで開始（実行中・完了済み・再試行の待機中なら何もしない）"""
+    with _warmup_start_lock:
+        if warmup_state["status"] in ("running", "done") or time.monotonic() < _warmup_retry["next_at"]:
+            return False
+        warmup_state["status"] = "running"
+        threading.Thread(target=warm_up, daemon=True).start()
+        return True
+
+@app.route('/healthz')
+def healthz():
+    """ライブネス: プロセスが応答できれば200（DBには触れない）"""
+    response = jsonify({"status": "ok"})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/readyz')
+def readyz():
+    """レディネス: プライマリDBへの接続とウォームアップの完了を確認（未完了なら503）
+
+    post_fork を通らない起動（flask run など）では初回の呼び出しでバックグラウンド実行する
+    （同時に1つだけ、失敗後は間隔を空けて再試行）。
+    """
+    ready = True
+    checks = {}
+    started = time.perf_counter()
+    try:
+        with db.engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+        checks["database"] = {"ok": True, "ms": round((time.perf_counter() - started) * 1000, 2),
+                              "pool": pool_status(db.engine)}
+    except Exception as e:
+        checks["database"] = {"ok": False, "error": str(e)}
+        ready = False
+    
+    if WARMUP:
+        start_background_warm_up()
+        checks["warmup"] = {"status": warmup_state["status"], "timings_ms": warmup_state["timings"],
+                            "errors": warmup_state["errors"]}
+        ready = ready and warmup_state["status"] == "done"
+    
+    response = jsonify({"status": "ready" if ready else "not_ready", "checks": checks})
+    response.status_code = 200 if ready else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.cli.command('warm-up')
+def warm_up_command():
+    """ウォームアップを実行し、各ステップの所要時間を表示（2回目は準備済みの状態での時間）"""
+    for label in ('cold', 'warm'):
+        state = warm_up()
+        print(f"[{label}] status={state['status']}")
+        for step, elapsed in state["timings"].items():
+            detail = state["errors"].get(step) or state["details"].get(step, '')
+            print(f"  {step:16} {elapsed:9.2f} ms  {json.dumps(detail, ensure_ascii=False, default=str)}")
+
+_first_request_done = False
+
+@app.before_request
+def record_first_request():
+    """最初のリクエストまでの時間を記録（起動プロファイル用）"""
+    global _first_request_done
+    if _first_request_done or is_warmup_request():
+        return
+    _first_request_done = True
+    mark_startup("first_request")
+    if STARTUP_PROFILE:
+        print(f"[startup-profile] {json.dumps(startup_timings)}", flush=True)
+        log_event("startup_profile", data=startup_timings)
+
+# 全ルート登録後にスキーマから検証関数を生成
+REQUEST_VALIDATORS.update(load_request_validators())
+mark_startup("validators")
 
-# アプリケーション起動時にテーブル作成
-create_tables()
+# テーブル作成はインポート時に行わず init-db コマンドで実行する
+mark_startup("module_ready")
+if STARTUP_PROFILE:
+    print(f"[startup-profile] {json.dumps(startup_timings)}", flush=True)
 
 if __name__ == '__main__':
+    # ローカル開発ではそのまま起動できるようにテーブルを作成
+    create_tables()
     log_event("app_start", data={"message": "Application started"})
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
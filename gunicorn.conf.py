@@ -0,0 +1,16 @@
+# gunicorn の設定（render.yaml の startCommand で -c gunicorn.conf.py として読み込む）
+import json
+
+
+def post_fork(server, worker):
+    """ワーカーがリクエストを受け付ける前にDB接続・テンプレート・集計キャッシュを準備する
+
+    各ステップの後に worker.notify() を呼び、ウォームアップ中にタイムアウトで停止されないようにする。
+    """
+    from app import WARMUP, warm_up
+    if not WARMUP:
+        return
+    state = warm_up(notify=worker.notify)
+    server.log.info("worker %s warm-up %s: %s", worker.pid, state["status"], json.dumps(state["timings"]))
+    for step, error in state["errors"].items():
+        server.log.warning("worker %s warm-up step %s failed: %s", worker.pid, step, error)
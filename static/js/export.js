@@ -0,0 +1,71 @@
+// Excelエクスポート（/export）のフィルター操作
+function exportExcel() {
+    const form = document.getElementById('exportForm');
+    const formData = new FormData(form);
+
+    // クエリパラメータを構築
+    const params = new URLSearchParams();
+    for (let [key, value] of formData.entries()) {
+        if (value) {
+            params.append(key, value);
+        }
+    }
+
+    // Excelダウンロード用URLを構築
+    const downloadUrl = '/api/export/excel?' + params.toString();
+
+    // ダウンロードを開始
+    window.location.href = downloadUrl;
+}
+
+function clearFilters() {
+    document.getElementById('start_date').value = '';
+    document.getElementById('end_date').value = '';
+    document.getElementById('exercise_name').value = '';
+    document.getElementById('target_muscle').value = '';
+    document.getElementById('facility').value = '';
+    document.getElementById('previewSection').style.display = 'none';
+}
+
+function previewData() {
+    const form = document.getElementById('exportForm');
+    const formData = new FormData(form);
+
+    // フィルター条件を表示
+    let previewText = 'フィルター条件:<br>';
+
+    const startDate = formData.get('start_date');
+    const endDate = formData.get('end_date');
+    const exerciseName = formData.get('exercise_name');
+    const targetMuscle = formData.get('target_muscle');
+    const facility = formData.get('facility');
+
+    if (startDate) previewText += `・ 開始日: ${startDate}<br>`;
+    if (endDate) previewText += `・ 終了日: ${endDate}<br>`;
+    if (exerciseName) previewText += `・ 種目名: ${exerciseName}<br>`;
+    if (targetMuscle) previewText += `・ 筋肉部位: ${targetMuscle}<br>`;
+    if (facility) previewText += `・ 施設: ${facility}<br>`;
+
+    if (!startDate && !endDate && !exerciseName && !targetMuscle && !facility) {
+        previewText += '・ フィルターなし（全データ）<br>';
+    }
+
+    document.getElementById('previewContent').innerHTML = previewText;
+    document.getElementById('previewSection').style.display = 'block';
+}
+
+// ページ読み込み時にデフォルト日付を設定（オプション）
+document.addEventListener('DOMContentLoaded', function() {
+    // 今日の日付を取得
+    const today = new Date();
+    const todayStr = today.toISOString().split('T')[0];
+
+    // 30日前の日付を計算
+    const thirtyDaysAgo = new Date(today);
+    thirtyDaysAgo.setDate(today.getDate() - 30);
+    const thirtyDaysAgoStr = thirtyDaysAgo.toISOString().split('T')[0];
+
+    // デフォルトで過去30日を設定しない（ユーザーが手動で設定）
+    // document.getElementById('start_date').value = thirtyDaysAgoStr;
+    // document.getElementById('end_date').value = todayStr;
+});
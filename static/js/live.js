@@ -0,0 +1,39 @@
+// ライブログ（/logs/live）: /api/events/stream を購読して表示
+const MAX_ENTRIES = 200;
+const container = document.getElementById('events');
+const status = document.getElementById('status');
+const source = new EventSource('/api/events/stream');
+
+function addEntry(className, title, body) {
+    const entry = document.createElement('div');
+    entry.className = 'log-entry ' + className;
+    const header = document.createElement('div');
+    header.className = 'timestamp';
+    header.textContent = title;
+    const data = document.createElement('div');
+    data.className = 'data';
+    data.textContent = JSON.stringify(body, null, 2);
+    entry.append(header, data);
+    container.prepend(entry);
+    while (container.children.length > MAX_ENTRIES) {
+        container.lastChild.remove();
+    }
+}
+
+source.onopen = () => { status.textContent = '接続中（新しいイベントを待っています）'; };
+source.onerror = () => { status.textContent = '再接続しています...'; };
+source.addEventListener('log', (e) => {
+    const log = JSON.parse(e.data);
+    addEntry(log.status === 'success' ? 'log-success' : 'log-error',
+             `${log.timestamp} [${log.level}] ${log.event_type}`,
+             log.error ? {error: log.error, data: log.data} : log.data);
+});
+source.addEventListener('workout', (e) => {
+    addEntry('log-workout', 'ワークアウト保存', JSON.parse(e.data));
+});
+source.addEventListener('conversation', (e) => {
+    addEntry('log-conversation', '会話保存', JSON.parse(e.data));
+});
+source.addEventListener('dropped', (e) => {
+    status.textContent = `表示が追いつかず ${JSON.parse(e.data).count} 件のイベントを省略しました`;
+});
@@ -0,0 +1,68 @@
+// 筋トレログ（/workouts）のセッション・エクササイズの編集と削除
+function deleteSession(sessionId) {
+    if (confirm('このセッション全体を削除しますか？')) {
+        fetch(`/api/workout/${sessionId}`, {
+            method: 'DELETE'
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status === 'success') {
+                document.getElementById(`session-${sessionId}`).remove();
+                alert('セッションを削除しました');
+                location.reload();
+            } else {
+                alert('削除に失敗しました: ' + data.error);
+            }
+        })
+        .catch(error => {
+            alert('エラーが発生しました: ' + error);
+        });
+    }
+}
+
+function deleteExercise(exerciseId) {
+    if (confirm('このエクササイズを削除しますか？')) {
+        fetch(`/api/workout/exercise/${exerciseId}`, {
+            method: 'DELETE'
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status === 'success') {
+                document.getElementById(`exercise-${exerciseId}`).remove();
+                alert('エクササイズを削除しました');
+            } else {
+                alert('削除に失敗しました: ' + data.error);
+            }
+        })
+        .catch(error => {
+            alert('エラーが発生しました: ' + error);
+        });
+    }
+}
+
+function editExercise(exerciseId) {
+    const newReps = prompt('新しい回数を入力してください:');
+    if (newReps !== null && newReps !== '') {
+        const updateData = { reps: parseInt(newReps) };
+
+        fetch(`/api/workout/exercise/${exerciseId}`, {
+            method: 'PUT',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(updateData)
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status === 'success') {
+                alert('エクササイズを更新しました');
+                location.reload();
+            } else {
+                alert('更新に失敗しました: ' + data.error);
+            }
+        })
+        .catch(error => {
+            alert('エラーが発生しました: ' + error);
+        });
+    }
+}
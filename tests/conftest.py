@@ -0,0 +1,88 @@
+import functools
+import importlib.util
+import itertools
+import logging
+import os
+from pathlib import Path
+
+import pytest
+
+APP_PATH = Path(__file__).resolve().parent.parent / 'app.py'
+# 外部DB（PostgreSQLなど）でも実行するテストの接続先。未設定ならそのテストはスキップ
+EXTERNAL_DATABASE_URL = os.environ.get('DATABASE_URL')
+_app_counter = itertools.count()
+
+
+def load_app(tmp_path, monkeypatch, database_url=None, read_urls=(), **env):
+    """環境変数を設定して app.py を新しいモジュールとして読み込み、テーブルを作成する
+
+    app.py は設定をインポート時に環境変数から読むため、テストごとに別モジュールとして
+    読み込むことでアプリファクトリの代わりにする。data/ は tmp_path に作られる。
+    """
+    monkeypatch.chdir(tmp_path)
+    settings = {
+        'DATABASE_URL': database_url or f"sqlite:///{tmp_path / 'primary.db'}",
+        'DATABASE_READ_URL': ','.join(read_urls),
+        'RATE_LIMIT_ENABLED': '0',
+        'WARMUP': '0',
+        **env,
+    }
+    for key, value in settings.items():
+        monkeypatch.setenv(key, value)
+    # 構造化ログのハンドラは新しいモジュールのリングバッファに付け替える
+    logging.getLogger('gpts_action.events').handlers.clear()
+
+    spec = importlib.util.spec_from_file_location(f"app_under_test_{next(_app_counter)}", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.create_tables()
+    return module
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """設定を変えてアプリを読み込むファクトリ（例: make_app(read_urls=[...])）"""
+    return functools.partial(load_app, tmp_path, monkeypatch)
+
+
+@pytest.fixture
+def app_module(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture(params=['sqlite', 'database_url'])
+def backend_app(request, make_app):
+    """組み込みSQLiteと DATABASE_URL の両方で読み込んだアプリ"""
+    if request.param == 'sqlite':
+        return make_app()
+    if not EXTERNAL_DATABASE_URL or EXTERNAL_DATABASE_URL.startswith('sqlite'):
+        pytest.skip('DATABASE_URL is not set to an external database')
+    return make_app(database_url=EXTERNAL_DATABASE_URL)
+
+
+def create_tenant(module, tenant_id):
+    """テナントを作成し、APIキーのヘッダを返す（共有DBでは tenant_id を一意にし、delete_tenant_data で削除する）"""
+    api_key = f"key-{tenant_id}-{os.urandom(4).hex()}"
+    with module.app.app_context():
+        module.db.session.add(module.Tenant(id=tenant_id, name=tenant_id, api_key_hash=module.hash_api_key(api_key)))
+        module.db.session.commit()
+    return {'X-API-Key': api_key}
+
+
+def workout(date, *names, facility=None):
+    """POST /api/workout のボディ"""
+    body = {
+        'date': date,
+        'exercises': [
+            {'name': name, 'category': 'フリーウェイト', 'weight': '60kg', 'reps': 10, 'sets': 3, 'target_muscle': '胸'}
+            for name in names or ('ベンチプレス',)
+        ],
+    }
+    if facility:
+        body['facility'] = facility
+    return body
@@ -0,0 +1,58 @@
+"""年単位のアーカイブとゴミ箱の関係"""
+import io
+
+from openpyxl import load_workbook
+
+from conftest import workout
+
+
+def archive(module, year):
+    with module.app.app_context():
+        result = module.archive_year(module.DEFAULT_TENANT_ID, year)
+        module.db.session.commit()
+        return result
+
+
+def exported_names(client, year):
+    response = client.get(f'/api/export/excel?start_date={year}-01-01&end_date={year}-12-31')
+    sheet = load_workbook(io.BytesIO(response.data)).active
+    return sorted(row[3] for row in sheet.iter_rows(min_row=2, values_only=True) if row[3])
+
+
+def test_archive_keeps_sessions_with_trashed_items_restorable(app_module, client):
+    partly_trashed = client.post('/api/workout', json=workout('2024-03-01', 'ベンチプレス', 'スクワット')).get_json()['session_id']
+    client.post('/api/workout', json=workout('2024-04-01', 'デッドリフト'))
+    trashed_session = client.post('/api/workout', json=workout('2024-05-01', '懸垂')).get_json()['session_id']
+    trashed_exercise = client.get(f'/api/workout/{partly_trashed}').get_json()['exercises'][1]['id']
+    assert client.delete(f'/api/workout/exercise/{trashed_exercise}').status_code == 200
+    assert client.delete(f'/api/workout/{trashed_session}').status_code == 200
+
+    assert archive(app_module, 2024) == (1, 2)
+    assert exported_names(client, 2024) == ['デッドリフト', 'ベンチプレス']
+
+    # ゴミ箱の行は消えておらず、復元できる
+    trash = client.get('/api/trash').get_json()
+    assert [exercise['id'] for exercise in trash['exercises']] == [trashed_exercise]
+    assert [session['id'] for session in trash['sessions']] == [trashed_session]
+    response = client.post('/api/trash/restore', json={'exercise_ids': [trashed_exercise], 'session_ids': [trashed_session]})
+    assert response.status_code == 200
+    assert len(client.get(f'/api/workout/{partly_trashed}').get_json()['exercises']) == 2
+    assert exported_names(client, 2024) == ['スクワット', 'デッドリフト', 'ベンチプレス', '懸垂']
+
+    # 復元後（ゴミ箱が空になれば）残りもアーカイブされる
+    assert archive(app_module, 2024) == (2, 0)
+    assert client.get(f'/api/workout/{partly_trashed}').status_code == 404
+    assert exported_names(client, 2024) == ['スクワット', 'デッドリフト', 'ベンチプレス', '懸垂']
+
+
+def test_archive_after_purge(app_module, client):
+    session_id = client.post('/api/workout', json=workout('2024-03-01', 'ベンチプレス', 'スクワット')).get_json()['session_id']
+    trashed_exercise = client.get(f'/api/workout/{session_id}').get_json()['exercises'][1]['id']
+    client.delete(f'/api/workout/exercise/{trashed_exercise}')
+
+    assert archive(app_module, 2024) == (0, 1)
+    with app_module.app.app_context():
+        app_module.purge_trash(-1)
+        app_module.db.session.commit()
+    assert archive(app_module, 2024) == (1, 0)
+    assert exported_names(client, 2024) == ['ベンチプレス']
@@ -0,0 +1,112 @@
+"""エクササイズの一括更新・一括削除（PATCH/DELETE /api/workout/exercises）"""
+import contextlib
+
+import pytest
+from sqlalchemy import event
+
+from conftest import workout
+
+
+@pytest.fixture
+def exercise_ids(client):
+    session_id = client.post('/api/workout', json=workout('2026-01-05', 'ベンチプレス', 'スクワット', 'デッドリフト')).get_json()['session_id']
+    return [exercise['id'] for exercise in client.get(f'/api/workout/{session_id}').get_json()['exercises']]
+
+
+@contextlib.contextmanager
+def count_statements(module, prefix):
+    """実行された SQL のうち prefix で始まる文を数える"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(prefix):
+            statements.append(statement)
+
+    with module.app.app_context():
+        engine = module.db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@pytest.fixture
+def logged_events(app_module, monkeypatch):
+    events = []
+    original = app_module.log_event
+
+    def log_event(event_type, **kwargs):
+        events.append((event_type, kwargs))
+        return original(event_type, **kwargs)
+
+    monkeypatch.setattr(app_module, 'log_event', log_event)
+    return events
+
+
+def exercises_by_id(client):
+    session = client.get('/api/workout/1').get_json()
+    return {exercise['id']: exercise for exercise in session['exercises']}
+
+
+def test_same_changes_are_applied_with_one_update(app_module, client, exercise_ids, logged_events):
+    with count_statements(app_module, 'UPDATE WORKOUT_LOGS') as updates:
+        response = client.patch('/api/workout/exercises', json={'ids': exercise_ids, 'changes': {'reps': 5, 'notes': 'deload'}})
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 3
+    assert len(updates) == 1
+    assert all((exercise['reps'], exercise['notes']) == (5, 'deload') for exercise in exercises_by_id(client).values())
+
+    # 個別の変更は同じ内容ごとにまとめる
+    with count_statements(app_module, 'UPDATE WORKOUT_LOGS') as updates:
+        response = client.patch('/api/workout/exercises', json={'updates': [
+            {'id': exercise_ids[0], 'reps': 3},
+            {'id': exercise_ids[1], 'weight': '100kg'},
+            {'id': exercise_ids[2], 'reps': 3},
+        ]})
+    assert response.status_code == 200
+    assert len(updates) == 2
+    exercises = exercises_by_id(client)
+    assert [exercises[exercise_id]['reps'] for exercise_id in exercise_ids] == [3, 5, 3]
+    assert exercises[exercise_ids[1]]['weight'] == '100kg'
+
+    # ログはリクエストごとに1件（IDごとではない）
+    batch_events = [kwargs for event_type, kwargs in logged_events if event_type == 'batch_update_exercises']
+    assert len(batch_events) == 2
+    assert batch_events[0]['data'] == {'exercise_ids': exercise_ids, 'updated_fields': ['notes', 'reps'], 'count': 3}
+    assert not any(event_type == 'update_exercise' for event_type, _ in logged_events)
+
+
+def test_batch_delete_is_one_statement_and_one_event(app_module, client, exercise_ids, logged_events):
+    with count_statements(app_module, 'UPDATE WORKOUT_LOGS') as updates:
+        response = client.delete('/api/workout/exercises', json={'ids': exercise_ids[:2]})
+    assert response.status_code == 200
+    assert len(updates) == 1
+    assert list(exercises_by_id(client)) == exercise_ids[2:]
+    assert [kwargs['data'] for event_type, kwargs in logged_events if event_type == 'batch_delete_exercises'] == [
+        {'exercise_ids': exercise_ids[:2], 'count': 2}
+    ]
+
+
+def test_partial_not_found_rolls_back_the_whole_batch(client, exercise_ids):
+    before = exercises_by_id(client)
+    response = client.patch('/api/workout/exercises', json={'ids': [exercise_ids[0], 9999], 'changes': {'reps': 1}})
+    assert response.status_code == 404
+    assert response.get_json()['not_found'] == [9999]
+    response = client.patch('/api/workout/exercises', json={'updates': [{'id': exercise_ids[0], 'reps': 1}, {'id': 9998, 'reps': 1}]})
+    assert response.get_json()['not_found'] == [9998]
+    response = client.delete('/api/workout/exercises', json={'ids': [9999, *exercise_ids]})
+    assert (response.status_code, response.get_json()['not_found']) == (404, [9999])
+    assert exercises_by_id(client) == before
+
+
+def test_invalid_batches_are_rejected(app_module, client, exercise_ids):
+    too_many = list(range(1, app_module.MAX_BATCH_SIZE + 2))
+    assert client.patch('/api/workout/exercises', json={'ids': too_many, 'changes': {'reps': 1}}).status_code == 400
+    assert client.delete('/api/workout/exercises', json={'ids': too_many}).status_code == 400
+    assert client.delete('/api/workout/exercises', json={'ids': []}).status_code == 400
+    assert client.patch('/api/workout/exercises', json={'ids': exercise_ids, 'changes': {'date': '2026-01-06'}}).status_code == 400
+    assert client.patch('/api/workout/exercises', json={'updates': [{'id': exercise_ids[0]}]}).status_code == 400
+    # 上限ちょうどは受け付ける（存在しないIDは 404）
+    response = client.delete('/api/workout/exercises', json={'ids': too_many[:-1]})
+    assert response.status_code == 404
@@ -0,0 +1,42 @@
+"""年間カレンダー（/workouts の year 指定と calendar_index の作成）"""
+import pytest
+
+from conftest import workout
+
+
+def calendar_years(module):
+    with module.app.app_context():
+        return sorted(row.year for row in module.db.session.query(module.CalendarIndex.year))
+
+
+@pytest.mark.parametrize('year', ['0', '1899', '10000'])
+def test_out_of_range_year_is_rejected(client, year):
+    assert client.get(f'/workouts?year={year}').status_code == 400
+    assert client.get(f'/api/calendar?year={year}').status_code == 400
+
+
+def test_reads_do_not_write_calendar_index(app_module, client):
+    client.post('/api/workout', json=workout('2025-03-10'))
+    with app_module.app.app_context():
+        app_module.db.session.execute(app_module.db.delete(app_module.CalendarIndex))
+        app_module.db.session.commit()
+
+    for url in ('/api/calendar?year=2025', '/api/calendar?year=2024', '/workouts?year=2025', '/workouts?year=1900'):
+        assert client.get(url).status_code == 200, url
+    assert calendar_years(app_module) == []
+    # 保存されていない年も集計して返す
+    assert client.get('/api/calendar?year=2025').get_json()['training_days'] == 1
+
+
+def test_writes_create_and_update_calendar_index(app_module, client):
+    client.post('/api/workout', json=workout('2025-03-10'))
+    assert calendar_years(app_module) == [2025]
+    client.post('/api/workout', json=workout('2025-03-12'))
+    client.post('/api/workout', json=workout('2026-01-05'))
+    assert calendar_years(app_module) == [2025, 2026]
+
+    payload = client.get('/api/calendar?year=2025').get_json()
+    assert payload['training_days'] == 2
+    with app_module.app.app_context():
+        stored = app_module.db.session.get(app_module.CalendarIndex, ('default', 2025)).data
+        assert stored == app_module.build_calendar('default', 2025)
@@ -0,0 +1,159 @@
+"""同じ日付・同じエクササイズへの並行書き込み（ファイルのSQLiteを複数スレッドから使用）"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import workout
+
+THREADS = 8
+POSTS_PER_THREAD = 5
+
+
+def run_parallel(module, count, request):
+    """count 個のリクエストをスレッドごとのテストクライアントで同時に開始し、レスポンスを返す"""
+    barrier = threading.Barrier(count)
+
+    def call(index):
+        client = module.app.test_client()
+        barrier.wait()
+        return request(client, index)
+
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(call, range(count)))
+
+
+def create_exercises(client, count=2):
+    """1セッションにエクササイズを作成し、(セッションID, エクササイズIDのリスト) を返す"""
+    response = client.post('/api/workout', json=workout('2026-01-05', *[f'種目{i}' for i in range(count)]))
+    assert response.status_code == 200
+    session_id = response.get_json()['session_id']
+    session = client.get(f"/api/workout/{session_id}").get_json()
+    return session_id, [exercise['id'] for exercise in session['exercises']]
+
+
+def get_exercise(client, session_id, exercise_id):
+    session = client.get(f"/api/workout/{session_id}").get_json()
+    return next(exercise for exercise in session['exercises'] if exercise['id'] == exercise_id)
+
+
+def test_parallel_posts_share_one_session_per_date(app_module):
+    def post_many(client, index):
+        return [
+            client.post('/api/workout', json=workout('2026-01-05', f'種目{index}-{i}', '懸垂')).status_code
+            for i in range(POSTS_PER_THREAD)
+        ]
+
+    results = run_parallel(app_module, THREADS, post_many)
+    assert all(status == 200 for statuses in results for status in statuses)
+
+    with app_module.app.app_context():
+        db, WorkoutSession, WorkoutLog = app_module.db, app_module.WorkoutSession, app_module.WorkoutLog
+        sessions = db.session.query(WorkoutSession.id, WorkoutSession.version).filter_by(tenant_id='default').all()
+        assert len(sessions) == 1
+        # 追記のたびにバージョンが上がる（最初の作成が1）
+        assert sessions[0].version == THREADS * POSTS_PER_THREAD
+        assert db.session.query(WorkoutLog).filter_by(session_id=sessions[0].id).count() == THREADS * POSTS_PER_THREAD * 2
+
+
+def test_parallel_posts_to_different_dates(app_module):
+    def post(client, index):
+        return client.post('/api/workout', json=workout(f'2026-02-{index + 1:02d}')).status_code
+
+    assert run_parallel(app_module, THREADS, post) == [200] * THREADS
+    with app_module.app.app_context():
+        dates = [row.date for row in app_module.db.session.query(app_module.WorkoutSession.date)]
+        assert len(dates) == len(set(dates)) == THREADS
+
+
+def test_update_exercise_with_stale_version_returns_412(client):
+    _, (exercise_id, _) = create_exercises(client)
+
+    response = client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 8}, headers={'If-Match': '"1"'})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 2
+
+    response = client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 7}, headers={'If-Match': '"1"'})
+    assert response.status_code == 412
+    assert response.get_json()['current_version'] == 2
+    # ボディの version でも同じ判定になる
+    assert client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 7, 'version': 1}).status_code == 412
+    assert client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 7, 'version': 2}).status_code == 200
+
+
+def test_parallel_updates_with_same_version_apply_once(app_module, client):
+    session_id, (exercise_id, _) = create_exercises(client)
+
+    def update(client, index):
+        return client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': index + 1, 'version': 1}).status_code
+
+    statuses = run_parallel(app_module, THREADS, update)
+    assert statuses.count(200) == 1
+    assert statuses.count(412) == THREADS - 1
+    assert get_exercise(client, session_id, exercise_id)['version'] == 2
+
+
+def test_batch_update_with_stale_version_rolls_back(client):
+    session_id, (first, second) = create_exercises(client)
+    assert client.put(f'/api/workout/exercise/{second}', json={'notes': '先に更新'}).status_code == 200
+
+    response = client.patch('/api/workout/exercises', json={'updates': [
+        {'id': first, 'version': 1, 'notes': '一括'},
+        {'id': second, 'version': 1, 'notes': '一括'},
+    ]})
+    assert response.status_code == 412
+    assert second in response.get_json()['exercise_ids']
+
+    # 1件でも不一致なら何も更新しない
+    exercise = get_exercise(client, session_id, first)
+    assert exercise['version'] == 1
+    assert exercise['notes'] != '一括'
+
+    response = client.patch('/api/workout/exercises', json={'updates': [
+        {'id': first, 'version': 1, 'notes': '一括'},
+        {'id': second, 'version': 2, 'notes': '一括'},
+    ]})
+    assert response.status_code == 200
+    assert get_exercise(client, session_id, second)['notes'] == '一括'
+
+
+def test_unparsable_if_match_is_a_mismatch(client):
+    session_id, (exercise_id, _) = create_exercises(client)
+
+    response = client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 8}, headers={'If-Match': '"deadbeef"'})
+    assert response.status_code == 412
+    # If-Match があればボディの version より優先する
+    response = client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 8, 'version': 1}, headers={'If-Match': '"9"'})
+    assert response.status_code == 412
+    assert client.delete(f'/api/workout/exercise/{exercise_id}', headers={'If-Match': '"deadbeef"'}).status_code == 412
+    assert client.delete(f'/api/workout/{session_id}', headers={'If-Match': '"deadbeef"'}).status_code == 412
+    assert get_exercise(client, session_id, exercise_id)['version'] == 1
+
+    assert client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 8}, headers={'If-Match': '"x", W/"1"'}).status_code == 200
+    assert client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 9}, headers={'If-Match': '*'}).status_code == 200
+
+
+def test_batch_update_with_ids_checks_versions(client):
+    session_id, (first, second) = create_exercises(client)
+
+    body = {'ids': [first, second], 'changes': {'notes': '一括'}}
+    assert client.patch('/api/workout/exercises', json={**body, 'versions': [1, 2]}).status_code == 412
+    assert client.patch('/api/workout/exercises', json={**body, 'version': 2}).status_code == 412
+    assert client.patch('/api/workout/exercises', json={**body, 'versions': [1]}).status_code == 400
+    assert get_exercise(client, session_id, first)['notes'] != '一括'
+
+    assert client.patch('/api/workout/exercises', json={**body, 'versions': [1, 1]}).status_code == 200
+    assert get_exercise(client, session_id, second)['version'] == 2
+
+
+def test_batch_delete_checks_versions(client):
+    session_id, (first, second) = create_exercises(client)
+
+    response = client.delete('/api/workout/exercises', json={'ids': [first], 'version': 99})
+    assert response.status_code == 412
+    assert response.get_json()['exercise_ids'] == [first]
+    response = client.delete('/api/workout/exercises', json={'ids': [first, second], 'versions': [1, 2]})
+    assert response.status_code == 412
+    # 1件でも不一致なら何も削除しない
+    assert len(client.get(f'/api/workout/{session_id}').get_json()['exercises']) == 2
+
+    assert client.delete('/api/workout/exercises', json={'ids': [first, second], 'versions': [1, 1]}).status_code == 200
+    assert client.get('/api/trash').get_json()['exercises'] != []
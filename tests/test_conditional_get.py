@@ -0,0 +1,92 @@
+"""条件付きGET（ETag / If-None-Match / 304）とレスポンス圧縮"""
+import gzip
+
+import pytest
+
+from conftest import workout
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+@pytest.fixture
+def client_with_data(client):
+    client.post('/api/workout', json=workout('2026-01-05', 'ベンチプレス', 'スクワット'))
+    return client
+
+
+def test_matching_if_none_match_returns_304(client_with_data):
+    client = client_with_data
+    response = client.get('/workouts')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    cached = client.get('/workouts', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+    assert cached.headers['ETag'] == etag
+    assert client.get('/workouts', headers={'If-None-Match': '*'}).status_code == 304
+    assert client.get('/workouts', headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_etag_changes_after_write(client_with_data):
+    client = client_with_data
+    etag = client.get('/workouts').headers['ETag']
+    session_etag = client.get('/api/workout/1').headers['ETag']
+
+    client.post('/api/workout', json=workout('2026-01-05', 'デッドリフト'))
+    response = client.get('/workouts', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert 'デッドリフト' in response.get_data(as_text=True)
+    # セッションのETagはバージョン
+    response = client.get('/api/workout/1', headers={'If-None-Match': session_etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != session_etag
+
+
+def test_gzip_suffix_round_trips_through_etag_base(client_with_data):
+    client = client_with_data
+    plain = client.get('/workouts')
+    compressed = client.get('/workouts', headers=GZIP)
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == plain.data
+    gzip_etag = compressed.headers['ETag']
+    assert gzip_etag == plain.headers['ETag'][:-1] + '-gzip"'
+
+    # クライアントが保持している圧縮版のETagのまま 304 を返す
+    cached = client.get('/workouts', headers={**GZIP, 'If-None-Match': gzip_etag})
+    assert (cached.status_code, cached.headers['ETag']) == (304, gzip_etag)
+    assert client.get('/workouts', headers={'If-None-Match': gzip_etag}).status_code == 304
+
+
+def test_brotli_when_available(client_with_data):
+    pytest.importorskip('brotli')
+    response = client_with_data.get('/workouts', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert response.headers['ETag'].endswith('-br"')
+    assert client_with_data.get('/workouts', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_small_bodies_are_not_compressed(app_module, client_with_data):
+    response = client_with_data.get('/api/workout/1', headers=GZIP)
+    assert len(response.data) < app_module.COMPRESS_MIN_SIZE
+    assert 'Content-Encoding' not in response.headers
+    assert app_module.etag_base('abc-br') == 'abc'
+    assert app_module.etag_base('abc-gzip') == 'abc'
+    assert app_module.etag_base('abc') == 'abc'
+
+
+def test_compressed_etag_is_accepted_by_if_match(client_with_data):
+    client = client_with_data
+    version = client.get('/api/workout/1').headers['ETag'].strip('"')
+    exercise_id = client.get('/api/workout/1').get_json()['exercises'][0]['id']
+    exercise_version = client.get('/api/workout/1').get_json()['exercises'][0]['version']
+
+    response = client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 5}, headers={'If-Match': f'"{exercise_version}-gzip"'})
+    assert response.status_code == 200
+    # 更新でセッションのバージョンも上がるため、更新前の（圧縮版の）ETagは不一致
+    assert client.delete('/api/workout/1', headers={'If-Match': f'"{version}-br"'}).status_code == 412
+    current = client.get('/api/workout/1').headers['ETag'].strip('"')
+    assert client.delete('/api/workout/1', headers={'If-Match': f'"{current}-br"'}).status_code == 200
@@ -0,0 +1,83 @@
+"""エクササイズの重複検出・統合と受信時の重複排除（DEDUP_ON_INGEST）"""
+from conftest import workout
+
+
+def post(client, body):
+    response = client.post('/api/workout', json=body)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def live_exercises(client, session_id):
+    return client.get(f'/api/workout/{session_id}').get_json()['exercises']
+
+
+def test_detects_repeated_requests_but_not_sets_within_one_request(client):
+    # 同じリクエスト内の同じ内容は別のセット
+    session_id = post(client, workout('2026-01-05', 'ベンチプレス', 'ベンチプレス'))['session_id']
+    assert client.get('/api/workout/duplicates').get_json()['duplicate_count'] == 0
+
+    # 再送（別名で書いても同じ種目）は重複
+    post(client, workout('2026-01-05', 'ベンチ', 'ベンチプレス', 'スクワット'))
+    report = client.get('/api/workout/duplicates').get_json()
+    assert report['duplicate_count'] == 2
+    first_ids = [exercise['id'] for exercise in live_exercises(client, session_id)[:2]]
+    assert [(item['name'], item['duplicate_of']) for item in report['sessions'][0]['duplicates']] == [
+        ('ベンチ', first_ids[0]), ('ベンチプレス', first_ids[1])
+    ]
+    # 別の日付は対象外・期間で絞り込める
+    post(client, workout('2026-01-06', 'ベンチプレス'))
+    assert client.get('/api/workout/duplicates?start_date=2026-01-06').get_json()['duplicate_count'] == 0
+    assert client.get('/api/workout/duplicates?start_date=bad').status_code == 400
+
+
+def test_merge_dry_run_then_moves_duplicates_to_trash(client):
+    session_id = post(client, workout('2026-01-05', 'ベンチプレス', 'スクワット'))['session_id']
+    post(client, workout('2026-01-05', 'ベンチプレス', 'スクワット'))
+    version = client.get(f'/api/workout/{session_id}').get_json()['version']
+
+    dry_run = client.post('/api/workout/duplicates/merge', json={'dry_run': True}).get_json()
+    assert (dry_run['status'], dry_run['merged'], dry_run['duplicate_count']) == ('dry_run', 0, 2)
+    assert len(live_exercises(client, session_id)) == 4
+
+    duplicate_ids = [item['id'] for item in dry_run['sessions'][0]['duplicates']]
+    merged = client.post('/api/workout/duplicates/merge', json={'exercise_ids': duplicate_ids[:1]}).get_json()
+    assert merged['exercise_ids'] == duplicate_ids[:1]
+    merged = client.post('/api/workout/duplicates/merge', json={}).get_json()
+    assert merged['exercise_ids'] == duplicate_ids[1:]
+
+    assert len(live_exercises(client, session_id)) == 2
+    assert sorted(exercise['id'] for exercise in client.get('/api/trash').get_json()['exercises']) == duplicate_ids
+    assert client.get(f'/api/workout/{session_id}').get_json()['version'] > version
+    history = client.get(f'/api/workout/exercise/{duplicate_ids[0]}/history').get_json()['history']
+    assert history[-1]['after']['duplicate_of'] < duplicate_ids[0]
+
+
+def test_dedup_on_ingest_skips_resent_rows(make_app):
+    module = make_app(DEDUP_ON_INGEST='1')
+    client = module.app.test_client()
+
+    body = workout('2026-01-05', 'ベンチプレス', 'ベンチプレス', 'スクワット')
+    first = post(client, body)
+    assert first['duplicates_skipped'] == 0
+    session_id = first['session_id']
+    assert len(live_exercises(client, session_id)) == 3
+
+    # 再送は一意インデックスの競合で挿入しない
+    assert post(client, body)['duplicates_skipped'] == 3
+    # 同じ内容の3セット目だけが新しい行
+    assert post(client, workout('2026-01-05', 'ベンチ', 'ベンチ', 'ベンチ'))['duplicates_skipped'] == 2
+    assert len(live_exercises(client, session_id)) == 4
+
+    # ゴミ箱に移した行は重複として扱わない
+    bench_id = live_exercises(client, session_id)[0]['id']
+    client.delete(f'/api/workout/exercise/{bench_id}')
+    assert post(client, workout('2026-01-05', 'ベンチプレス'))['duplicates_skipped'] == 0
+    assert len(live_exercises(client, session_id)) == 4
+
+
+def test_ingest_keeps_duplicates_when_disabled(client):
+    body = workout('2026-01-05', 'ベンチプレス')
+    post(client, body)
+    assert post(client, body)['duplicates_skipped'] == 0
+    assert client.get('/api/workout/duplicates').get_json()['duplicate_count'] == 1
@@ -0,0 +1,83 @@
+"""イベント配信（EventBroker と SSE /api/events/stream）"""
+import json
+
+import pytest
+
+
+@pytest.fixture
+def module(make_app):
+    return make_app(EVENT_BUFFER_SIZE='3', EVENT_MAX_SUBSCRIBERS='2', EVENT_HEARTBEAT_SECONDS='0.05')
+
+
+def test_bounded_buffer_drops_oldest_and_counts(module):
+    broker = module.EventBroker()
+    subscriber = broker.subscribe('default')
+    for index in range(5):
+        broker.publish('default', 'log', {'index': index})
+
+    assert subscriber.dropped == 2
+    assert [payload['index'] for _, _, payload in subscriber.drain()] == [2, 3, 4]
+    assert not subscriber.ready.is_set()
+    assert subscriber.drain() == []
+
+
+def test_events_are_delivered_only_to_the_same_tenant(module):
+    broker = module.EventBroker()
+    tenant_a = broker.subscribe('tenant-a')
+    tenant_b = broker.subscribe('tenant-b')
+    broker.publish('tenant-a', 'workout', {'id': 1})
+
+    assert [event[1] for event in tenant_a.drain()] == ['workout']
+    assert tenant_b.drain() == [] and not tenant_b.ready.is_set()
+    # 再接続時の再送も自テナントの履歴だけ
+    broker.unsubscribe(tenant_b)
+    assert broker.subscribe('tenant-b', last_event_id=0).drain() == []
+
+
+def test_type_filter_and_replay_after_last_event_id(module):
+    broker = module.EventBroker()
+    for event_type in ('log', 'workout', 'log', 'conversation'):
+        broker.publish('default', event_type, {})
+
+    replayed = broker.subscribe('default', {'log', 'conversation'}, last_event_id=1)
+    assert [(event_id, event_type) for event_id, event_type, _ in replayed.drain()] == [(3, 'log'), (4, 'conversation')]
+    # 上限を超える購読は断る
+    assert broker.subscribe('default') is not None
+    assert broker.subscribe('default') is None
+
+
+def read_sse(response, count):
+    """ストリームから count 件のメッセージ（retry 行を除く）を読み取る"""
+    messages = []
+    chunks = iter(response.response)
+    while len(messages) < count:
+        chunk = next(chunks)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith('id:'):
+            fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            messages.append((fields['event'], json.loads(fields['data'])))
+    return messages
+
+
+def test_stream_reports_dropped_events_then_replays(module):
+    client = module.app.test_client()
+    for index in range(5):
+        client.post('/api/receive', json={'message': f'm{index}'})
+
+    response = client.get('/api/events/stream?types=log', headers={'Last-Event-ID': '0'})
+    assert response.mimetype == 'text/event-stream'
+    messages = read_sse(response, 4)
+    assert messages[0] == ('dropped', {'count': 2})
+    assert [payload['event_type'] for _, payload in messages[1:]] == ['receive_data'] * 3
+    assert 'm4' in messages[-1][1]['data']['preview']
+    response.close()
+    assert module.event_broker.subscribers == set()
+
+
+def test_stream_returns_503_when_subscribers_are_full(module):
+    held = [module.event_broker.subscribe('default') for _ in range(2)]
+    response = module.app.test_client().get('/api/events/stream')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    for subscriber in held:
+        module.event_broker.unsubscribe(subscriber)
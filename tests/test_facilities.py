@@ -0,0 +1,32 @@
+"""施設の別名追加・統合"""
+from conftest import workout
+
+
+def test_merging_facilities_is_visible_to_sync_etags_and_other_workers(app_module, client):
+    first = client.post('/api/workout', json=workout('2026-01-05', facility='ジムA')).get_json()['session_id']
+    second = client.post('/api/workout', json=workout('2026-01-07', facility='ジムB')).get_json()['session_id']
+    facilities = {facility['name']: facility['id'] for facility in client.get('/api/facilities').get_json()['facilities']}
+
+    cursor = client.get('/api/sync').get_json()['next']
+    etags = {url: client.get(url).headers['ETag'] for url in ('/workouts?facility=ジムA', '/api/export/excel?facility=ジムA')}
+    summary_url = f"/api/facilities/{facilities['ジムA']}/summary"
+    assert client.get(summary_url).get_json()['visits']['total'] == 1
+    # 別のワーカーが統合前に作ったキャッシュ（このワーカーのキャッシュは統合時に消える）
+    other_worker_cache = dict(app_module._facility_summary_cache)
+
+    response = client.post(f"/api/facilities/{facilities['ジムA']}/aliases", json={'alias': 'ジムB'})
+    assert response.status_code == 200
+    assert response.get_json()['visits'] == 2
+
+    # 移動したセッションが差分同期で報告され、バージョンが上がっている
+    changes = client.get(f'/api/sync?since={cursor}').get_json()
+    assert [session['id'] for session in changes['sessions']] == [second]
+    assert changes['sessions'][0]['version'] == 2
+    assert client.get(f'/api/workout/{first}').get_json()['version'] == 1
+
+    # 統合前のETagでは304にならない
+    for url, etag in etags.items():
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 200, url
+
+    app_module._facility_summary_cache.update(other_worker_cache)
+    assert client.get(summary_url).get_json()['visits']['total'] == 2
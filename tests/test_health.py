@@ -0,0 +1,78 @@
+"""ヘルスチェックとウォームアップ（/readyz からの開始は同時に1つ、失敗後は間隔を空ける）"""
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def warmup_app(make_app):
+    return make_app(WARMUP='1', WARMUP_TENANTS='0', WARMUP_POOL_CONNECTIONS='1')
+
+
+def test_healthz_does_not_wait_for_warm_up(warmup_app):
+    assert warmup_app.app.test_client().get('/healthz').status_code == 200
+    assert warmup_app.warmup_state['status'] == 'pending'
+
+
+def test_readyz_starts_one_warm_up_until_done(warmup_app, monkeypatch):
+    started = []
+    release = threading.Event()
+
+    def slow_warm_up():
+        started.append(threading.current_thread())
+        release.wait(5)
+        warmup_app.warmup_state['status'] = 'done'
+
+    monkeypatch.setattr(warmup_app, 'warm_up', slow_warm_up)
+    client = warmup_app.app.test_client()
+    for _ in range(5):
+        response = client.get('/readyz')
+        assert response.status_code == 503
+        assert response.get_json()['checks']['warmup']['status'] == 'running'
+    release.set()
+    started[0].join(5)
+
+    assert len(started) == 1
+    assert client.get('/readyz').status_code == 200
+
+
+def test_failed_warm_up_is_retried_after_backoff(warmup_app, monkeypatch):
+    def broken_step():
+        raise RuntimeError('broken')
+
+    monkeypatch.setattr(warmup_app, 'WARMUP_STEPS', (('broken', broken_step),))
+    state = warmup_app.warm_up()
+    assert state['status'] == 'failed'
+    assert state['errors'] == {'broken': 'broken'}
+
+    calls = []
+    monkeypatch.setattr(warmup_app, 'warm_up', lambda: calls.append(1))
+    assert warmup_app.app.test_client().get('/readyz').status_code == 503
+    assert calls == []
+
+    now = warmup_app.time.monotonic()
+    monkeypatch.setattr(warmup_app.time, 'monotonic', lambda: now + warmup_app.WARMUP_RETRY_SECONDS + 1)
+    assert warmup_app.start_background_warm_up()
+    assert not warmup_app.start_background_warm_up()
+
+
+def test_warm_up_renders_pages_without_api_key_or_writes(make_app):
+    module = make_app(WARMUP='1', WARMUP_TENANTS='0', REQUIRE_API_KEY='1')
+    state = module.warm_up()
+
+    assert state['status'] == 'done', state['errors']
+    assert state['details']['templates']['pages'] == len(module.WARMUP_PAGES)
+    assert module.app.jinja_env.string_templates
+    with module.app.app_context():
+        # /workouts の表示でもカレンダーのインデックスは保存されない
+        assert module.db.session.query(module.CalendarIndex).count() == 0
+    # ウォームアップのリクエストは「最初のリクエスト」に数えない
+    assert not module._first_request_done
+
+
+def test_warm_up_requests_cannot_commit(app_module):
+    with app_module.app.test_request_context('/', environ_base={app_module.WARMUP_ENVIRON: True}):
+        app_module.db.session.add(app_module.Tenant(id='warmup', name='warmup', api_key_hash='x'))
+        with pytest.raises(RuntimeError):
+            app_module.db.session.commit()
+        app_module.db.session.rollback()
@@ -0,0 +1,57 @@
+"""構造化ログのリングバッファ（伏せ字・切り詰め・件数上限・テナント分離）と /logs"""
+import builtins
+import io
+
+from conftest import create_tenant
+
+
+def test_secrets_are_redacted_and_large_values_truncated(app_module, client):
+    max_string, max_items = app_module.LOG_MAX_STRING, app_module.LOG_MAX_ITEMS
+    with app_module.app.test_request_context('/'):
+        app_module.log_event('test_event', data={
+            'api_key': 'key-123',
+            'nested': {'Authorization': 'Bearer x', 'session_token': 't', 'name': 'ok'},
+            'text': 'a' * (max_string + 10),
+            'items': list(range(max_items + 5)),
+            'deep': {'a': {'b': {'c': {'d': {'e': 1}}}}},
+        }, error='e' * (max_string + 1))
+
+    entry = client.get('/api/logs?event_type=test_event').get_json()['items'][0]
+    data = entry['data']
+    assert data['api_key'] == '[REDACTED]'
+    assert data['nested'] == {'Authorization': '[REDACTED]', 'session_token': '[REDACTED]', 'name': 'ok'}
+    assert data['text'] == 'a' * max_string + '…(+10 chars)'
+    assert data['items'] == list(range(max_items)) + ['…(+5 items)']
+    assert data['deep'] == {'a': {'b': {'c': '<dict 1 keys>'}}}
+    assert entry['error'].endswith('…(+1 chars)')
+    assert 'key-123' not in client.get('/logs').get_data(as_text=True)
+
+
+def test_buffer_keeps_latest_entries_per_tenant(make_app):
+    module = make_app(LOG_BUFFER_SIZE='3')
+    client = module.app.test_client()
+    tenant_b = create_tenant(module, 'tenant-b')
+    for index in range(5):
+        client.post('/api/receive', json={'message': f'default {index}'})
+    client.post('/api/receive', headers=tenant_b, json={'message': 'tenant-b'})
+
+    items = client.get('/api/logs').get_json()['items']
+    previews = [item['data']['preview'] for item in items]
+    assert [f'default {index}' in preview for index, preview in zip((4, 3, 2), previews)] == [True, True, True]
+    items = client.get('/api/logs', headers=tenant_b).get_json()['items']
+    assert len(items) == 1 and 'tenant-b' in items[0]['data']['preview']
+
+
+def test_logs_viewer_does_not_read_files(app_module, client, monkeypatch):
+    client.post('/api/receive', json={'message': 'hello'})
+    client.get('/logs')  # 静的ファイルのハッシュは初回に読み込んで保持する
+
+    def no_file_access(*args, **kwargs):
+        raise AssertionError(f'file opened: {args[0]!r}')
+
+    monkeypatch.setattr(builtins, 'open', no_file_access)
+    monkeypatch.setattr(io, 'open', no_file_access)
+    response = client.get('/logs')
+    assert response.status_code == 200
+    assert 'receive_data' in response.get_data(as_text=True)
+    assert client.get('/api/logs').get_json()['total'] >= 1
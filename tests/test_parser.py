@@ -0,0 +1,59 @@
+"""略記テキストの解析（parse_exercise_line / parse_workout_text と /api/workout/parse）"""
+import pytest
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('ベンチプレス 80kg×8 3set', {'name': 'ベンチプレス', 'weight': '80kg', 'reps': 8, 'sets': 3}),
+    ('ベンチプレス 80kg x 8', {'name': 'ベンチプレス', 'weight': '80kg', 'reps': 8, 'sets': 1}),
+    ('デッド 225lbs X 5 X 3', {'name': 'デッドリフト', 'weight': '225lbs', 'reps': 5, 'sets': 3}),
+    ('スクワット 100×5×5', {'name': 'スクワット', 'weight': '100kg', 'reps': 5, 'sets': 5}),
+    ('スクワット 100kg 5x5', {'name': 'スクワット', 'weight': '100kg', 'reps': 5, 'sets': 5}),
+    ('ベンチプレス 80kg×8 3set +RP3', {'name': 'ベンチプレス', 'reps': 8, 'rest_pause_reps': 3}),
+    ('ダンベルカール 10kg×2 12回 3セット', {'name': 'アームカール', 'weight': '10kg×2', 'reps': 12, 'sets': 3}),
+    ('懸垂 10×3', {'name': '懸垂', 'weight': '自重', 'reps': 10, 'sets': 3}),
+    ('懸垂 自重 8回', {'name': '懸垂', 'weight': '自重', 'reps': 8}),
+    ('ケーブルクロスオーバー 15kg 12回', {'name': 'ケーブルクロスオーバー', 'category': 'ケーブル', 'reps': 12}),
+    ('ベンチ 60kg×10 # フォーム重視', {'name': 'ベンチプレス', 'notes': 'フォーム重視'}),
+    # 名前に数字を含む種目は重量・回数の記述の手前まで
+    ('レッグプレス2 100kg×10 3set', {'name': 'レッグプレス2', 'weight': '100kg', 'reps': 10, 'sets': 3}),
+    ('21s カール 10kg×21', {'name': '21s カール', 'weight': '10kg', 'reps': 21}),
+])
+def test_parse_exercise_line(app_module, line, expected):
+    exercise = app_module.parse_exercise_line(line)
+    assert {key: exercise[key] for key in expected} == expected
+
+
+@pytest.mark.parametrize('line, name, category, target_muscle', [
+    ('ＤＢベンチ　30ｋｇ×10', 'ダンベルベンチプレス', 'ダンベル', '大胸筋中部'),
+    ('BP 80kg×8', 'ベンチプレス', 'フリーウェイト', '大胸筋'),
+    ('lat pulldown 50kg×10', 'ラットプルダウン', 'マシン', '広背筋'),
+    ('スミスマシンスクワット 60kg×10', 'スミスマシンスクワット', 'マシン', None),
+])
+def test_alias_lookup(app_module, line, name, category, target_muscle):
+    exercise = app_module.parse_exercise_line(line)
+    assert (exercise['name'], exercise['category'], exercise['target_muscle']) == (name, category, target_muscle)
+
+
+@pytest.mark.parametrize('line, error', [
+    ('80kg×8', '種目名がありません'),
+    ('ベンチプレス', '回数を解釈できません'),
+    ('ベンチプレス 80kg', '回数を解釈できません'),
+])
+def test_unparsable_line_raises(app_module, line, error):
+    with pytest.raises(ValueError, match=error):
+        app_module.parse_exercise_line(line)
+
+
+def test_parse_workout_text_reports_errors_per_line(app_module):
+    exercises, errors = app_module.parse_workout_text('ベンチ 80kg×8\n\nベンチプレス; 懸垂 10回')
+    assert [exercise['name'] for exercise in exercises] == ['ベンチプレス', '懸垂']
+    assert errors == [{'line': 2, 'text': 'ベンチプレス', 'error': errors[0]['error']}]
+
+
+def test_parse_endpoint(client):
+    response = client.post('/api/workout/parse', json={'text': 'スクワット 100kg×5×5\nスクワット'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['exercises'][0]['weight'] == '100kg'
+    assert body['errors'][0]['line'] == 2
+    assert client.post('/api/workout/parse', json={}).status_code == 400
@@ -0,0 +1,105 @@
+"""レート制限（トークンバケット・memory / sql バックエンド・Retry-After）と負荷制御"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+@pytest.mark.parametrize('tokens, elapsed, expected', [
+    (5, 0, (4, 0)),        # 残りがあれば1つ取り出す
+    (0, 0, (0, 10)),       # 空なら1トークン分の補充時間（1/0.1秒）を待つ
+    (0.5, 0, (0.5, 5)),
+    (0, 10, (0, 0)),       # 10秒で1トークン補充される
+    (4, 1000, (4, 0)),     # 補充は容量まで
+])
+def test_take_token(app_module, tokens, elapsed, expected):
+    remaining, retry_after = app_module.take_token(tokens, 100, 5, 0.1, 100 + elapsed)
+    assert (round(remaining, 6), round(retry_after, 6)) == expected
+
+
+@pytest.fixture(params=['memory', 'sql'])
+def backend(request, app_module, tmp_path):
+    if request.param == 'memory':
+        return app_module.MemoryRateLimitBackend()
+    return app_module.SQLRateLimitBackend(f"sqlite:///{tmp_path / 'rate_limits.db'}")
+
+
+def test_backend_allows_capacity_then_refills(backend):
+    results = [backend.acquire('k', 3, 1.0, 100.0) for _ in range(4)]
+    assert [retry_after for _, retry_after in results] == [0, 0, 0, 1.0]
+    assert results[2][0] == 0
+    # 拒否しても待ち時間は延びない
+    assert backend.acquire('k', 3, 1.0, 100.5)[1] == pytest.approx(0.5)
+    assert backend.acquire('k', 3, 1.0, 101.0)[1] == 0
+    # キーごとに独立
+    assert backend.acquire('other', 3, 1.0, 101.0) == (2, 0)
+
+
+def test_sql_backend_does_not_lose_updates_across_workers(app_module, tmp_path):
+    url = f"sqlite:///{tmp_path / 'rate_limits.db'}"
+    # ワーカーごとに別のエンジン（接続プール）から同じバケットを取り出す
+    workers = [app_module.SQLRateLimitBackend(url) for _ in range(4)]
+    capacity, attempts = 10, 40
+    barrier = threading.Barrier(attempts)
+
+    def acquire(index):
+        barrier.wait()
+        return workers[index % len(workers)].acquire('shared', capacity, 0.001, 100.0)[1] == 0
+
+    with ThreadPoolExecutor(max_workers=attempts) as executor:
+        allowed = list(executor.map(acquire, range(attempts)))
+    assert allowed.count(True) == capacity
+
+
+def test_sql_backend_recreates_old_table(app_module, tmp_path):
+    url = f"sqlite:///{tmp_path / 'rate_limits.db'}"
+    backend = app_module.SQLRateLimitBackend(url)
+    with backend.engine.begin() as conn:
+        conn.exec_driver_sql('DROP TABLE rate_limit_buckets')
+        conn.exec_driver_sql('CREATE TABLE rate_limit_buckets (key VARCHAR(200) PRIMARY KEY, tokens FLOAT, updated_at FLOAT)')
+    assert app_module.SQLRateLimitBackend(url).acquire('k', 2, 1.0, 100.0) == (1, 0)
+
+
+@pytest.mark.parametrize('backend_name', ['memory', 'sql'])
+def test_rate_limited_response_has_retry_after(make_app, monkeypatch, backend_name):
+    module = make_app(RATE_LIMIT_ENABLED='1', RATE_LIMITS='default=2/60', RATE_LIMIT_BACKEND=backend_name)
+    client = module.app.test_client()
+    now = module.time.time()
+    monkeypatch.setattr(module.time, 'time', lambda: now)
+
+    responses = [client.get('/api/logs') for _ in range(3)]
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[1].headers['X-RateLimit-Remaining'] == '0'
+    # 2回/60秒なので次のトークンまで30秒
+    assert responses[2].headers['Retry-After'] == '31'
+    assert responses[2].get_json()['retry_after'] == 31
+    # IPごとのバケットなので別のクライアントは制限されない
+    other = client.get('/api/logs', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert other.status_code == 200
+
+
+def test_load_shedding_returns_429_until_cooldown(make_app, monkeypatch):
+    module = make_app(LOAD_SHEDDING='1', SHED_MAX_IN_FLIGHT='2', SHED_COOLDOWN_SECONDS='5')
+    client = module.app.test_client()
+    clock = {'now': module.time.time()}
+    monkeypatch.setattr(module.time, 'time', lambda: clock['now'])
+
+    assert client.get('/api/logs').status_code == 200
+    assert module._load_state['in_flight'] == 0
+
+    # 同時処理数が上限に達している間は受け付けず、クールダウン中は空いても429
+    module._load_state['in_flight'] = 2
+    response = client.get('/api/logs')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '6'
+    module._load_state['in_flight'] = 0
+    clock['now'] += 4
+    assert client.get('/api/logs').status_code == 429
+    # HTMLページは対象外
+    assert client.get('/logs').status_code == 200
+    clock['now'] += 2
+    assert client.get('/api/logs').status_code == 200
+
+    # 平均レイテンシが閾値を超えても同様
+    module._load_state['latency_ms'] = module.SHED_MAX_LATENCY_MS + 1
+    assert client.get('/api/logs').status_code == 429
@@ -0,0 +1,103 @@
+"""リードレプリカへの振り分け（プライマリとレプリカに別々のSQLiteファイルを使用）"""
+import sqlite3
+import time
+
+import pytest
+
+from conftest import workout
+
+
+def replicate(primary_path, replica_path):
+    """プライマリの内容をレプリカへコピー（レプリケーションの代わり）"""
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+@pytest.fixture
+def replica_app(make_app, tmp_path, monkeypatch):
+    """プライマリ primary.db とレプリカ replica.db で読み込んだアプリと、時刻を進める関数を返す"""
+    primary_path, replica_path = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    module = make_app(database_url=f"sqlite:///{primary_path}", read_urls=[f"sqlite:///{replica_path}"])
+    replicate(primary_path, replica_path)
+
+    clock = {'now': time.time()}
+    monkeypatch.setattr(module.time, 'time', lambda: clock['now'])
+
+    def advance(seconds):
+        clock['now'] += seconds
+
+    def sync_now():
+        # レプリカの接続はファイルを開いたままなので、コピー前に閉じる
+        with module.app.app_context():
+            module.db.engines['replica_0'].dispose()
+        replicate(primary_path, replica_path)
+
+    return module, advance, sync_now
+
+
+def session_counts(module):
+    """(プライマリ, レプリカ) のセッション件数"""
+    counts = []
+    with module.app.app_context():
+        for bind_key in (None, 'replica_0'):
+            with module.db.engines[bind_key].connect() as connection:
+                counts.append(connection.execute(module.text('SELECT count(*) FROM workout_sessions')).scalar())
+    return tuple(counts)
+
+
+def synced_dates(client):
+    return sorted(session['date'] for session in client.get('/api/sync').get_json()['sessions'])
+
+
+def test_writes_go_to_primary_and_reads_to_replica(replica_app):
+    module, advance, sync_now = replica_app
+    client = module.app.test_client()
+
+    assert client.post('/api/workout', json=workout('2026-01-05')).status_code == 200
+    assert session_counts(module) == (1, 0)
+
+    # 書き込み直後の読み取りはプライマリから（read-your-writes）
+    assert client.get_cookie('primary_until') is not None
+    assert synced_dates(client) == ['2026-01-05']
+    assert synced_dates(module.app.test_client()) == ['2026-01-05']
+
+    # 一定時間後の読み取りはレプリカから（まだ複製されていない）
+    advance(module.REPLICA_STICKY_SECONDS + 1)
+    assert synced_dates(client) == []
+    assert synced_dates(module.app.test_client()) == []
+
+    sync_now()
+    assert synced_dates(client) == ['2026-01-05']
+
+
+def test_sticky_window_follows_each_write(replica_app):
+    module, advance, sync_now = replica_app
+    client = module.app.test_client()
+    client.post('/api/workout', json=workout('2026-01-05'))
+    sync_now()
+    advance(module.REPLICA_STICKY_SECONDS + 1)
+
+    # レプリカから読んでいる状態で書き込んでもプライマリに入り、再びプライマリから読む
+    assert client.post('/api/workout', json=workout('2026-01-06')).status_code == 200
+    assert session_counts(module) == (2, 1)
+    assert synced_dates(client) == ['2026-01-05', '2026-01-06']
+
+    advance(module.REPLICA_STICKY_SECONDS - 1)
+    assert synced_dates(client) == ['2026-01-05', '2026-01-06']
+    advance(2)
+    assert synced_dates(client) == ['2026-01-05']
+
+
+def test_failed_write_does_not_pin_reads_to_primary(replica_app):
+    module, advance, sync_now = replica_app
+    client = module.app.test_client()
+    client.post('/api/workout', json=workout('2026-01-05'))
+    advance(module.REPLICA_STICKY_SECONDS + 1)
+
+    assert client.post('/api/workout', json={'date': '2026-01-06'}).status_code == 400
+    assert synced_dates(client) == []
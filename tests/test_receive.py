@@ -0,0 +1,62 @@
+"""POST /api/receive のボディサイズ上限（413）とNDJSONの逐次パース"""
+import hashlib
+import io
+import json
+
+import pytest
+
+NDJSON = 'application/x-ndjson'
+
+
+@pytest.fixture
+def module(make_app):
+    return make_app(MAX_CONTENT_LENGTH='1024')
+
+
+def ndjson_lines(count, padding=''):
+    return ''.join(json.dumps({'index': index, 'padding': padding}) + '\n' for index in range(count)).encode()
+
+
+def test_ndjson_counts_records_and_hashes_the_raw_body(module):
+    client = module.app.test_client()
+    body = ndjson_lines(5).replace(b'\n', b'\n\n', 1)  # 空行は数えない
+    response = client.post('/api/receive', data=body, content_type=NDJSON)
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['records'] == 5
+    assert result['sha256'] == hashlib.sha256(body).hexdigest()
+
+    saved = client.get('/api/received-data').get_json()['items'][0]['data']
+    assert (saved['format'], saved['records'], saved['size']) == ('ndjson', 5, len(body))
+    assert len(saved['preview_records']) == min(5, module.NDJSON_PREVIEW_RECORDS)
+
+
+def test_ndjson_errors(module):
+    client = module.app.test_client()
+    response = client.post('/api/receive', data=b'{"a": 1}\n{broken\n', content_type=NDJSON)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Invalid JSON on line 2')
+    assert client.post('/api/receive', data=b'\n\n', content_type=NDJSON).status_code == 400
+
+
+def test_oversized_body_returns_413_without_saving(module):
+    client = module.app.test_client()
+    large = json.dumps({'message': 'x' * 2048})
+    response = client.post('/api/receive', data=large, content_type='application/json')
+    assert response.status_code == 413
+    assert response.get_json()['error'] == 'Payload too large (max 1024 bytes)'
+    assert client.post('/api/receive', data=ndjson_lines(50), content_type=NDJSON).status_code == 413
+
+    # Content-Length のないストリーム（chunked）も読み込み中に上限で止める
+    response = client.post(
+        '/api/receive', input_stream=io.BytesIO(ndjson_lines(50)), content_type=NDJSON,
+        environ_overrides={'wsgi.input_terminated': True}
+    )
+    assert response.status_code == 413
+    assert client.get('/api/received-data').get_json()['total'] == 0
+
+
+def test_echo_can_be_disabled(module):
+    client = module.app.test_client()
+    assert client.post('/api/receive', json={'message': 'hi'}).get_json()['received_data'] == {'message': 'hi'}
+    assert 'received_data' not in client.post('/api/receive?echo=0', json={'message': 'hi'}).get_json()
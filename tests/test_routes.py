@@ -0,0 +1,104 @@
+"""主要ルートの動作（組み込みSQLiteと DATABASE_URL の両方で実行）"""
+import datetime
+import secrets
+
+import pytest
+
+from conftest import create_tenant
+
+READ_ROUTES = (
+    '/', '/workouts', '/workouts/weekly', '/workouts/monthly', '/workouts/analytics', '/workouts/facilities',
+    '/api/analytics/training-load', '/api/calendar', '/api/export/excel', '/export', '/api/facilities',
+    '/api/logs', '/logs', '/logs/live', '/data', '/conversations', '/api/received-data', '/api/conversations',
+    '/api/sync', '/api/trash', '/api/workout/duplicates', '/healthz',
+)
+
+
+@pytest.fixture
+def seeded(backend_app):
+    """一時テナントに3日分のセッションを作成し、(module, client, headers, セッションID, エクササイズID) を返す"""
+    module = backend_app
+    tenant_id = f"test-{secrets.token_hex(4)}"
+    headers = create_tenant(module, tenant_id)
+    client = module.app.test_client()
+
+    first_day = datetime.date.today() - datetime.timedelta(days=6)
+    session_ids = []
+    for i in range(3):
+        response = client.post('/api/workout', headers=headers, json={
+            'date': (first_day + datetime.timedelta(days=i * 2)).isoformat(),
+            'facility': 'test-routes',
+            'exercises': [
+                {'name': 'ベンチプレス', 'category': 'フリーウェイト', 'weight': '60kg', 'reps': 10, 'sets': 3, 'target_muscle': '胸'},
+                {'name': 'スクワット', 'category': 'フリーウェイト', 'weight': '80kg', 'reps': 8, 'sets': 3, 'target_muscle': '脚'},
+            ]
+        })
+        assert response.status_code == 200, response.get_json()
+        session_ids.append(response.get_json()['session_id'])
+    exercise_ids = [
+        exercise['id']
+        for session_id in session_ids
+        for exercise in client.get(f'/api/workout/{session_id}', headers=headers).get_json()['exercises']
+    ]
+    yield module, client, headers, session_ids, exercise_ids
+    with module.app.app_context():
+        module.delete_tenant_data(tenant_id)
+
+
+def test_read_routes(seeded):
+    module, client, headers, session_ids, _ = seeded
+    with module.app.app_context():
+        static_urls = tuple(module.asset_url(name) for name in module.static_asset_names())
+    for url in READ_ROUTES + static_urls + tuple(f'/api/workout/{session_id}' for session_id in session_ids):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, url
+
+
+def test_summaries_reflect_saved_sessions(seeded):
+    _, client, headers, session_ids, exercise_ids = seeded
+
+    assert len(exercise_ids) == 6
+    load = client.get('/api/analytics/training-load', headers=headers).get_json()
+    assert sum(week['total_hard_sets'] for week in load['weeks']) == 18
+    sync = client.get('/api/sync', headers=headers).get_json()
+    assert sorted(session['id'] for session in sync['sessions']) == sorted(session_ids)
+    facilities = client.get('/api/facilities', headers=headers).get_json()['facilities']
+    assert [(facility['name'], facility['visits']) for facility in facilities] == [('test-routes', 3)]
+
+
+def test_write_routes(seeded):
+    _, client, headers, session_ids, exercise_ids = seeded
+
+    for exercise_id in exercise_ids[::2]:
+        response = client.put(f'/api/workout/exercise/{exercise_id}', headers=headers, json={'reps': 9})
+        assert response.status_code == 200
+    response = client.patch('/api/workout/exercises', headers=headers, json={'ids': exercise_ids, 'changes': {'notes': 'test-routes'}})
+    assert response.status_code == 200
+    session = client.get(f'/api/workout/{session_ids[0]}', headers=headers).get_json()
+    assert [exercise['reps'] for exercise in session['exercises']] == [9, 8]
+    assert {exercise['notes'] for exercise in session['exercises']} == {'test-routes'}
+
+    assert client.post('/api/receive', headers=headers, json={'message': 'test-routes'}).status_code == 200
+    response = client.post('/api/workout/parse', headers=headers, json={'texts': ['ベンチプレス 60kg×10 3set']})
+    assert response.status_code == 200
+    response = client.post('/api/conversation', headers=headers, json={'user_input': 'test-routes', 'conversation_summary': 'test-routes'})
+    assert response.status_code == 200
+
+    for exercise_id in exercise_ids[1::2]:
+        assert client.delete(f'/api/workout/exercise/{exercise_id}', headers=headers).status_code == 200
+    for session_id in session_ids:
+        assert client.delete(f'/api/workout/{session_id}', headers=headers).status_code == 200
+    trash = client.get('/api/trash', headers=headers).get_json()
+    assert sorted(session['id'] for session in trash['sessions']) == sorted(session_ids)
+
+
+def test_rate_limit_applies_to_clients_but_not_to_internal_checks(make_app):
+    module = make_app(RATE_LIMIT_ENABLED='1', RATE_LIMITS='default=2/60')
+    client = module.app.test_client()
+    # 外部からはバイパス用のキーを設定できない
+    statuses = [client.get('/api/logs', headers={'Gpts-Action.Skip-Rate-Limit': '1'}).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+    internal = module.unlimited_test_client()
+    assert [internal.get('/api/logs').status_code for _ in range(3)] == [200, 200, 200]
+    assert module.RATE_LIMIT_ENABLED is True
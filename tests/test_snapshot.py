@@ -0,0 +1,70 @@
+"""列指向スナップショット（/api/analytics/aggregate）とSQLでの集計の一致"""
+import pytest
+from sqlalchemy import func
+
+from conftest import workout
+
+pytest.importorskip('numpy')
+
+
+def sql_aggregate(module):
+    """有効なエクササイズを種目ごとにSQLで集計（スナップショットと同じ定義）"""
+    WorkoutLog = module.WorkoutLog
+    total_reps = func.coalesce(WorkoutLog.reps, 0) * func.coalesce(WorkoutLog.sets, 0) + func.coalesce(WorkoutLog.rest_pause_reps, 0)
+    with module.app.app_context():
+        rows = module.db.session.query(
+            WorkoutLog.exercise_name, func.count(WorkoutLog.id), func.sum(func.coalesce(WorkoutLog.sets, 0)), func.sum(total_reps)
+        ).filter(WorkoutLog.tenant_id == 'default').group_by(WorkoutLog.exercise_name).order_by(WorkoutLog.exercise_name).all()
+    return [{'exercise': name, 'count': count, 'sets': float(sets), 'reps': float(reps)} for name, count, sets, reps in rows]
+
+
+def snapshot_aggregate(client):
+    response = client.get('/api/analytics/aggregate?group_by=exercise&metrics=count,sets,reps')
+    assert response.status_code == 200
+    body = response.get_json()
+    return sorted(body['rows'], key=lambda row: row['exercise']), body['snapshot']['refreshed']
+
+
+def test_snapshot_matches_sql_after_append_update_and_delete(app_module, client):
+    client.post('/api/workout', json=workout('2026-01-05', 'ベンチプレス', 'スクワット'))
+    rows, refreshed = snapshot_aggregate(client)
+    assert refreshed == 'rebuild'
+    assert rows == sql_aggregate(app_module)
+
+    # 新しい行は追記
+    body = workout('2026-01-12', 'ベンチプレス')
+    body['exercises'][0].update(reps=5, sets=5, rest_pause_reps=2)
+    client.post('/api/workout', json=body)
+    rows, refreshed = snapshot_aggregate(client)
+    assert refreshed == 'append'
+    assert rows == sql_aggregate(app_module)
+    assert snapshot_aggregate(client)[1] == 'none'
+
+    # 既存行の更新・論理削除は作り直し
+    session = client.get('/api/workout/1').get_json()
+    client.put(f"/api/workout/exercise/{session['exercises'][0]['id']}", json={'reps': 12})
+    rows, refreshed = snapshot_aggregate(client)
+    assert refreshed == 'rebuild'
+    assert rows == sql_aggregate(app_module)
+
+    client.delete(f"/api/workout/exercise/{session['exercises'][1]['id']}")
+    rows, refreshed = snapshot_aggregate(client)
+    assert refreshed == 'rebuild'
+    assert [row['exercise'] for row in rows] == ['ベンチプレス']
+    assert rows == sql_aggregate(app_module)
+
+
+def test_weight_metrics_and_date_filter(client):
+    client.post('/api/workout', json=workout('2026-01-05', 'ベンチプレス'))
+    body = workout('2026-02-02', 'ベンチプレス')
+    body['exercises'][0]['weight'] = '100kg'
+    client.post('/api/workout', json=body)
+
+    response = client.get('/api/analytics/aggregate?group_by=month&metrics=tonnage,max_weight').get_json()
+    assert response['rows'] == [
+        {'month': '2026-01', 'tonnage': 1800.0, 'max_weight': 60.0},
+        {'month': '2026-02', 'tonnage': 3000.0, 'max_weight': 100.0},
+    ]
+    rows = client.get('/api/analytics/aggregate?group_by=week&metrics=count&start_date=2026-02-01').get_json()['rows']
+    assert rows == [{'week': '2026-02-02', 'count': 1}]
+    assert client.get('/api/analytics/aggregate?group_by=weekday').status_code == 400
@@ -0,0 +1,96 @@
+"""差分同期 GET /api/sync（墓標・ページング・先頭より後の since）"""
+from conftest import create_tenant, workout
+
+
+def sync(client, since=0, headers=None, **params):
+    query = '&'.join(f'{key}={value}' for key, value in {'since': since, **params}.items())
+    response = client.get(f'/api/sync?{query}', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def sync_all(client, since=0, limit=2):
+    """has_more の間 next で続けて取得し、(ページ, 最後の next) を返す"""
+    pages = []
+    while True:
+        page = sync(client, since, limit=limit)
+        pages.append(page)
+        assert page['next'] >= since
+        since = page['next']
+        if not page['has_more']:
+            return pages, since
+
+
+def test_full_then_empty_delta(client):
+    session_id = client.post('/api/workout', json=workout('2026-01-05', 'ベンチプレス', 'スクワット')).get_json()['session_id']
+
+    full = sync(client)
+    assert [session['id'] for session in full['sessions']] == [session_id]
+    assert [exercise['name'] for exercise in full['exercises']] == ['ベンチプレス', 'スクワット']
+    assert full['has_more'] is False
+
+    empty = sync(client, full['next'])
+    assert (empty['sessions'], empty['exercises'], empty['next'], empty['has_more']) == ([], [], full['next'], False)
+    assert client.get('/api/sync?since=-1').status_code == 400
+    assert client.get('/api/sync?limit=x').status_code == 400
+
+
+def test_cascaded_session_delete_sends_tombstones(client):
+    session_id = client.post('/api/workout', json=workout('2026-01-05', 'ベンチプレス', 'スクワット')).get_json()['session_id']
+    cursor = sync(client)['next']
+    exercise_ids = [exercise['id'] for exercise in client.get(f'/api/workout/{session_id}').get_json()['exercises']]
+
+    client.delete(f'/api/workout/{session_id}')
+    changes = sync(client, cursor)
+    assert changes['sessions'] == [] and changes['exercises'] == []
+    assert changes['deleted'] == {'sessions': [session_id], 'exercises': sorted(exercise_ids)}
+
+    # 復元すると再び更新として届く
+    client.post('/api/trash/restore', json={'session_ids': [session_id]})
+    restored = sync(client, changes['next'])
+    assert [session['id'] for session in restored['sessions']] == [session_id]
+    assert sorted(exercise['id'] for exercise in restored['exercises']) == sorted(exercise_ids)
+    assert restored['deleted'] == {'sessions': [], 'exercises': []}
+
+
+def test_changes_made_then_deleted_before_sync_are_only_tombstones(client):
+    session_id = client.post('/api/workout', json=workout('2026-01-05')).get_json()['session_id']
+    client.delete(f'/api/workout/{session_id}')
+
+    changes = sync(client)
+    assert changes['sessions'] == [] and changes['exercises'] == []
+    assert changes['deleted']['sessions'] == [session_id]
+
+
+def test_paging_with_has_more_and_next(client):
+    for day in range(1, 4):
+        client.post('/api/workout', json=workout(f'2026-01-0{day}', 'ベンチプレス', 'スクワット'))
+    full = sync(client)
+
+    pages, cursor = sync_all(client, limit=2)
+    assert len(pages) > 2
+    assert all(page['has_more'] for page in pages[:-1]) and not pages[-1]['has_more']
+    assert [page['since'] for page in pages[1:]] == [page['next'] for page in pages[:-1]]
+    assert cursor == full['next']
+    # ページをまたいでも漏れ・重複なく全件届く
+    assert sorted(session['id'] for page in pages for session in page['sessions']) == sorted(session['id'] for session in full['sessions'])
+    assert sorted(exercise['id'] for page in pages for exercise in page['exercises']) == sorted(exercise['id'] for exercise in full['exercises'])
+
+    assert sync(client, cursor, limit=1)['has_more'] is False
+
+
+def test_since_beyond_tenant_head_still_receives_later_changes(app_module, client):
+    tenant_b = create_tenant(app_module, 'tenant-b')
+    client.post('/api/workout', json=workout('2026-01-05'))
+    cursor = sync(client)['next']
+    # 連番は全テナント共通なので、他テナントの書き込みでこのテナントの先頭より後の since になる
+    for day in range(1, 4):
+        client.post('/api/workout', headers=tenant_b, json=workout(f'2026-02-0{day}'))
+    beyond = sync(client, headers=tenant_b)['next'] + 10
+
+    empty = sync(client, beyond)
+    assert (empty['sessions'], empty['exercises'], empty['next'], empty['has_more']) == ([], [], beyond, False)
+    assert sync(client, cursor)['sessions'] == []
+
+    session_id = client.post('/api/workout', json=workout('2026-01-06')).get_json()['session_id']
+    assert [session['id'] for session in sync(client, cursor)['sessions']] == [session_id]
@@ -0,0 +1,145 @@
+"""テナントAのデータがテナントBのAPIキーからは見えない・変更できないこと"""
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+from conftest import create_tenant, workout
+
+
+@pytest.fixture
+def tenants(app_module):
+    """テナントAにセッション・エクササイズ・施設・重複・ゴミ箱のデータを作り、(client, A, B, ids) を返す"""
+    client = app_module.app.test_client()
+    tenant_a = create_tenant(app_module, 'tenant-a')
+    tenant_b = create_tenant(app_module, 'tenant-b')
+
+    response = client.post('/api/workout', headers=tenant_a, json=workout('2026-01-05', 'ベンチプレス', 'スクワット', facility='ジムA'))
+    session_id = response.get_json()['session_id']
+    # 別リクエストの同じ内容は重複として検出される
+    client.post('/api/workout', headers=tenant_a, json=workout('2026-01-05', 'ベンチプレス', facility='ジムA'))
+    exercise_ids = [exercise['id'] for exercise in client.get(f'/api/workout/{session_id}', headers=tenant_a).get_json()['exercises']]
+    trashed_id = exercise_ids.pop()
+    assert client.delete(f'/api/workout/exercise/{trashed_id}', headers=tenant_a).status_code == 200
+    facility_id = client.get('/api/facilities', headers=tenant_a).get_json()['facilities'][0]['id']
+
+    ids = {'session': session_id, 'exercises': exercise_ids, 'trashed': trashed_id, 'facility': facility_id}
+    return client, tenant_a, tenant_b, ids
+
+
+def test_session_and_exercises_are_not_found_for_other_tenant(tenants):
+    client, tenant_a, tenant_b, ids = tenants
+    exercise_id = ids['exercises'][0]
+
+    assert client.get(f"/api/workout/{ids['session']}", headers=tenant_b).status_code == 404
+    assert client.put(f'/api/workout/exercise/{exercise_id}', headers=tenant_b, json={'reps': 1}).status_code == 404
+    assert client.delete(f'/api/workout/exercise/{exercise_id}', headers=tenant_b).status_code == 404
+    assert client.get(f'/api/workout/exercise/{exercise_id}/history', headers=tenant_b).status_code == 404
+    response = client.patch('/api/workout/exercises', headers=tenant_b, json={'ids': ids['exercises'], 'changes': {'notes': 'B'}})
+    assert response.status_code == 404
+    assert client.delete('/api/workout/exercises', headers=tenant_b, json={'ids': ids['exercises']}).status_code == 404
+    assert client.delete(f"/api/workout/{ids['session']}", headers=tenant_b).status_code == 404
+
+    # Aのデータは変更されていない
+    session = client.get(f"/api/workout/{ids['session']}", headers=tenant_a).get_json()
+    assert [exercise['id'] for exercise in session['exercises']] == ids['exercises']
+    assert all(exercise['version'] == 1 and exercise['notes'] is None for exercise in session['exercises'])
+
+
+def test_summaries_and_pages_are_empty_for_other_tenant(tenants):
+    client, tenant_a, tenant_b, ids = tenants
+
+    assert client.get('/api/analytics/training-load', headers=tenant_b).get_json()['weeks'] == []
+    assert sum(client.get('/api/calendar?year=2026', headers=tenant_b).get_json()['intensity']) == 0
+    assert sum(client.get('/api/calendar?year=2026', headers=tenant_a).get_json()['intensity']) > 0
+    for path in ('/workouts', '/workouts/weekly', '/workouts/monthly', '/workouts/facilities'):
+        assert 'ベンチプレス' not in client.get(path, headers=tenant_b).get_data(as_text=True), path
+    assert 'ベンチプレス' in client.get('/workouts', headers=tenant_a).get_data(as_text=True)
+
+
+def test_export_contains_only_own_rows(tenants):
+    client, tenant_a, tenant_b, _ = tenants
+
+    def exported_names(headers):
+        response = client.get('/api/export/excel', headers=headers)
+        if response.status_code == 404:
+            return []
+        assert response.status_code == 200
+        sheet = load_workbook(io.BytesIO(response.data)).active
+        return [row[3] for row in sheet.iter_rows(min_row=2, values_only=True) if row[3]]
+
+    assert exported_names(tenant_b) == []
+    assert sorted(exported_names(tenant_a)) == ['スクワット', 'ベンチプレス']
+
+
+def test_sync_reports_only_own_changes(tenants):
+    client, tenant_a, tenant_b, ids = tenants
+
+    changes = client.get('/api/sync', headers=tenant_b).get_json()
+    assert changes['exercises'] == []
+    assert changes['sessions'] == []
+    assert changes['deleted'] == {'exercises': [], 'sessions': []}
+    own = client.get('/api/sync', headers=tenant_a).get_json()
+    assert sorted(exercise['id'] for exercise in own['exercises']) == sorted(ids['exercises'])
+    assert own['deleted']['exercises'] == [ids['trashed']]
+
+
+def test_trash_is_per_tenant(tenants):
+    client, tenant_a, tenant_b, ids = tenants
+
+    trash = client.get('/api/trash', headers=tenant_b).get_json()
+    assert trash['sessions'] == [] and trash['exercises'] == []
+    response = client.post('/api/trash/restore', headers=tenant_b, json={'exercise_ids': [ids['trashed']]})
+    assert response.status_code == 404
+    assert [exercise['id'] for exercise in client.get('/api/trash', headers=tenant_a).get_json()['exercises']] == [ids['trashed']]
+
+
+def test_facilities_are_per_tenant(tenants):
+    client, tenant_a, tenant_b, ids = tenants
+
+    assert client.get('/api/facilities', headers=tenant_b).get_json()['facilities'] == []
+    assert client.get(f"/api/facilities/{ids['facility']}/summary", headers=tenant_b).status_code == 404
+    response = client.post(f"/api/facilities/{ids['facility']}/aliases", headers=tenant_b, json={'alias': 'B'})
+    assert response.status_code == 404
+    assert client.get(f"/api/facilities/{ids['facility']}/summary", headers=tenant_a).status_code == 200
+
+
+def test_duplicates_are_per_tenant(tenants):
+    client, tenant_a, tenant_b, ids = tenants
+
+    assert client.get('/api/workout/duplicates', headers=tenant_b).get_json()['duplicate_count'] == 0
+    merged = client.post('/api/workout/duplicates/merge', headers=tenant_b, json={}).get_json()
+    assert merged['merged'] == 0
+    session = client.get(f"/api/workout/{ids['session']}", headers=tenant_a).get_json()
+    assert len(session['exercises']) == len(ids['exercises'])
+
+
+def test_query_api_key_is_exchanged_for_cookie(app_module, client):
+    tenant_a = create_tenant(app_module, 'tenant-a')
+    client.post('/api/workout', headers=tenant_a, json=workout('2026-01-05', 'ベンチプレス'))
+    api_key = tenant_a['X-API-Key']
+
+    response = client.get(f'/workouts?facility=x&api_key={api_key}')
+    assert response.status_code == 303
+    assert response.headers['Location'] == '/workouts?facility=x'
+    cookie = response.headers['Set-Cookie']
+    assert f'api_key={api_key}' in cookie and 'HttpOnly' in cookie
+    assert 'Expires' not in cookie and 'Max-Age' not in cookie
+    # 以降はCookieでテナントが決まる
+    assert 'ベンチプレス' in client.get('/workouts').get_data(as_text=True)
+
+    assert client.get('/workouts?api_key=unknown').status_code == 401
+    # クエリのキーはGETのリダイレクトにのみ使い、APIの認証には使わない
+    assert app_module.app.test_client().post(f'/api/workout?api_key={api_key}', json=workout('2026-01-06')).status_code == 400
+
+
+def test_deleted_tenant_expires_from_cache(app_module, client, monkeypatch):
+    tenant_a = create_tenant(app_module, 'tenant-a')
+    assert client.get('/api/trash', headers=tenant_a).status_code == 200
+    with app_module.app.app_context():
+        app_module.db.session.execute(app_module.db.delete(app_module.Tenant).where(app_module.Tenant.id == 'tenant-a'))
+        app_module.db.session.commit()
+
+    now = app_module.time.monotonic()
+    monkeypatch.setattr(app_module.time, 'monotonic', lambda: now + app_module.TENANT_CACHE_SECONDS + 1)
+    assert client.get('/api/trash', headers=tenant_a).status_code == 401
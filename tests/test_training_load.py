@@ -0,0 +1,61 @@
+"""部位別トレーニング負荷（/api/analytics/training-load）の変更週だけの再集計"""
+import pytest
+
+from conftest import workout
+
+pytest.importorskip('numpy')
+
+
+def training_load(client):
+    response = client.get('/api/analytics/training-load')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def tonnage_by_week(body):
+    return {week['week_start']: week['total_tonnage_kg'] for week in body['weeks']}
+
+
+def test_only_changed_weeks_are_recomputed(app_module, client):
+    for date in ('2026-01-05', '2026-01-12', '2026-01-19'):
+        client.post('/api/workout', json=workout(date, 'ベンチプレス'))
+    body = training_load(client)
+    assert body['recomputed_weeks'] == 3
+    assert tonnage_by_week(body) == {'2026-01-19': 1800.0, '2026-01-12': 1800.0, '2026-01-05': 1800.0}
+    assert training_load(client)['recomputed_weeks'] == 0
+
+    # 同じ週への追加・更新はその週だけ
+    client.post('/api/workout', json=workout('2026-01-14', 'スクワット'))
+    exercise_id = client.get('/api/workout/1').get_json()['exercises'][0]['id']
+    client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 5})
+    body = training_load(client)
+    assert body['recomputed_weeks'] == 2
+    assert tonnage_by_week(body) == {'2026-01-19': 1800.0, '2026-01-12': 3600.0, '2026-01-05': 900.0}
+
+    # セッションの削除で週が空になる
+    client.delete('/api/workout/3')
+    body = training_load(client)
+    assert body['recomputed_weeks'] == 1
+    assert tonnage_by_week(body) == {'2026-01-12': 3600.0, '2026-01-05': 900.0}
+
+    # 全件からの再集計と一致する
+    app_module._training_cache.clear()
+    full = training_load(client)
+    assert full['recomputed_weeks'] == 2
+    assert full['weeks'] == body['weeks']
+
+
+def test_acwr_and_rest_pause_share(client):
+    for day in (5, 12, 19, 26):
+        body = workout(f'2026-01-{day:02d}', 'ベンチプレス')
+        body['exercises'][0]['rest_pause_reps'] = 6 if day == 26 else 0
+        client.post('/api/workout', json=body)
+
+    weeks = training_load(client)['weeks']
+    latest = weeks[0]['muscles']['胸']
+    assert latest['hard_sets'] == 3
+    assert latest['rest_pause_reps'] == 6
+    assert latest['rest_pause_share'] == round(6 / 36, 3)
+    # 4週そろった週から ACWR を出す（直近週 2160kg / 4週平均 1890kg）
+    assert latest['acwr'] == round(2160 / 1890, 2)
+    assert weeks[1]['muscles']['胸']['acwr'] is None
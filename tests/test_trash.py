@@ -0,0 +1,115 @@
+"""ゴミ箱（論理削除・一覧・復元・保持期間後の完全削除）と監査履歴"""
+import datetime
+
+from conftest import workout
+
+
+def create_session(client, date='2026-01-05', *names):
+    """セッションを作成し、(セッションID, エクササイズIDのリスト) を返す"""
+    session_id = client.post('/api/workout', json=workout(date, *(names or ('ベンチプレス', 'スクワット')))).get_json()['session_id']
+    return session_id, [exercise['id'] for exercise in client.get(f'/api/workout/{session_id}').get_json()['exercises']]
+
+
+def backdate(module, model, ids, days):
+    """論理削除した行の deleted_at を days 日前にする（ORMの論理削除条件を通さないようCoreで更新）"""
+    table = model.__table__
+    with module.app.app_context():
+        module.db.session.execute(
+            table.update().where(table.c.id.in_(ids)).values(
+                deleted_at=datetime.datetime.utcnow() - datetime.timedelta(days=days)
+            )
+        )
+        module.db.session.commit()
+
+
+def test_deleted_exercise_moves_to_trash_and_restores(client):
+    session_id, (bench, squat) = create_session(client)
+
+    assert client.delete(f'/api/workout/exercise/{bench}').status_code == 200
+    exercises = client.get(f'/api/workout/{session_id}').get_json()['exercises']
+    assert [exercise['id'] for exercise in exercises] == [squat]
+    assert 'ベンチプレス' not in client.get('/workouts').get_data(as_text=True)
+    trash = client.get('/api/trash').get_json()
+    assert trash['sessions'] == []
+    assert [(exercise['id'], exercise['name']) for exercise in trash['exercises']] == [(bench, 'ベンチプレス')]
+    assert trash['exercises'][0]['purge_at'] > trash['exercises'][0]['deleted_at']
+
+    response = client.post('/api/trash/restore', json={'exercise_ids': [bench]})
+    assert response.status_code == 200
+    assert response.get_json()['exercise_ids'] == [bench]
+    restored = {exercise['id']: exercise for exercise in client.get(f'/api/workout/{session_id}').get_json()['exercises']}
+    # 作成1 → 削除2 → 復元3
+    assert restored[bench]['version'] == 3
+    assert client.get('/api/trash').get_json()['exercises'] == []
+    assert client.post('/api/trash/restore', json={'exercise_ids': [bench]}).status_code == 404
+
+
+def test_deleted_session_takes_its_exercises_and_restores_them(client):
+    session_id, exercise_ids = create_session(client)
+    version = client.get(f'/api/workout/{session_id}').get_json()['version']
+
+    assert client.delete(f'/api/workout/{session_id}').status_code == 200
+    assert client.get(f'/api/workout/{session_id}').status_code == 404
+    trash = client.get('/api/trash').get_json()
+    assert [(session['id'], session['exercises_count']) for session in trash['sessions']] == [(session_id, 2)]
+    # セッションと一緒に削除したエクササイズはセッション側にまとめる
+    assert trash['exercises'] == []
+
+    response = client.post('/api/trash/restore', json={'session_ids': [session_id]})
+    assert response.get_json()['exercise_ids'] == sorted(exercise_ids)
+    session = client.get(f'/api/workout/{session_id}').get_json()
+    assert session['version'] > version
+    assert sorted(exercise['id'] for exercise in session['exercises']) == sorted(exercise_ids)
+
+
+def test_restore_conflicts_with_live_session_on_same_date(client):
+    session_id, _ = create_session(client)
+    client.delete(f'/api/workout/{session_id}')
+    other_id, _ = create_session(client)
+
+    response = client.post('/api/trash/restore', json={'session_ids': [session_id]})
+    assert response.status_code == 409
+    assert response.get_json()['conflicts'][0]['conflicting_session_id'] == other_id
+    assert client.get(f'/api/workout/{session_id}').status_code == 404
+
+
+def test_purge_removes_only_rows_past_retention(app_module, client):
+    old_session, _ = create_session(client, '2026-01-05')
+    new_session, _ = create_session(client, '2026-01-06')
+    kept_session, (old_exercise, kept_exercise) = create_session(client, '2026-01-07')
+    for session_id in (old_session, new_session):
+        client.delete(f'/api/workout/{session_id}')
+    client.delete('/api/workout/exercises', json={'ids': [old_exercise]})
+    retention = app_module.TRASH_RETENTION_DAYS
+    with app_module.app.app_context():
+        old_ids = [row.id for row in app_module.db.session.execute(
+            app_module.WorkoutLog.__table__.select().where(app_module.WorkoutLog.__table__.c.session_id == old_session)
+        )]
+    backdate(app_module, app_module.WorkoutSession, [old_session], retention + 1)
+    backdate(app_module, app_module.WorkoutLog, old_ids + [old_exercise], retention + 1)
+
+    with app_module.app.app_context():
+        assert app_module.purge_trash() == (1, 3)
+        logs = app_module.WorkoutLog.__table__
+        remaining = {row.id for row in app_module.db.session.execute(logs.select())}
+    assert old_exercise not in remaining and not set(old_ids) & remaining
+    assert kept_exercise in remaining
+    trash = client.get('/api/trash').get_json()
+    assert [session['id'] for session in trash['sessions']] == [new_session]
+    assert trash['exercises'] == []
+    assert client.get(f'/api/workout/{kept_session}').status_code == 200
+
+
+def test_update_exercise_records_audit_history(client):
+    _, (exercise_id, _) = create_session(client)
+
+    assert client.put(f'/api/workout/exercise/{exercise_id}', json={'reps': 8, 'notes': '重め'}).status_code == 200
+    client.delete(f'/api/workout/exercise/{exercise_id}')
+    client.post('/api/trash/restore', json={'exercise_ids': [exercise_id]})
+
+    history = client.get(f'/api/workout/exercise/{exercise_id}/history').get_json()['history']
+    assert [entry['action'] for entry in history] == ['update', 'delete', 'restore']
+    assert history[0]['before'] == {'reps': 10, 'notes': None}
+    assert history[0]['after'] == {'reps': 8, 'notes': '重め'}
+    assert history[1]['before'] == {'deleted_at': None}
+    assert client.get('/api/workout/exercise/999999/history').status_code == 404
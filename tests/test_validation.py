@@ -0,0 +1,67 @@
+"""OpenAPIスキーマによるリクエスト検証（SCHEMA_VALIDATION）"""
+import json
+
+from conftest import workout
+
+
+def test_wrong_type_returns_400_with_details(client):
+    body = workout('2026-01-05')
+    body['exercises'][0]['reps'] = '10回'
+    response = client.post('/api/workout', json=dict(body, date=20260105))
+    assert response.status_code == 400
+    details = response.get_json()['details']
+    assert 'body.date: expected string' in details
+    assert 'body.exercises[0].reps: expected integer' in details
+
+    assert client.post('/api/workout', json=dict(body, date='2026-13-01')).status_code == 400
+    response = client.post('/api/receive', json={'action_type': 'unknown'})
+    assert response.status_code == 400
+    details = response.get_json()['details']
+    assert 'body.message: required' in details
+    assert any(detail.startswith('body.action_type: must be one of') for detail in details)
+    # クエリパラメータも検証する
+    assert client.get('/api/sync?since=abc').get_json()['details'] == ['query.since: expected number']
+
+
+def test_null_in_optional_property_is_accepted(client):
+    body = workout('2026-01-05')
+    body['facility'] = None
+    body['exercises'][0].update(weight=None, notes=None, target_muscle=None)
+    assert client.post('/api/workout', json=body).status_code == 200
+    # 必須プロパティの null は不可
+    assert client.post('/api/workout', json=dict(body, date=None)).status_code == 400
+
+
+def test_ndjson_body_skips_validation(client):
+    # JSONとしては message が必須だが、NDJSONの各レコードはハンドラで処理する
+    lines = '\n'.join(json.dumps({'value': i}) for i in range(3))
+    response = client.post('/api/receive', data=lines, content_type='application/x-ndjson')
+    assert response.status_code == 200
+
+
+def test_warn_mode_does_not_reject(make_app):
+    module = make_app(SCHEMA_VALIDATION='warn')
+    response = module.app.test_client().post('/api/receive', json={'message': 'ok', 'action_type': 'unknown'})
+    assert response.status_code == 200
+
+
+def test_operation_in_two_schema_files_passes_if_either_accepts(app_module, client, tmp_path, monkeypatch):
+    def write_schema(name, body_schema):
+        spec = {'paths': {'/api/workout/parse': {'post': {
+            'operationId': 'parseWorkout',
+            'requestBody': {'required': True, 'content': {'application/json': {'schema': body_schema}}},
+        }}}}
+        (tmp_path / f'{name}-schema.json').write_text(json.dumps(spec), encoding='utf-8')
+
+    write_schema('a', {'type': 'object', 'properties': {'text': {'type': 'string'}}, 'required': ['text']})
+    write_schema('b', {'type': 'object', 'properties': {'texts': {'type': 'array', 'items': {'type': 'string'}}}, 'required': ['texts']})
+    validators = app_module.load_request_validators(tmp_path)
+    assert [operation_id for operation_id, _ in validators[('parse_workout', 'POST')]] == ['parseWorkout', 'parseWorkout']
+    monkeypatch.setattr(app_module, 'REQUEST_VALIDATORS', validators)
+
+    assert client.post('/api/workout/parse', json={'text': 'ベンチ 80kg×8'}).status_code == 200
+    assert client.post('/api/workout/parse', json={'texts': ['ベンチ 80kg×8']}).status_code == 200
+    # どちらにも適合しなければ最初のスキーマのエラーを返す
+    response = client.post('/api/workout/parse', json={'texts': [1]})
+    assert response.status_code == 400
+    assert response.get_json()['details'] == ['body.text: required']
@@ -0,0 +1,117 @@
+"""ログ・受信データ・会話ビューアの絞り込みとページング、データファイルの索引"""
+import json
+
+import pytest
+
+TIMESTAMPS = [
+    '2025-06-08T23:59:59',
+    '2025-06-09T00:00:00',
+    '2025-06-09T12:00:30.500000',
+    '2025-06-09T23:59:59.999999',
+    '2025-06-10T00:00:00',
+]
+
+
+@pytest.fixture
+def received(app_module, client):
+    """時刻を指定した受信データを5件保存したクライアント"""
+    with app_module.app.test_request_context('/'):
+        for index, timestamp in enumerate(TIMESTAMPS):
+            app_module.append_data_file(app_module.RECEIVED_DATA_FILE, {
+                'timestamp': timestamp, 'data': {'message': f'Message {index}', 'index': index}
+            })
+    return client
+
+
+def received_indexes(client, query=''):
+    body = client.get(f'/api/received-data?{query}').get_json()
+    return [item['data']['index'] for item in body['items']]
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('', [4, 3, 2, 1, 0]),
+    ('since=2025-06-09', [4, 3, 2, 1]),
+    ('until=2025-06-09', [3, 2, 1, 0]),
+    ('since=2025-06-09&until=2025-06-09', [3, 2, 1]),
+    # until は指定した時刻の分を含む
+    ('until=2025-06-09T12:00', [2, 1, 0]),
+    ('until=2025-06-09 12:00', [2, 1, 0]),
+    ('until=2025-06-09T11:59', [1, 0]),
+    ('since=2025-06-09T12:00:30.5', [4, 3, 2]),
+    ('until=2025-06-09T00', [1, 0]),
+    # 不正な値は指定なし
+    ('until=yesterday', [4, 3, 2, 1, 0]),
+    ('q=MESSAGE 2', [2]),
+    ('q=message&since=2025-06-10', [4]),
+    ('q=nothing', []),
+])
+def test_received_data_filters(received, query, expected):
+    assert received_indexes(received, query) == expected
+
+
+def test_paging(received):
+    body = received.get('/api/received-data?per_page=2&page=2').get_json()
+    assert [item['data']['index'] for item in body['items']] == [2, 1]
+    assert (body['total'], body['page'], body['per_page'], body['pages']) == (5, 2, 2, 3)
+    assert received_indexes(received, 'per_page=2&page=9') == []
+    assert received.get('/api/received-data?per_page=1000').get_json()['per_page'] == 100
+    html = received.get('/data?per_page=2').get_data(as_text=True)
+    assert 'Message 4' in html and 'Message 2' not in html and '1 / 3' in html
+
+
+def test_index_reads_only_appended_lines(app_module, received):
+    path = app_module.DATA_DIR / 'received_data.jsonl'
+    received_indexes(received)
+    state = app_module.data_file_index.cache[path]
+    size, first_rows = state['size'], list(state['rows'])
+
+    received.post('/api/receive', json={'message': 'appended'})
+    newest = received.get('/api/received-data?per_page=1').get_json()
+    assert (newest['total'], newest['items'][0]['data']['message']) == (6, 'appended')
+    state = app_module.data_file_index.cache[path]
+    assert state['size'] > size
+    # 既存の行は読み直さず、追記された1行だけを索引に足す
+    assert state['rows'][:len(first_rows)] == first_rows
+    assert all(new is old for new, old in zip(state['rows'], first_rows))
+    assert len(state['rows']) == len(first_rows) + 1
+
+
+def test_file_is_trimmed_to_recent_entries(app_module, client):
+    max_entries = app_module.DATA_FILE_MAX_ENTRIES
+    with app_module.app.test_request_context('/'):
+        for index in range(2 * max_entries + 1):
+            app_module.append_data_file(app_module.RECEIVED_DATA_FILE, {'timestamp': f'2025-06-09T00:00:{index:03d}', 'data': {'index': index}})
+    lines = (app_module.DATA_DIR / 'received_data.jsonl').read_text(encoding='utf-8').splitlines()
+    assert len(lines) == max_entries
+    body = client.get('/api/received-data?per_page=1').get_json()
+    assert body['total'] == max_entries
+    assert body['items'][0]['data']['index'] == 2 * max_entries
+
+
+def test_legacy_json_file_is_converted(app_module, client):
+    legacy = app_module.DATA_DIR / 'received_data.json'
+    legacy.write_text(json.dumps([{'timestamp': '2025-06-09T00:00:00', 'data': {'index': 0}}]), encoding='utf-8')
+
+    assert received_indexes(client) == [0]
+    client.post('/api/receive', json={'message': 'new'})
+    assert client.get('/api/received-data').get_json()['total'] == 2
+
+
+def test_conversations_viewer(client):
+    for index in range(3):
+        body = {'user_input': f'質問{index}', 'conversation_summary': f'要約{index}'}
+        assert client.post('/api/conversation', json=body).status_code == 200
+    body = client.get('/api/conversations?q=要約1').get_json()
+    assert [item['data']['user_input'] for item in body['items']] == ['質問1']
+    assert '質問2' in client.get('/conversations').get_data(as_text=True)
+
+
+def test_log_viewer_filters(client):
+    client.post('/api/workout', json={'date': '2026-01-05'})
+    client.post('/api/receive', json={'message': 'hello'})
+
+    errors = client.get('/api/logs?status=error').get_json()['items']
+    assert errors and all(item['status'] == 'error' for item in errors)
+    received = client.get('/api/logs?event_type=receive_data').get_json()['items']
+    assert [item['event_type'] for item in received] == ['receive_data']
+    assert client.get('/api/logs?until=2000-01-01').get_json()['total'] == 0